@@ -0,0 +1,849 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import random
+import multiprocessing
+import shutil
+import tempfile
+import contextlib
+
+from studiovendor.Qt import QtCore
+
+import studiolibrary
+import studiolibrary.database
+import studiolibrary.itemrecord
+import studiolibrary.searchindex
+import studiolibrary.folderitem
+
+
+class BenchmarkItem(studiolibrary.LibraryItem):
+
+    TYPE = "Benchmark"
+    EXTENSION = ".item"
+
+
+class BenchmarkLibrary(studiolibrary.Library):
+
+    # Simulate the round trip to a network share for each listing
+    LATENCY = 0.0
+
+    # Filter the results of the last search when the queries narrow it
+    REFINE = True
+
+    def listDirectory(self, path, snapshot):
+        """
+        Overriding this method to add the simulated latency.
+
+        :type path: str
+        :type snapshot: studiolibrary.snapshot.Snapshot
+        :rtype: (os.stat_result or None, list[list] or None, bool)
+        """
+        if self.LATENCY:
+            time.sleep(self.LATENCY)
+
+        return super(BenchmarkLibrary, self).listDirectory(path, snapshot)
+
+    def registeredItems(self):
+        """
+        Overriding this method to only use the benchmark items.
+
+        :rtype: list[studiolibrary.LibraryItem.__class__]
+        """
+        return [BenchmarkItem, studiolibrary.folderitem.FolderItem]
+
+    def refineRecords(self, queries):
+        """
+        Overriding this method to benchmark searching without refining.
+
+        :type queries: list[dict]
+        :rtype: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        if not self.REFINE:
+            return None
+
+        return super(BenchmarkLibrary, self).refineRecords(queries)
+
+
+def timeit(func, repeat=3):
+    """
+    Return the fastest time in seconds for calling the given function.
+
+    :type func: func
+    :type repeat: int
+    :rtype: float
+    """
+    times = []
+
+    for i in range(repeat):
+        t = time.time()
+        func()
+        times.append(time.time() - t)
+
+    return min(times)
+
+
+@contextlib.contextmanager
+def configValue(key, value):
+    """
+    Temporarily set the given config value.
+
+    :type key: str
+    :type value: object
+    """
+    old = studiolibrary.config.get(key)
+    studiolibrary.config.set(key, value)
+    try:
+        yield
+    finally:
+        studiolibrary.config.set(key, old)
+
+
+def createSyntheticLibrary(path, folders=10, items=20, depth=3):
+    """
+    Create a tree of folders and items for benchmarking.
+
+    Each folder contains the given number of sub folders and items.
+
+    :type path: str
+    :type folders: int
+    :type items: int
+    :type depth: int
+    :rtype: int
+    """
+    count = 0
+
+    if depth <= 0:
+        return count
+
+    for i in range(folders):
+        folder = os.path.join(path, "folder{0}".format(i))
+        os.makedirs(folder)
+        count += 1
+
+        for j in range(items):
+            os.makedirs(os.path.join(folder, "item{0}.item".format(j)))
+            count += 1
+
+        count += createSyntheticLibrary(folder, folders, items, depth - 1)
+
+    return count
+
+
+@contextlib.contextmanager
+def syntheticLibrary(folders=10, items=10, depth=3):
+    """
+    Create a temporary synthetic library and remove it on exit.
+
+    :type folders: int
+    :type items: int
+    :type depth: int
+    :rtype: str
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    path = studiolibrary.normPath(path)
+
+    try:
+        createSyntheticLibrary(path, folders, items, depth)
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+def benchmarkWalker(path=None, workers=8, latency=0.0):
+    """
+    Compare walking a library in the main thread and with worker threads.
+
+    A synthetic library is created if no path is given. Use the latency
+    argument to simulate a network share when walking a local path.
+
+    :type path: str or None
+    :type workers: int
+    :type latency: float
+    :rtype: dict
+    """
+    if not path:
+        with syntheticLibrary() as path:
+            return benchmarkWalker(path, workers=workers, latency=latency)
+
+    library = BenchmarkLibrary(path)
+    library.LATENCY = latency
+    results = {}
+
+    for count in [1, workers]:
+        with configValue("syncWorkerCount", count):
+            elapsed = timeit(lambda: list(library.walker(path)))
+
+        results[count] = elapsed
+        msg = "walker: {0} worker(s) with {1:.3f}s latency took {2:.3f}s"
+        print(msg.format(count, latency, elapsed))
+
+    return results
+
+
+def benchmarkSyncProcesses(path=None, processes=None):
+    """
+    Compare creating the item data in the main process and a process pool.
+
+    A synthetic library is created if no path is given.
+
+    :type path: str or None
+    :type processes: int or None
+    :rtype: dict
+    """
+    if not path:
+        with syntheticLibrary() as path:
+            return benchmarkSyncProcesses(path, processes=processes)
+
+    processes = processes or multiprocessing.cpu_count()
+
+    library = BenchmarkLibrary(path)
+    results = {}
+    data = {}
+
+    for count in [0, processes]:
+        elapsed = timeit(lambda: data.update({count: list(library.walker(path, processes=count))}))
+
+        results[count] = elapsed
+        msg = "walker: {0} process(es) took {1:.3f}s for {2} items"
+        print(msg.format(count or 1, elapsed, len(data[count])))
+
+    # The walker returns the item data in the order the folders are listed
+    def key(itemData):
+        return itemData["path"]
+
+    assert sorted(data[0], key=key) == sorted(data[processes], key=key)
+
+    return results
+
+
+def benchmarkIgnorePaths(sizes=(1000, 10000, 100000)):
+    """
+    Check that matching the ignore paths stays flat as the library grows.
+
+    The time per path should be the same for each library size.
+
+    :type sizes: list[int]
+    :rtype: dict
+    """
+    library = BenchmarkLibrary()
+    results = {}
+
+    for size in sizes:
+        paths = []
+        for i in range(size):
+            paths.append("/library/folder{0}/item{1}.item".format(i % 100, i))
+
+        def isValidPaths():
+            for path in paths:
+                library.isValidPath(path)
+
+        elapsed = timeit(isValidPaths)
+        results[size] = elapsed
+
+        msg = "isValidPath: {0} paths took {1:.3f}s ({2:.2f}us per path)"
+        print(msg.format(size, elapsed, elapsed / size * 1000000))
+
+    return results
+
+
+def benchmarkItemClassFromPath(count=100000, classes=20):
+    """
+    Compare calling match on each item class with the extension index.
+
+    :type count: int
+    :type classes: int
+    :rtype: dict
+    """
+    items = []
+    for i in range(classes):
+        name = "BenchmarkItem{0}".format(i)
+        items.append(type(name, (BenchmarkItem,), {"EXTENSION": "." + name}))
+
+    items.append(studiolibrary.folderitem.FolderItem)
+
+    paths = []
+    for i in range(count):
+        paths.append("/library/item{0}.BenchmarkItem{1}".format(i, i % classes))
+
+    def match():
+        for path in paths:
+            for cls in items:
+                if cls.match(path):
+                    break
+
+    index = studiolibrary.ItemClassIndex(items)
+
+    def lookup():
+        for path in paths:
+            index.match(path)
+
+    results = {"match": timeit(match), "index": timeit(lookup)}
+
+    msg = "itemClassFromPath: {0} paths with {1} classes took {2:.3f}s using {3}"
+    for key in ["match", "index"]:
+        print(msg.format(count, len(items), results[key], key))
+
+    return results
+
+
+def benchmarkFormatPath(count=100000):
+    """
+    Benchmark resolving the metadata path for the given number of items.
+
+    :type count: int
+    :rtype: float
+    """
+    formatString = studiolibrary.config.get("metadataPath")
+    paths = ["P:/Library/folder{0}/item{1}.anim".format(i % 100, i) for i in range(count)]
+
+    def run():
+        for path in paths:
+            studiolibrary.formatPath(formatString, path)
+
+    elapsed = timeit(run)
+
+    msg = "formatPath: {0} paths took {1:.3f}s"
+    print(msg.format(count, elapsed))
+
+    return elapsed
+
+
+def syntheticData(root, count=10000, full=False):
+    """
+    Return the item data for a library with the given number of items.
+
+    Use full to add all the fields created by a sync, with metadata for
+    every tenth item.
+
+    :type root: str
+    :type count: int
+    :type full: bool
+    :rtype: dict
+    """
+    data = {}
+
+    for i in range(count):
+        folder = "{0}/folder{1}".format(root, i % 100)
+        path = "{0}/item{1}.item".format(folder, i)
+        data[path] = {
+            "folder": folder,
+            "type": "Benchmark",
+            "modified": 1600000000.0 + i,
+        }
+
+        if not full:
+            continue
+
+        data[path].update({
+            "path": path,
+            "name": "item{0}.item".format(i),
+            "category": "folder{0}".format(i % 100),
+            "__class__": "studiolibrary.benchmark.BenchmarkItem",
+        })
+
+        if i % 10 == 0:
+            metadata = {
+                "description": "Item {0}".format(i),
+                "user": "user{0}".format(i % 20),
+            }
+            data[path].update(metadata)
+
+    return data
+
+
+def benchmarkDatabaseUpdate(
+        backends=("json", "journal", "sqlite", "sharded"), count=10000, updates=50):
+    """
+    Compare the time to update one item in each database backend.
+
+    :type backends: list[str]
+    :type count: int
+    :type updates: int
+    :rtype: dict
+    """
+    results = {}
+
+    for name in backends:
+        path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+        root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+
+        try:
+            database = studiolibrary.database._databaseClasses[name](
+                root + "/.studiolibrary/database.json", root
+            )
+
+            data = syntheticData(root, count)
+            database.save(data)
+            paths = sorted(data.keys())[:updates]
+
+            def update():
+                for path_ in paths:
+                    database.update({path_: {"color": "red"}})
+
+            with configValue("databaseJournalSize", 0):
+                elapsed = timeit(update)
+
+            results[name] = elapsed / updates
+
+            msg = "database.update: {0} with {1} items took {2:.2f}ms per update"
+            print(msg.format(name, count, results[name] * 1000))
+        finally:
+            shutil.rmtree(path)
+
+    return results
+
+
+def benchmarkRenamePath(count=100000, moved=5000):
+    """
+    Compare renaming a folder by replacing text and with the path index.
+
+    :type count: int
+    :type moved: int
+    :rtype: dict
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    results = {}
+
+    try:
+        data = syntheticData(root, count - moved)
+        for i in range(moved):
+            folder = root + "/moved"
+            data["{0}/item{1}.item".format(folder, i)] = {"folder": folder}
+
+        filename = root + "/.studiolibrary/database.json"
+        studiolibrary.saveJson(filename, data)
+
+        t = time.time()
+        studiolibrary.renamePathInFile(filename, root + "/moved", root + "/renamed")
+        results["renamePathInFile"] = time.time() - t
+
+        index = studiolibrary.database.PathIndex(data)
+        index.trie()
+
+        t = time.time()
+        index.rename(root + "/moved", root + "/renamed")
+        results["PathIndex.rename"] = time.time() - t
+
+        for name in ["json", "journal"]:
+            studiolibrary.saveJson(filename, data)
+            database = studiolibrary.database._databaseClasses[name](filename, root)
+            database.index().trie()
+
+            t = time.time()
+            database.rename(root + "/renamed", root + "/moved")
+            results[name + ".rename"] = time.time() - t
+    finally:
+        shutil.rmtree(path)
+
+    msg = "renamePath: {0} of {1} items took {2:.3f}s using {3}"
+    for key in sorted(results):
+        print(msg.format(moved, count, results[key], key))
+
+    return results
+
+
+def benchmarkDatabaseRead(count=100000):
+    """
+    Compare reading the old text format and the structured json format.
+
+    :type count: int
+    :rtype: dict
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    filename = root + "/.studiolibrary/database.json"
+    results = {}
+
+    try:
+        data = syntheticData(root, count)
+
+        studiolibrary.saveJson(filename, data)
+        results["readJson"] = timeit(lambda: studiolibrary.readJson(filename))
+
+        database = studiolibrary.database.JsonDatabase(filename, root)
+        database.save(data)
+        results["JsonDatabase.load"] = timeit(database.load)
+    finally:
+        shutil.rmtree(path)
+
+    msg = "database.read: {0} items took {1:.3f}s using {2}"
+    for key in sorted(results):
+        print(msg.format(count, results[key], key))
+
+    return results
+
+
+def benchmarkDatabaseFormat(formats=("json", "gzip", "lzma"), count=100000):
+    """
+    Compare the file size and load time of each database format.
+
+    :type formats: list[str]
+    :type count: int
+    :rtype: dict
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    filename = root + "/.studiolibrary/database.json"
+    results = {}
+
+    try:
+        data = syntheticData(root, count, full=True)
+
+        for name in formats:
+            with configValue("databaseFormat", name):
+                database = studiolibrary.database.JsonDatabase(filename, root)
+
+                save = timeit(lambda: database.save(data), repeat=1)
+                load = timeit(database.load)
+                size = os.path.getsize(filename)
+
+                results[name] = (size, load, save)
+    finally:
+        shutil.rmtree(path)
+
+    msg = "database.format: {0} items are {1:.1f}MB, load {2:.3f}s and save {3:.3f}s using {4}"
+    for name in formats:
+        size, load, save = results[name]
+        print(msg.format(count, size / 1048576.0, load, save, name))
+
+    return results
+
+
+def benchmarkFindItems(count=100000):
+    """
+    Compare creating every item with searching the lightweight records.
+
+    A QApplication must exist before calling this benchmark.
+
+    :type count: int
+    :rtype: dict
+    """
+    import tracemalloc
+
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    folder = root + "/folder0"
+    results = {}
+
+    try:
+        data = syntheticData(root, count)
+        for itemData in data.values():
+            itemData["__class__"] = "studiolibrary.benchmark.BenchmarkItem"
+
+        queries = [{"filters": [("folder", "is", folder)]}]
+
+        for name in ["createItems", "findItems"]:
+            library = BenchmarkLibrary(root)
+            library.save(data)
+
+            tracemalloc.start()
+            t = time.time()
+
+            if name == "createItems":
+                items = library.createItems()
+            else:
+                items = library.findItems(queries)
+
+            elapsed = time.time() - t
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            results[name] = (elapsed, memory, len(items))
+    finally:
+        shutil.rmtree(path)
+
+    msg = "{0}: {1} records took {2:.3f}s and {3:.1f}MB for {4} items"
+    for key in sorted(results):
+        elapsed, memory, created = results[key]
+        print(msg.format(key, count, elapsed, memory / 1048576.0, created))
+
+    return results
+
+
+def benchmarkMatch(count=100000):
+    """
+    Compare interpreting the search queries for each item with compiling them.
+
+    The queries are the ones used by the library window when searching
+    for two words in a folder with the trash hidden.
+
+    :type count: int
+    :rtype: dict
+    """
+    root = "/library/data"
+    data = list(syntheticData(root, count, full=True).values())
+
+    queries = [
+        {
+            "operator": "or",
+            "filters": [
+                ("folder", "is", root + "/folder1"),
+                ("folder", "startswith", root + "/folder1/"),
+            ],
+        },
+        {"operator": "and", "filters": [("*", "contains", "Item1"), ("*", "contains", "bench")]},
+        {"filters": [("path", "not_contains", "Trash")]},
+        {"filters": []},
+    ]
+
+    def match():
+        return [itemData for itemData in data if studiolibrary.Library.match(itemData, queries)]
+
+    def compiled():
+        match_ = studiolibrary.Library.compileQueries(queries)
+        return [itemData for itemData in data if match_(itemData)]
+
+    assert match() == compiled()
+
+    results = {"match": timeit(match), "compileQueries": timeit(compiled)}
+
+    msg = "match: {0} items took {1:.3f}s using {2}"
+    for key in ["match", "compileQueries"]:
+        print(msg.format(count, results[key], key))
+
+    return results
+
+
+def benchmarkSearch(count=100000, text="item123"):
+    """
+    Benchmark searching for each prefix of the given text as it's typed.
+
+    Each prefix is searched by checking every record, with the search
+    index, and by refining the results of the previous prefix. The items
+    are created before searching so that only the matching is timed.
+    A QApplication must exist before calling this benchmark.
+
+    :type count: int
+    :type text: str
+    :rtype: dict
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    terms = [text[:i] for i in range(1, len(text) + 1)]
+    results = {}
+
+    def createQueries(term):
+        return [
+            {"operator": "and", "filters": [("*", "contains", term)]},
+            {"filters": [("path", "not_contains", "Trash")]},
+        ]
+
+    try:
+        data = syntheticData(root, count, full=True)
+
+        library = BenchmarkLibrary(root)
+        library.save(data)
+        library.createItems()
+        library.searchIndex(wait=True)
+
+        records = library.createRecords()
+        results["index"] = timeit(lambda: studiolibrary.searchindex.SearchIndex(records), repeat=1)
+
+        library.REFINE = False
+
+        for term in terms:
+            queries = createQueries(term)
+
+            def scan():
+                match = studiolibrary.Library.compileQueries(queries)
+                return [r for r in library.createRecords() if match(r.itemData())]
+
+            elapsed = timeit(lambda: library.findItems(queries))
+            found = len(library.findItems(queries))
+
+            assert found == len(scan())
+
+            results[term] = [found, timeit(scan, repeat=1), elapsed]
+
+        library.REFINE = True
+
+        # Each search refines the results of the previous prefix
+        for term in terms:
+            queries = createQueries(term)
+
+            t = time.time()
+            found = len(library.findItems(queries))
+            results[term].append(time.time() - t)
+
+            assert found == results[term][0]
+    finally:
+        shutil.rmtree(path)
+
+    msg = "search: {0} items created the search index in {1:.3f}s"
+    print(msg.format(count, results["index"]))
+
+    msg = (
+        "search: {0!r} found {1} of {2} items in {3:.1f}ms refined, "
+        "{4:.1f}ms with the index, {5:.1f}ms checking every item"
+    )
+    for term in terms:
+        found, scan, elapsed, refined = results[term]
+        print(msg.format(term, found, count, refined * 1000, elapsed * 1000, scan * 1000))
+
+    return results
+
+
+def benchmarkSort(counts=(10000, 100000), sortBy=("category", "modified:dsc", "name")):
+    """
+    Benchmark sorting the records by three fields.
+
+    Sorting by the item data the way it was done before is compared with
+    sorting new records, which creates the keys, and sorting them again
+    with the cached keys.
+
+    :type counts: list[int]
+    :type sortBy: list[str]
+    :rtype: dict
+    """
+    sortBy = list(sortBy)
+    results = {}
+
+    def sortByItemData(records):
+        for field in reversed(sortBy):
+            tokens = field.split(":")
+            reverse = len(tokens) > 1 and tokens[1] != "asc"
+            default = False if reverse else ""
+            key = lambda record: record.itemData().get(tokens[0], default)
+            records = sorted(records, key=key, reverse=reverse)
+        return records
+
+    for count in counts:
+        data = list(syntheticData("/library/data", count, full=True).items())
+
+        # The results of a search are not already in order
+        random.Random(0).shuffle(data)
+
+        def createRecords():
+            return [studiolibrary.itemrecord.ItemRecord(p, d) for p, d in data]
+
+        records = createRecords()
+        first = timeit(lambda: studiolibrary.Library.sorted(createRecords(), sortBy), repeat=1)
+        first -= timeit(createRecords, repeat=1)
+
+        results[count] = (
+            timeit(lambda: sortByItemData(records)),
+            first,
+            timeit(lambda: studiolibrary.Library.sorted(records, sortBy)),
+        )
+
+    msg = (
+        "sort: {0} records by {1} took {2:.1f}ms by the item data, "
+        "{3:.1f}ms creating the keys and {4:.1f}ms with the cached keys"
+    )
+    for count in counts:
+        previous, first, cached = results[count]
+        print(msg.format(count, sortBy, previous * 1000, first * 1000, cached * 1000))
+
+    return results
+
+
+def benchmarkTyping(count=100000, text="item123", interval=0.1):
+    """
+    Benchmark how long the main thread is blocked while typing a search.
+
+    Each character is typed after the given interval in seconds. The
+    search is run on the main thread with search, and in a thread with
+    startSearch. A QApplication must exist before calling this benchmark.
+
+    :type count: int
+    :type text: str
+    :type interval: float
+    :rtype: dict
+    """
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    root = studiolibrary.normPath(os.path.join(path, "library", "data"))
+    results = {}
+
+    def processEvents(seconds):
+        blocked = 0
+        end = time.time() + seconds
+
+        while time.time() < end:
+            t = time.time()
+            QtCore.QCoreApplication.processEvents()
+            blocked = max(blocked, time.time() - t)
+            time.sleep(0.001)
+
+        return blocked
+
+    try:
+        data = syntheticData(root, count, full=True)
+
+        for name in ["search", "startSearch"]:
+            library = BenchmarkLibrary(root)
+            library.save(data)
+            library.createItems()
+            library.searchIndex(wait=True)
+
+            finished = []
+            library.searchFinished.connect(lambda: finished.append(time.time()))
+
+            blocked = 0
+
+            for i in range(1, len(text) + 1):
+                query = {"name": "typing", "filters": [("*", "contains", text[:i])]}
+                library.addQuery(query)
+
+                typed = time.time()
+                getattr(library, name)()
+                blocked = max(blocked, time.time() - typed)
+
+                blocked = max(blocked, processEvents(interval))
+
+            while library.isSearching():
+                blocked = max(blocked, processEvents(0.01))
+
+            results[name] = (blocked, len(finished), finished[-1] - typed)
+    finally:
+        shutil.rmtree(path)
+
+    msg = (
+        "typing: {0} blocked the main thread for up to {1:.1f}ms, "
+        "{2} searches finished, the last {3:.1f}ms after the last key"
+    )
+    for name in ["search", "startSearch"]:
+        blocked, searches, latency = results[name]
+        print(msg.format(name, blocked * 1000, searches, latency * 1000))
+
+    return results
+
+
+def runBenchmarks():
+    """
+    Run all the benchmarks for the library on synthetic data.
+
+    Example:
+        import studiolibrary.benchmark
+        studiolibrary.benchmark.runBenchmarks()
+
+        # Or benchmark the walker on a real library
+        studiolibrary.benchmark.benchmarkWalker("P:/LibraryData")
+    """
+    benchmarkWalker()
+    benchmarkWalker(latency=0.005)
+    benchmarkSyncProcesses()
+    benchmarkIgnorePaths()
+    benchmarkItemClassFromPath()
+    benchmarkFormatPath()
+    benchmarkMatch()
+    benchmarkSort()
+    benchmarkDatabaseRead()
+    benchmarkDatabaseFormat()
+    benchmarkDatabaseUpdate()
+    benchmarkRenamePath()
+
+
+if __name__ == "__main__":
+    runBenchmarks()
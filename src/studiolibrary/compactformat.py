@@ -0,0 +1,382 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+A compact and compressed file format for the item data of a library.
+
+The file is a gzip or lzma stream of json lines:
+
+    {"format": "studiolibrary", "version": 1, "count": 2}
+    ["folder", "a.anim", "b.anim", "type", "modified", ...]
+    [[3, 4, ...], ...]
+    [[0, 1, 15, 0, 5, [1600000000.0]], [0, 2, 15, 0, 5, [1600000001.0]]]
+    ...
+
+The first line is the header, the second line is the string table and the
+third line is the list of keys used by the items. Each following line has
+up to ROWS_PER_LINE items. An item is a row of the directory and the base
+name of its path, a flags value, the index of its keys and then the values.
+All strings are stored once in the string table and referenced by index.
+Other values are wrapped in a list.
+
+The fields that can be derived from the item path are not stored. The
+flags value records which fields were dropped.
+"""
+
+import os
+import gzip
+import json
+import random
+import logging
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from studiovendor import six
+
+import studiolibrary
+
+
+__all__ = [
+    "dump",
+    "load",
+    "isCompact",
+    "compressions",
+]
+
+logger = logging.getLogger(__name__)
+
+
+VERSION = 1
+
+# The fields that can be derived from the item path with a flag for each
+DERIVED_FIELDS = ["path", "folder", "name", "category"]
+
+DERIVED_FLAGS = (1 << len(DERIVED_FIELDS)) - 1
+
+# The number of items written on each line of the file
+ROWS_PER_LINE = 1000
+
+GZIP_MAGIC = b"\x1f\x8b"
+LZMA_MAGIC = b"\xfd7zXZ\x00"
+
+
+def compressions():
+    """
+    Get the compressions supported by this version of Python.
+
+    :rtype: list[str]
+    """
+    if lzma:
+        return ["gzip", "lzma"]
+    return ["gzip"]
+
+
+def isCompact(path):
+    """
+    Check if the given file has been written with the compact format.
+
+    :type path: str
+    :rtype: bool
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(len(LZMA_MAGIC))
+    except (IOError, OSError):
+        return False
+
+    return magic.startswith(GZIP_MAGIC) or magic == LZMA_MAGIC
+
+
+def splitPath(path):
+    """
+    Split the given path into the directory and the base name.
+
+    :type path: str
+    :rtype: (str, str)
+    """
+    if "/" in path:
+        return tuple(path.rsplit("/", 1))
+    return "", path
+
+
+def derivedFields(dirname, basename, categories):
+    """
+    Get the item data fields that can be derived from the split path.
+
+    The category is the base name of the directory and is cached by
+    directory in the given dict.
+
+    :type dirname: str
+    :type basename: str
+    :type categories: dict
+    :rtype: list[str]
+    """
+    category = categories.get(dirname)
+
+    if category is None:
+        category = categories[dirname] = splitPath(dirname)[1]
+
+    path = dirname + "/" + basename if dirname else basename
+    return [path, dirname, basename, category]
+
+
+def encodeItem(path, itemData, categories):
+    """
+    Return the flags and the item data without the derived fields.
+
+    :type path: str
+    :type itemData: dict
+    :type categories: dict
+    :rtype: (int, dict)
+    """
+    flags = 0
+    itemData = dict(itemData)
+
+    for i, value in enumerate(derivedFields(*splitPath(path), categories=categories)):
+        key = DERIVED_FIELDS[i]
+        if key in itemData and itemData[key] == value:
+            del itemData[key]
+            flags |= 1 << i
+
+    return flags, itemData
+
+
+def decodeItem(dirname, basename, flags, itemData, categories):
+    """
+    Add the derived fields to the given item data in place.
+
+    :type dirname: str
+    :type basename: str
+    :type flags: int
+    :type itemData: dict
+    :type categories: dict
+    :rtype: dict
+    """
+    if flags & DERIVED_FLAGS == DERIVED_FLAGS:
+        path, folder, name, category = derivedFields(dirname, basename, categories)
+        itemData["path"] = path
+        itemData["folder"] = folder
+        itemData["name"] = name
+        itemData["category"] = category
+
+    elif flags & DERIVED_FLAGS:
+        for i, value in enumerate(derivedFields(dirname, basename, categories)):
+            if flags & (1 << i):
+                itemData[DERIVED_FIELDS[i]] = value
+
+    return itemData
+
+
+def openFile(path, mode, compression=None):
+    """
+    Open the given file with the given compression.
+
+    The compression is detected from the file when reading.
+
+    :type path: str
+    :type mode: str
+    :type compression: str or None
+    :rtype: file
+    """
+    if compression is None:
+        with open(path, "rb") as f:
+            magic = f.read(len(LZMA_MAGIC))
+        compression = "lzma" if magic == LZMA_MAGIC else "gzip"
+
+    if compression == "lzma":
+        if not lzma:
+            raise IOError("The lzma module is not available")
+        return lzma.open(path, mode, preset=1) if "w" in mode else lzma.open(path, mode)
+
+    return gzip.open(path, mode, compresslevel=6) if "w" in mode else gzip.open(path, mode)
+
+
+def dump(path, items, compression="gzip"):
+    """
+    Write the given item data by path to the given file.
+
+    The file is written to a temporary file first and then renamed.
+
+    :type path: str
+    :type items: dict
+    :type compression: str
+    :rtype: None
+    """
+    if compression not in compressions():
+        logger.warning('Cannot use the "%s" compression. Using "gzip".', compression)
+        compression = "gzip"
+
+    strings = {}
+    schemas = {}
+    categories = {}
+    rows = []
+
+    def ref(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    for path_ in sorted(items):
+        flags, itemData = encodeItem(path_, items[path_], categories)
+
+        keys = tuple(sorted(itemData))
+        schema = schemas.get(keys)
+        if schema is None:
+            schema = schemas[keys] = len(schemas)
+
+        dirname, basename = splitPath(path_)
+        row = [ref(dirname), ref(basename), flags, schema]
+
+        for key in keys:
+            value = itemData[key]
+            if isinstance(value, six.string_types):
+                row.append(ref(value))
+            else:
+                row.append([value])
+
+        rows.append(row)
+
+    header = {"format": "studiolibrary", "version": VERSION, "count": len(rows)}
+
+    schemas = [[ref(key) for key in keys] for keys in sorted(schemas, key=schemas.get)]
+    strings = sorted(strings, key=strings.get)
+
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    name = "".join(random.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(8))
+    tmp = os.path.join(dirname, name + ".delete")
+
+    try:
+        with openFile(tmp, "wb", compression) as f:
+            for line in [header, strings, schemas]:
+                f.write(json.dumps(line).encode("utf-8") + b"\n")
+
+            for i in range(0, len(rows), ROWS_PER_LINE):
+                line = rows[i:i + ROWS_PER_LINE]
+                f.write(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n")
+
+        if hasattr(os, "replace"):
+            os.replace(tmp, path)
+        else:
+            studiolibrary.silentRemove(path)
+            os.rename(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            studiolibrary.silentRemove(tmp)
+
+
+def load(path):
+    """
+    Read the item data by path from the given file.
+
+    The file is decompressed and decoded one line at a time.
+
+    :type path: str
+    :raises: ValueError if the file has a newer version
+    :rtype: dict
+    """
+    items = {}
+    categories = {}
+
+    with openFile(path, "rb") as f:
+        header = json.loads(f.readline().decode("utf-8"))
+
+        if header.get("version") != VERSION:
+            msg = 'Cannot read version {0} of the compact format "{1}"'
+            raise ValueError(msg.format(header.get("version"), path))
+
+        strings = json.loads(f.readline().decode("utf-8"))
+        schemas = json.loads(f.readline().decode("utf-8"))
+        schemas = [[strings[i] for i in keys] for keys in schemas]
+
+        for line in f:
+            for row in json.loads(line.decode("utf-8")):
+                dirname = strings[row[0]]
+                basename = strings[row[1]]
+                flags = row[2]
+
+                values = [
+                    strings[value] if type(value) is int else value[0]
+                    for value in row[4:]
+                ]
+
+                itemData = dict(zip(schemas[row[3]], values))
+
+                if flags:
+                    decodeItem(dirname, basename, flags, itemData, categories)
+
+                path_ = dirname + "/" + basename if dirname else basename
+                items[path_] = itemData
+
+    return items
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+
+    items = {
+        "folder/a.anim": {
+            "path": "folder/a.anim",
+            "name": "a.anim",
+            "folder": "folder",
+            "category": "folder",
+            "type": "Animation",
+            "modified": 1600000000.5,
+            "description": "hello",
+            "__class__": "mod.AnimItem",
+        },
+        "folder/b.pose/v002": {
+            "path": "folder/b.pose/v002",
+            "name": "b.pose",
+            "folder": "folder",
+            "category": "folder",
+            "index": 2,
+            "favorite": True,
+            "tags": ["a", "b"],
+        },
+        ".": {
+            "path": ".",
+            "name": "Library",
+            "folder": ".",
+            "category": "Library",
+        },
+        "other": {"custom": None},
+    }
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        for compression in compressions():
+            path = os.path.join(tmp, "database.json")
+            dump(path, items, compression=compression)
+
+            assert isCompact(path)
+            assert load(path) == items, load(path)
+
+        path = os.path.join(tmp, "other.json")
+        with open(path, "w") as f:
+            f.write("{}")
+
+        assert not isCompact(path)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -15,6 +15,18 @@ import json
 
 
 _config = None
+_version = 0
+
+
+def version():
+    """
+    Get a number that changes every time the config is changed.
+
+    Use this to invalidate values that are derived from the config.
+
+    :rtype: int
+    """
+    return _version
 
 
 def get(*args):
@@ -33,12 +45,13 @@ def get(*args):
 
 def set(key, value):
 
-    global _config
+    global _config, _version
 
     if not _config:
         _config = read(paths())
 
     _config[key] = value
+    _version += 1
 
 
 def paths():
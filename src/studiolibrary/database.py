@@ -0,0 +1,2034 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import contextlib
+import collections
+
+from studiovendor import six
+
+import studiolibrary
+import studiolibrary.filelock
+import studiolibrary.pathtrie
+import studiolibrary.compactformat
+
+
+__all__ = [
+    "Database",
+    "JsonDatabase",
+    "JournalDatabase",
+    "PathIndex",
+    "SqliteDatabase",
+    "ShardedDatabase",
+    "createDatabase",
+    "registerDatabase",
+]
+
+logger = logging.getLogger(__name__)
+
+
+_databaseClasses = {}
+
+
+def registerDatabase(name, cls):
+    """
+    Register the given database class to the given backend name.
+
+    The backend name is used by the "databaseBackend" config key.
+
+    :type name: str
+    :type cls: Database.__class__
+    :rtype: None
+    """
+    _databaseClasses[name] = cls
+
+
+def createDatabase(path, root):
+    """
+    Create a new database for the backend set in the config.
+
+    :type path: str
+    :type root: str
+    :rtype: Database
+    """
+    name = studiolibrary.config.get("databaseBackend", "json")
+
+    cls = _databaseClasses.get(name)
+    if not cls:
+        msg = 'Cannot find the database backend "{0}". Using "json".'
+        logger.warning(msg.format(name))
+        cls = JsonDatabase
+
+    return cls(path, root)
+
+
+def isAbsolutePath(path):
+    """
+    Check if the given normalized path is a unix, UNC or Windows drive path.
+
+    This is faster than os.path.isabs and works for paths from any platform.
+
+    :type path: str
+    :rtype: bool
+    """
+    return path[:1] == "/" or path[1:3] == ":/"
+
+
+def renamePathInData(data, src, dst):
+    """
+    Rename the given src path to the given dst path in the item data.
+
+    This uses the same matching rules as utils.renamePathInFile for all
+    the keys and string values in the given data.
+
+    :type data: dict or list or str
+    :type src: str
+    :type dst: str
+    :rtype: dict or list or str
+    """
+    if isinstance(data, dict):
+        return dict(
+            (renamePathInData(k, src, dst), renamePathInData(v, src, dst))
+            for k, v in data.items()
+        )
+
+    elif isinstance(data, list):
+        return [renamePathInData(v, src, dst) for v in data]
+
+    elif isinstance(data, six.string_types):
+        prefix = src.rstrip("/") + "/"
+
+        if data == src:
+            return dst
+        elif data.startswith(prefix):
+            return dst.rstrip("/") + "/" + data[len(prefix):]
+
+    return data
+
+
+class PathIndex(object):
+
+    # The item data values that reference paths in the library
+    PATH_KEYS = ["path", "folder"]
+
+    def __init__(self, data):
+        """
+        Index the given item data by path for renaming a subtree.
+
+        The trie of item paths, "path" and "folder" values is created
+        when it's first needed and then kept up to date by the update,
+        remove and rename methods.
+
+        :type data: dict
+        """
+        self._data = data
+        self._trie = None
+
+    def data(self):
+        """
+        Get the item data for the index.
+
+        :rtype: dict
+        """
+        return self._data
+
+    def trie(self):
+        """
+        Get the trie of paths to the item paths that reference them.
+
+        :rtype: studiolibrary.pathtrie.PathTrie
+        """
+        if self._trie is None:
+            self._trie = studiolibrary.pathtrie.PathTrie()
+            for path, itemData in self._data.items():
+                self.addPaths(path, itemData)
+
+        return self._trie
+
+    def paths(self, path, itemData):
+        """
+        Return the paths referenced by the given item.
+
+        :type path: str
+        :type itemData: dict
+        :rtype: list[str]
+        """
+        paths = [path]
+
+        for key in self.PATH_KEYS:
+            value = itemData.get(key)
+            if value and isinstance(value, six.string_types):
+                paths.append(value)
+
+        return paths
+
+    def addPaths(self, path, itemData):
+        """
+        Add the paths referenced by the given item to the trie.
+
+        :type path: str
+        :type itemData: dict
+        :rtype: None
+        """
+        for path_ in self.paths(path, itemData):
+            self._trie.add(path_, path)
+
+    def discardPaths(self, path, itemData):
+        """
+        Remove the paths referenced by the given item from the trie.
+
+        :type path: str
+        :type itemData: dict
+        :rtype: None
+        """
+        for path_ in self.paths(path, itemData):
+            self._trie.discard(path_, path)
+
+    def update(self, data):
+        """
+        Merge the given item data by path.
+
+        The item data is replaced with a merged copy, so the dicts
+        returned by an earlier read are never changed.
+
+        :type data: dict
+        :rtype: None
+        """
+        for path, itemData in data.items():
+            itemData_ = self._data.get(path)
+
+            if itemData_ is not None and self._trie is not None:
+                self.discardPaths(path, itemData_)
+
+            itemData_ = dict(itemData_ or {})
+            itemData_.update(itemData)
+            self._data[path] = itemData_
+
+            if self._trie is not None:
+                self.addPaths(path, itemData_)
+
+    def remove(self, paths):
+        """
+        Remove the item data for the given paths.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        for path in paths:
+            itemData = self._data.pop(path, None)
+
+            if itemData is not None and self._trie is not None:
+                self.discardPaths(path, itemData)
+
+    def rename(self, src, dst):
+        """
+        Rename the given src path to the dst path for the affected items.
+
+        Only the items with a path, "path" or "folder" value under the
+        src path are changed.
+
+        :type src: str
+        :type dst: str
+        :rtype: int
+        """
+        trie = self.trie()
+        items = []
+
+        for path in trie.find(src):
+            itemData = self._data.pop(path, None)
+            if itemData is not None:
+                self.discardPaths(path, itemData)
+                items.append((path, itemData))
+
+        for path, itemData in items:
+            path = renamePathInData(path, src, dst)
+            itemData = renamePathInData(itemData, src, dst)
+
+            self._data[path] = itemData
+            self.addPaths(path, itemData)
+
+        return len(items)
+
+
+class Database(object):
+
+    # Remove lock files older than this in seconds
+    STALE_LOCK_TIMEOUT = 60
+
+    def __init__(self, path, root):
+        """
+        The base class for storing the item data of a library.
+
+        :type path: str
+        :type root: str
+        """
+        self._path = studiolibrary.normPath(path)
+        self._root = studiolibrary.normPath(root)
+
+    def path(self):
+        """
+        Get the location of the database on disc.
+
+        :rtype: str
+        """
+        return self._path
+
+    def root(self):
+        """
+        Get the root path of the library.
+
+        :rtype: str
+        """
+        return self._root
+
+    def exists(self):
+        """
+        Check if the database exists on disc.
+
+        :rtype: bool
+        """
+        return os.path.exists(self.path())
+
+    def lockPath(self):
+        """
+        Get the location of the lock file used when writing.
+
+        :rtype: str
+        """
+        return self.path() + ".lock"
+
+    def lock(self, timeout=None):
+        """
+        Get a lock for writing to the database from other processes.
+
+        The timeout defaults to the "databaseLockTimeout" config value.
+
+        Example:
+            with database.lock():
+                data = database.read()
+
+        :type timeout: float or None
+        :rtype: studiolibrary.filelock.FileLock
+        """
+        if timeout is None:
+            timeout = studiolibrary.config.get("databaseLockTimeout", 30)
+
+        return studiolibrary.filelock.FileLock(
+            self.lockPath(),
+            timeout=timeout,
+            stale=self.STALE_LOCK_TIMEOUT,
+        )
+
+    @staticmethod
+    def mergeData(current, base, data):
+        """
+        Apply the changes from the base data to the given data onto current.
+
+        This is used when another process has changed the database since
+        the base data was read. Only the items that were added, changed
+        or removed are written over the current data.
+
+        :type current: dict
+        :type base: dict
+        :type data: dict
+        :rtype: dict
+        """
+        results = dict(current)
+
+        for path, itemData in data.items():
+            if base.get(path) != itemData:
+                results[path] = itemData
+
+        for path in base:
+            if path not in data:
+                results.pop(path, None)
+
+        return results
+
+    def watchPaths(self):
+        """
+        Get the files that change when the database is modified.
+
+        :rtype: list[str]
+        """
+        return [self.path()]
+
+    def mtime(self):
+        """
+        Return when the database was last modified.
+
+        :rtype: float or None
+        """
+        path = self.path()
+        mtime = None
+
+        if os.path.exists(path):
+            mtime = os.path.getmtime(path)
+
+        return mtime
+
+    def encodePath(self, path):
+        """
+        Return the given path relative to the library root.
+
+        Paths outside of the library root are returned unchanged.
+
+        :type path: str
+        :rtype: str
+        """
+        root = self._root
+
+        if path == root:
+            return "."
+        elif path.startswith(root + "/"):
+            return path[len(root) + 1:]
+
+        return path
+
+    def decodePath(self, path):
+        """
+        Return the absolute path for the given path from encodePath.
+
+        :type path: str
+        :rtype: str
+        """
+        if path == ".":
+            return self._root
+        elif isAbsolutePath(path):
+            return path
+
+        return self._root + "/" + path
+
+    def encodeItemData(self, itemData):
+        """
+        Return a copy of the given item data with relative path fields.
+
+        :type itemData: dict
+        :rtype: dict
+        """
+        itemData = dict(itemData)
+
+        for key in PathIndex.PATH_KEYS:
+            value = itemData.get(key)
+            if value and isinstance(value, six.string_types):
+                itemData[key] = self.encodePath(value)
+
+        return itemData
+
+    def decodeItemData(self, itemData):
+        """
+        Resolve the path fields in the given item data in place.
+
+        :type itemData: dict
+        :rtype: dict
+        """
+        for key in PathIndex.PATH_KEYS:
+            value = itemData.get(key)
+            if value and isinstance(value, six.string_types):
+                itemData[key] = self.decodePath(value)
+
+        return itemData
+
+    def encodeData(self, data):
+        """
+        Return the given item data by path with relative paths.
+
+        :type data: dict
+        :rtype: dict
+        """
+        root = self._root
+        prefix = root + "/"
+        size = len(prefix)
+        keys = PathIndex.PATH_KEYS
+        results = {}
+
+        # Inline encodePath as this is called for every item
+        for path, itemData in data.items():
+            itemData = dict(itemData)
+
+            for key in keys:
+                value = itemData.get(key)
+                if value and isinstance(value, six.string_types):
+                    if value == root:
+                        itemData[key] = "."
+                    elif value.startswith(prefix):
+                        itemData[key] = value[size:]
+
+            if path == root:
+                path = "."
+            elif path.startswith(prefix):
+                path = path[size:]
+
+            results[path] = itemData
+
+        return results
+
+    def decodeData(self, data):
+        """
+        Return the given item data by path with absolute paths.
+
+        :type data: dict
+        :rtype: dict
+        """
+        root = self._root
+        prefix = root + "/"
+        keys = PathIndex.PATH_KEYS
+        results = {}
+
+        # Inline decodePath as this is called for every item
+        for path, itemData in data.items():
+
+            for key in keys:
+                value = itemData.get(key)
+                if value and isinstance(value, six.string_types):
+                    if value == ".":
+                        itemData[key] = root
+                    elif value[:1] != "/" and value[1:3] != ":/":
+                        itemData[key] = prefix + value
+
+            if path == ".":
+                path = root
+            elif path[:1] != "/" and path[1:3] != ":/":
+                path = prefix + path
+
+            results[path] = itemData
+
+        return results
+
+    def read(self, paths=None):
+        """
+        Read the item data from disc.
+
+        The paths can be used to only read the item data under the given
+        folders. Backends that store everything in one file return all
+        the item data.
+
+        :type paths: list[str] or None
+        :rtype: dict
+        """
+        raise NotImplementedError("The read method has not been implemented!")
+
+    def save(self, data, base=None):
+        """
+        Replace all the item data on disc with the given data.
+
+        Use base for the data that was read before making the changes.
+        If the database has been changed by another process since, the
+        changes are merged by item, see mergeData.
+
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        raise NotImplementedError("The save method has not been implemented!")
+
+    def update(self, data):
+        """
+        Insert or update the given item data by path.
+
+        The given values are merged into any existing item data.
+
+        :type data: dict
+        :rtype: None
+        """
+        raise NotImplementedError("The update method has not been implemented!")
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        raise NotImplementedError("The remove method has not been implemented!")
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        :rtype: None
+        """
+        raise NotImplementedError("The rename method has not been implemented!")
+
+
+class JsonDatabase(Database):
+
+    # The version of the file format with paths relative to the root.
+    # Older files without a version replace the paths as text.
+    VERSION = 2
+
+    def __init__(self, path, root):
+        """
+        Store all the item data in a single json file.
+
+        :type path: str
+        :type root: str
+        """
+        super(JsonDatabase, self).__init__(path, root)
+
+        self._data = None
+        self._index = None
+        self._version = None
+
+    def version(self):
+        """
+        Get a value that changes every time the database.json file is written.
+
+        The inode and size are used as well as the mtime, as the mtime
+        can be the same for quick writes on some network shares.
+
+        :rtype: tuple or None
+        """
+        try:
+            stat = os.stat(self.path())
+        except OSError:
+            return None
+
+        return stat.st_mtime, stat.st_size, stat.st_ino
+
+    def read(self, paths=None):
+        """
+        Read the database.json file from disc.
+
+        The data is cached until the file is modified on disc. A copy
+        of the cached dict is returned, and writes replace the item data
+        instead of changing it, so the result is never changed later.
+
+        :type paths: list[str] or None
+        :rtype: dict
+        """
+        version = self.version()
+
+        if self._data is None or self._version != version:
+            self._data = self.load()
+            self._version = version
+
+        return dict(self._data)
+
+    def load(self):
+        """
+        Load and decode the database.json file from disc.
+
+        Files written with the compact format are detected and read
+        with studiolibrary.compactformat. Older databases are migrated
+        to the current version once.
+
+        Errors are raised for files that cannot be read, such as a newer
+        format version or a truncated file, so that the next write never
+        replaces the database with empty data.
+
+        :rtype: dict
+        """
+        path = self.path()
+        version = self.version()
+
+        if studiolibrary.compactformat.isCompact(path):
+            return self.decodeData(studiolibrary.compactformat.load(path))
+
+        text = studiolibrary.read(path, absolute=False)
+
+        if not text:
+            return {}
+
+        data = json.loads(text)
+
+        if data.get("version") == self.VERSION:
+            return self.decodeData(data.get("items", {}))
+
+        data = json.loads(studiolibrary.absPath(text, path))
+        self.migrate(data, version)
+
+        return data
+
+    def migrate(self, data, version):
+        """
+        Save the given data from an older database using the current version.
+
+        The data is only written if the database.json file still has the
+        given version once it has been locked, so a newer save from another
+        process is never replaced. The migration is skipped if the database
+        is locked, as the next write saves the current version anyway.
+
+        :type data: dict
+        :type version: tuple or None
+        :rtype: None
+        """
+        try:
+            with self.lock(timeout=0):
+                if self.version() != version:
+                    logger.debug('The database has changed since it was read "%s"', self.path())
+                    return
+
+                logger.info('Migrating the database to version %s "%s"', self.VERSION, self.path())
+                self.dump(data)
+
+        except (IOError, OSError) as error:
+            logger.warning('Cannot migrate the database "%s": %s', self.path(), error)
+
+    def dump(self, data):
+        """
+        Encode and write the given data to the database.json file.
+
+        The "databaseFormat" config value can be set to "gzip" or "lzma"
+        to write a smaller file with studiolibrary.compactformat.
+
+        :type data: dict
+        :rtype: None
+        """
+        items = self.encodeData(data)
+
+        compression = studiolibrary.config.get("databaseFormat", "json")
+
+        if compression and compression != "json":
+            path = self.path()
+            studiolibrary.compactformat.dump(path, items, compression=compression)
+            return
+
+        data = collections.OrderedDict([
+            ("version", self.VERSION),
+            ("items", collections.OrderedDict(sorted(items.items()))),
+        ])
+
+        text = json.dumps(data, indent=4)
+        studiolibrary.write(self.path(), text, relative=False)
+
+    def index(self, data=None):
+        """
+        Get the path index for the given data or the cached data.
+
+        The index is kept until the data is read again from disc.
+
+        :type data: dict or None
+        :rtype: PathIndex
+        """
+        if data is None:
+            self.read()
+            data = self._data
+
+        if self._index is None or self._index.data() is not data:
+            self._index = PathIndex(data)
+
+        return self._index
+
+    def save(self, data, base=None):
+        """
+        Write the given data to the database.json file.
+
+        The given data is cached, so it shouldn't be changed after.
+
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        with self.lock():
+            if base is not None:
+                current = self.read()
+
+                if current is not base and current != base:
+                    logger.info('Merging the changes made to "%s"', self.path())
+                    data = self.mergeData(current, base, data)
+
+            self.dump(data)
+
+            self._data = data
+            self._version = self.version()
+
+    def update(self, data):
+        """
+        Insert or update the given item data by path.
+
+        :type data: dict
+        :rtype: None
+        """
+        with self.lock():
+            index = self.index()
+            index.update(data)
+            self.save(index.data())
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        with self.lock():
+            index = self.index()
+            index.remove(paths)
+            self.save(index.data())
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        :rtype: None
+        """
+        src = studiolibrary.normPath(src)
+        dst = studiolibrary.normPath(dst)
+
+        with self.lock():
+            index = self.index()
+            index.rename(src, dst)
+            self.save(index.data())
+
+
+class JournalDatabase(JsonDatabase):
+
+    def __init__(self, path, root):
+        """
+        Append each change to a journal file next to the database.json file.
+
+        Reading replays the journal over the last database.json file. Once
+        the journal passes the "databaseJournalSize" config value it is
+        compacted into a new database.json file in a background thread.
+
+        :type path: str
+        :type root: str
+        """
+        super(JournalDatabase, self).__init__(path, root)
+
+        self._offset = 0
+        self._journalStat = None
+        self._compactThread = None
+
+    def journalPath(self):
+        """
+        Get the location of the journal file on disc.
+
+        :rtype: str
+        """
+        return os.path.splitext(self.path())[0] + ".journal"
+
+    def compactPaths(self):
+        """
+        Get the journals that are being compacted, oldest first.
+
+        :rtype: list[str]
+        """
+        dirname, basename = os.path.split(self.journalPath())
+
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            return []
+
+        paths = []
+        for name in names:
+            if name.startswith(basename + ".") and name.endswith(".compact"):
+                path = dirname + "/" + name
+                try:
+                    paths.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+
+        return [path for mtime, path in sorted(paths)]
+
+    def watchPaths(self):
+        """
+        Get the files that change when the database is modified.
+
+        :rtype: list[str]
+        """
+        return [self.path(), self.journalPath()]
+
+    def exists(self):
+        """
+        Check if the database or the journal exists on disc.
+
+        :rtype: bool
+        """
+        return os.path.exists(self.path()) or os.path.exists(self.journalPath())
+
+    def mtime(self):
+        """
+        Return when the database or the journal was last modified.
+
+        :rtype: float or None
+        """
+        mtimes = [super(JournalDatabase, self).mtime()]
+
+        for path in [self.journalPath()] + self.compactPaths():
+            if os.path.exists(path):
+                mtimes.append(os.path.getmtime(path))
+
+        mtimes = [mtime for mtime in mtimes if mtime is not None]
+        return max(mtimes) if mtimes else None
+
+    def read(self, paths=None):
+        """
+        Read the database.json file and replay the journal over it.
+
+        Only the records appended since the last read are replayed when
+        the database.json file hasn't changed.
+
+        :type paths: list[str] or None
+        :rtype: dict
+        """
+        version = self.version()
+        path = self.journalPath()
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+
+        # Read everything again if the journal was compacted or replaced
+        reset = self._data is None or self._version != version or (
+            self._journalStat and (
+                not stat or
+                stat.st_ino != self._journalStat.st_ino or
+                stat.st_size < self._offset
+            )
+        )
+
+        if reset:
+            self._data = self.load()
+            self._version = version
+            self._offset = 0
+
+            for path_ in self.compactPaths():
+                self.replay(self.index(self._data), path_)
+
+        if stat:
+            self._offset = self.replay(self.index(self._data), path, self._offset)
+
+        self._journalStat = stat
+
+        return dict(self._data)
+
+    def replay(self, index, path, offset=0):
+        """
+        Apply the records in the given journal to the given index.
+
+        Only complete lines are replayed so that a record being appended
+        by another process is read on the next call.
+
+        :type index: PathIndex
+        :type path: str
+        :type offset: int
+        :rtype: int
+        """
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                text = f.read()
+        except (IOError, OSError) as error:
+            logger.debug('Cannot read the journal "%s": %s', path, error)
+            return offset
+
+        end = text.rfind(b"\n") + 1
+
+        for line in text[:end].splitlines():
+            if not line.strip():
+                continue
+
+            try:
+                record = self.decodeRecord(json.loads(line.decode("utf-8")))
+            except (ValueError, KeyError):
+                logger.warning('Cannot read a record in the journal "%s"', path)
+                continue
+
+            self.apply(index, record)
+
+        return offset + end
+
+    def encodeRecord(self, record):
+        """
+        Return a copy of the given journal record with relative paths.
+
+        :type record: dict
+        :rtype: dict
+        """
+        record = dict(record)
+
+        if "data" in record:
+            record["data"] = self.encodeData(record["data"])
+        if "paths" in record:
+            record["paths"] = [self.encodePath(p) for p in record["paths"]]
+        if "src" in record:
+            record["src"] = self.encodePath(record["src"])
+            record["dst"] = self.encodePath(record["dst"])
+
+        return record
+
+    def decodeRecord(self, record):
+        """
+        Resolve the paths in the given journal record in place.
+
+        :type record: dict
+        :rtype: dict
+        """
+        if "data" in record:
+            record["data"] = self.decodeData(record["data"])
+        if "paths" in record:
+            record["paths"] = [self.decodePath(p) for p in record["paths"]]
+        if "src" in record:
+            record["src"] = self.decodePath(record["src"])
+            record["dst"] = self.decodePath(record["dst"])
+
+        return record
+
+    @staticmethod
+    def apply(index, record):
+        """
+        Apply the given journal record to the given index.
+
+        :type index: PathIndex
+        :type record: dict
+        :rtype: None
+        """
+        op = record.get("op")
+
+        if op == "update":
+            index.update(record["data"])
+
+        elif op == "remove":
+            index.remove(record["paths"])
+
+        elif op == "rename":
+            index.rename(record["src"], record["dst"])
+
+        else:
+            logger.warning('Cannot apply the journal record "%s"', op)
+
+    def append(self, record):
+        """
+        Append the given record to the journal file.
+
+        The database is locked while appending, as appends are not atomic
+        on network shares and a journal being compacted must not change.
+
+        :type record: dict
+        :rtype: None
+        """
+        path = self.journalPath()
+
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        line = json.dumps(self.encodeRecord(record)) + "\n"
+
+        with self.lock():
+            # Write the whole record at once so other readers never see part of it
+            with open(path, "ab") as f:
+                f.write(line.encode("utf-8"))
+
+            size = os.path.getsize(path)
+
+        # Compact after releasing the lock so the thread can take it
+        maxSize = studiolibrary.config.get("databaseJournalSize", 1048576)
+        if maxSize and size > maxSize:
+            self.compactInBackground()
+
+    def save(self, data, base=None):
+        """
+        Write the given data to the database.json file and clear the journal.
+
+        The journal is moved aside first and replayed when reading the
+        current data, so the records appended by other processes since
+        base was read are merged.
+
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        with self.lock():
+            self.rotate()
+
+            # Replay the rotated journal when reading the current data
+            self._data = None
+
+            super(JournalDatabase, self).save(data, base=base)
+
+            for path in self.compactPaths():
+                studiolibrary.silentRemove(path)
+
+            self._offset = 0
+            self._journalStat = None
+
+    def update(self, data):
+        """
+        Append the given item data to the journal.
+
+        :type data: dict
+        :rtype: None
+        """
+        self.append({"op": "update", "data": data})
+
+    def remove(self, paths):
+        """
+        Append the paths to remove to the journal.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        self.append({"op": "remove", "paths": list(paths)})
+
+    def rename(self, src, dst):
+        """
+        Append the rename of the given source path to the journal.
+
+        :type src: str
+        :type dst: str
+        :rtype: None
+        """
+        src = studiolibrary.normPath(src)
+        dst = studiolibrary.normPath(dst)
+
+        self.append({"op": "rename", "src": src, "dst": dst})
+
+    def compactInBackground(self):
+        """
+        Compact the journal in a background thread.
+
+        :rtype: None
+        """
+        if self._compactThread and self._compactThread.is_alive():
+            return
+
+        self._compactThread = threading.Thread(target=self.compact)
+        self._compactThread.daemon = True
+        self._compactThread.start()
+
+    def rotate(self):
+        """
+        Rename the journal so that other processes append to a new journal.
+
+        The renamed journal is replayed until it's removed by compact
+        or save.
+
+        :rtype: None
+        """
+        path = self.journalPath()
+
+        if os.path.exists(path):
+            name = "{0}.{1}.compact".format(path, uuid.uuid4().hex[:8])
+            try:
+                os.rename(path, name)
+            except OSError as error:
+                logger.debug('Cannot rotate the journal "%s": %s', path, error)
+
+    def compact(self):
+        """
+        Replay the journal into a new database.json file.
+
+        The journal is renamed before it is replayed and only removed
+        once the new database.json file has been written. Appends wait
+        for the database lock while compacting. This returns False
+        without waiting if the database is locked by another process.
+
+        :rtype: bool
+        """
+        try:
+            lock = self.lock(timeout=0)
+            lock.acquire()
+        except studiolibrary.filelock.LockError:
+            logger.debug('The journal is already being compacted "%s"', self.lockPath())
+            return False
+
+        try:
+            self.rotate()
+
+            paths = self.compactPaths()
+            if not paths:
+                return False
+
+            index = PathIndex(self.load())
+            for path_ in paths:
+                self.replay(index, path_)
+
+            self.dump(index.data())
+
+            for path_ in paths:
+                studiolibrary.silentRemove(path_)
+
+            logger.debug('Compacted the journal "%s"', self.journalPath())
+            return True
+
+        except Exception:
+            logger.exception('Cannot compact the journal "%s"', self.journalPath())
+            return False
+
+        finally:
+            lock.release()
+
+
+class SqliteDatabase(Database):
+
+    # SQLite only supports 999 host parameters in older versions
+    CHUNK_SIZE = 500
+
+    def __init__(self, path, root):
+        """
+        Store the item data as one row per path in a SQLite file.
+
+        The database is saved next to the configured database path
+        using the ".sqlite" extension.
+
+        :type path: str
+        :type root: str
+        """
+        path = os.path.splitext(path)[0] + ".sqlite"
+        super(SqliteDatabase, self).__init__(path, root)
+
+    @contextlib.contextmanager
+    def connect(self, write=False):
+        """
+        Open a connection to the database and commit on success.
+
+        Use write to take the write lock before anything is read, so
+        that no other process can change the rows between reading and
+        writing them. Other writers wait for the commit.
+
+        :type write: bool
+        :rtype: sqlite3.Connection
+        """
+        dirname = os.path.dirname(self.path())
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        connection = sqlite3.connect(self.path(), timeout=30)
+
+        try:
+            self.createTables(connection)
+
+            # Begin the transaction here instead of before the first change
+            if write:
+                connection.isolation_level = None
+                connection.execute("BEGIN IMMEDIATE")
+
+            yield connection
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    @staticmethod
+    def createTables(connection):
+        """
+        Create the items table and the indexes if they don't exist.
+
+        :type connection: sqlite3.Connection
+        :rtype: None
+        """
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                path TEXT PRIMARY KEY,
+                type TEXT,
+                folder TEXT,
+                category TEXT,
+                modified REAL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS items_type ON items (type);
+            CREATE INDEX IF NOT EXISTS items_folder ON items (folder);
+            CREATE INDEX IF NOT EXISTS items_category ON items (category);
+            CREATE INDEX IF NOT EXISTS items_modified ON items (modified);
+        """)
+
+    def encode(self, path, data):
+        """
+        Return the row values for the given path and item data.
+
+        All the paths are stored relative to the library root.
+
+        :type path: str
+        :type data: dict
+        :rtype: tuple
+        """
+        data = self.encodeItemData(data)
+
+        return (
+            self.encodePath(path),
+            data.get("type"),
+            data.get("folder") or "",
+            data.get("category"),
+            data.get("modified"),
+            json.dumps(data),
+        )
+
+    def decode(self, path, text):
+        """
+        Return the absolute path and item data for the given row values.
+
+        :type path: str
+        :type text: str
+        :rtype: (str, dict)
+        """
+        path = self.decodePath(path)
+        data = self.decodeItemData(json.loads(text))
+        return path, data
+
+    def select(self, connection, paths):
+        """
+        Return the item data for the given paths that exist in the database.
+
+        :type connection: sqlite3.Connection
+        :type paths: list[str]
+        :rtype: dict
+        """
+        results = {}
+        keys = [self.encodePath(path) for path in paths]
+
+        for i in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = keys[i:i + self.CHUNK_SIZE]
+            sql = "SELECT path, data FROM items WHERE path IN ({0})"
+            sql = sql.format(",".join("?" * len(chunk)))
+
+            for key, text in connection.execute(sql, chunk):
+                path, data = self.decode(key, text)
+                results[path] = data
+
+        return results
+
+    def write(self, connection, data):
+        """
+        Insert or replace the rows for the given item data.
+
+        :type connection: sqlite3.Connection
+        :type data: dict
+        :rtype: None
+        """
+        rows = [self.encode(path, itemData) for path, itemData in data.items()]
+
+        connection.executemany(
+            "INSERT OR REPLACE INTO items "
+            "(path, type, folder, category, modified, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def read(self, paths=None):
+        """
+        Read all the rows from the database.
+
+        :type paths: list[str] or None
+        :rtype: dict
+        """
+        data = {}
+
+        if not self.exists():
+            return data
+
+        with self.connect() as connection:
+            for key, text in connection.execute("SELECT path, data FROM items"):
+                path, itemData = self.decode(key, text)
+                data[path] = itemData
+
+        return data
+
+    def save(self, data, base=None):
+        """
+        Replace all the rows with the given item data.
+
+        With base, only the rows that differ from base are written in a
+        single transaction, so rows changed by other processes are kept.
+
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        with self.connect(write=True) as connection:
+            if base is None:
+                connection.execute("DELETE FROM items")
+                self.write(connection, data)
+                return
+
+            changed = dict(
+                (path, itemData) for path, itemData in data.items()
+                if base.get(path) != itemData
+            )
+            removed = [(self.encodePath(path),) for path in base if path not in data]
+
+            connection.executemany("DELETE FROM items WHERE path = ?", removed)
+            self.write(connection, changed)
+
+    def update(self, data):
+        """
+        Upsert the rows for the given item data.
+
+        :type data: dict
+        :rtype: None
+        """
+        with self.connect(write=True) as connection:
+            data_ = self.select(connection, list(data.keys()))
+
+            for path, itemData in data.items():
+                data_.setdefault(path, {})
+                data_[path].update(itemData)
+
+            self.write(connection, data_)
+
+    def remove(self, paths):
+        """
+        Delete the rows for the given paths.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        keys = [(self.encodePath(path),) for path in paths]
+
+        with self.connect(write=True) as connection:
+            connection.executemany("DELETE FROM items WHERE path = ?", keys)
+
+    def rename(self, src, dst):
+        """
+        Rename the rows for the source path and all its children.
+
+        :type src: str
+        :type dst: str
+        :rtype: None
+        """
+        src = studiolibrary.normPath(src)
+        dst = studiolibrary.normPath(dst)
+
+        key = self.encodePath(src)
+        prefix = "" if key == "." else key.rstrip("/") + "/"
+
+        with self.connect(write=True) as connection:
+            rows = connection.execute(
+                "SELECT path, data FROM items "
+                "WHERE path = ? OR substr(path, 1, ?) = ?",
+                (key, len(prefix), prefix)
+            ).fetchall()
+
+            data = {}
+            for key_, text in rows:
+                path, itemData = self.decode(key_, text)
+
+                path = renamePathInData(path, src, dst)
+                data[path] = renamePathInData(itemData, src, dst)
+
+            connection.executemany(
+                "DELETE FROM items WHERE path = ?",
+                [(row[0],) for row in rows]
+            )
+            self.write(connection, data)
+
+
+class ShardedDatabase(Database):
+
+    # The version of the manifest file
+    VERSION = 1
+
+    def __init__(self, path, root):
+        """
+        Split the item data into a json database for each folder.
+
+        Items are stored in the shard for the first "databaseShardDepth"
+        folders of their path under the root. Items directly in a
+        shallower folder are stored in the shard for that folder. Only
+        the shards that change are written, and reading can be limited
+        to the shards under the given folders.
+
+        The shards are saved in a "shards" folder next to the configured
+        database path. A manifest file with the ".shards" extension is
+        written on every change so that the library only has to watch
+        one file.
+
+        :type path: str
+        :type root: str
+        """
+        path = os.path.splitext(path)[0] + ".shards"
+        super(ShardedDatabase, self).__init__(path, root)
+
+        self._keys = None
+        self._keysMtime = None
+        self._shards = {}
+
+    def shardsPath(self):
+        """
+        Get the folder that contains the shards.
+
+        :rtype: str
+        """
+        return os.path.dirname(self.path()) + "/shards"
+
+    def shardPath(self, key):
+        """
+        Get the location of the shard for the given key.
+
+        :type key: str
+        :rtype: str
+        """
+        if key == ".":
+            return self.shardsPath() + "/shard.json"
+        return self.shardsPath() + "/" + key + "/shard.json"
+
+    def shard(self, key):
+        """
+        Get the json database for the given shard key.
+
+        :type key: str
+        :rtype: JsonDatabase
+        """
+        shard = self._shards.get(key)
+
+        if shard is None:
+            shard = self._shards[key] = JsonDatabase(self.shardPath(key), self.root())
+
+        return shard
+
+    def depth(self):
+        """
+        Get the number of folders used for the shard keys.
+
+        The depth saved in the manifest is used for existing databases.
+        Use save to split the data again with the config value.
+
+        :rtype: int
+        """
+        try:
+            manifest = json.loads(studiolibrary.read(self.path(), absolute=False))
+            return int(manifest["depth"])
+        except (ValueError, KeyError, TypeError, IOError, OSError):
+            return max(1, studiolibrary.config.get("databaseShardDepth", 1))
+
+    def shardKey(self, path, depth):
+        """
+        Get the shard key for the given item path.
+
+        Items in the root folder and outside of the root are stored
+        in the root shard with the key ".".
+
+        :type path: str
+        :type depth: int
+        :rtype: str
+        """
+        path = self.encodePath(path)
+
+        if path == "." or isAbsolutePath(path):
+            return "."
+
+        parts = path.split("/")[:-1]
+        return "/".join(parts[:depth]) or "."
+
+    def shardKeys(self):
+        """
+        Get the keys of the shards that exist on disc.
+
+        The keys are listed again when the manifest has changed.
+
+        :rtype: list[str]
+        """
+        mtime = self.mtime()
+
+        if self._keys is None or self._keysMtime != mtime:
+            keys = []
+            root = self.shardsPath()
+
+            for dirname, dirs, files in os.walk(root):
+                if "shard.json" in files:
+                    dirname = studiolibrary.normPath(dirname)
+                    keys.append(dirname[len(root) + 1:] or ".")
+
+            self._keys = keys
+            self._keysMtime = mtime
+
+        return self._keys
+
+    def shardKeysForPaths(self, paths):
+        """
+        Get the keys of the shards that can contain items under the paths.
+
+        The root shard is always included. The paths are compared
+        without case, the same as Library.match.
+
+        :type paths: list[str] or None
+        :rtype: list[str]
+        """
+        keys = self.shardKeys()
+
+        if paths is None:
+            return keys
+
+        paths = [path.lower() for path in paths]
+        results = []
+
+        for key in keys:
+            dirname = self.decodePath(key).lower()
+
+            if key == "." or any(
+                dirname.startswith(path) or path.startswith(dirname)
+                for path in paths
+            ):
+                results.append(key)
+
+        return results
+
+    def split(self, data, depth):
+        """
+        Group the given item data by shard key.
+
+        :type data: dict
+        :type depth: int
+        :rtype: dict
+        """
+        results = {}
+
+        for path, itemData in data.items():
+            key = self.shardKey(path, depth)
+            results.setdefault(key, {})[path] = itemData
+
+        return results
+
+    def saveShard(self, key, data, base=None):
+        """
+        Save the given item data to the shard, or remove it when empty.
+
+        :type key: str
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        shard = self.shard(key)
+
+        with shard.lock():
+            if base is not None:
+                data = self.mergeData(shard.read(), base, data)
+
+            if data:
+                shard.save(data)
+            else:
+                studiolibrary.silentRemove(self.shardPath(key))
+                self._shards.pop(key, None)
+
+    def touch(self, depth=None):
+        """
+        Write the manifest so that other processes see the change.
+
+        :type depth: int or None
+        :rtype: None
+        """
+        if depth is None:
+            depth = self.depth()
+
+        manifest = {"version": self.VERSION, "depth": depth, "modified": time.time()}
+        studiolibrary.write(self.path(), json.dumps(manifest), relative=False)
+
+    def read(self, paths=None):
+        """
+        Read the item data from the shards under the given paths.
+
+        :type paths: list[str] or None
+        :rtype: dict
+        """
+        data = {}
+
+        for key in self.shardKeysForPaths(paths):
+            data.update(self.shard(key).read())
+
+        return data
+
+    def save(self, data, base=None):
+        """
+        Replace all the item data with the given data.
+
+        Only the shards with different data are written. Shards that
+        are no longer needed are removed. With base, only the shards
+        that differ from base are written and merged by item.
+
+        :type data: dict
+        :type base: dict or None
+        :rtype: None
+        """
+        depth = max(1, studiolibrary.config.get("databaseShardDepth", 1))
+        groups = self.split(data, depth)
+        split = depth != self.depth()
+        changed = split or not self.exists()
+
+        # All the shards are written when the data is split again. Other
+        # processes can be adding shards to a new database at the same
+        # time, so those are still merged.
+        bases = None
+        if base is not None and not split:
+            bases = self.split(base, depth)
+
+        for key in set(self.shardKeys()) | set(groups):
+            items = groups.get(key, {})
+
+            if bases is not None:
+                if items == bases.get(key, {}):
+                    continue
+                self.saveShard(key, items, base=bases.get(key, {}))
+            else:
+                shard = self.shard(key)
+                if shard.exists() and shard.read() == items:
+                    continue
+                self.saveShard(key, items)
+
+            changed = True
+
+        if changed:
+            self.touch(depth)
+
+    def update(self, data):
+        """
+        Insert or update the given item data in the shards they belong to.
+
+        :type data: dict
+        :rtype: None
+        """
+        for key, items in self.split(data, self.depth()).items():
+            self.shard(key).update(items)
+
+        self.touch()
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the shards they belong to.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        keys = self.shardKeys()
+        depth = self.depth()
+        groups = {}
+
+        for path in paths:
+            groups.setdefault(self.shardKey(path, depth), []).append(path)
+
+        for key, paths_ in groups.items():
+            if key in keys:
+                shard = self.shard(key)
+
+                with shard.lock():
+                    index = shard.index()
+                    index.remove(paths_)
+                    self.saveShard(key, index.data())
+
+        self.touch()
+
+    def rename(self, src, dst):
+        """
+        Move the source path and all its children to the destination.
+
+        Only the shards that contain the source path and the shards
+        for the destination are read and written.
+
+        :type src: str
+        :type dst: str
+        :rtype: None
+        """
+        src = studiolibrary.normPath(src)
+        dst = studiolibrary.normPath(dst)
+
+        prefix = src.rstrip("/") + "/"
+        depth = self.depth()
+        moved = {}
+
+        for key in self.shardKeysForPaths([src]):
+            shard = self.shard(key)
+
+            with shard.lock():
+                index = shard.index()
+                paths = [p for p in index.data() if p == src or p.startswith(prefix)]
+
+                if not paths:
+                    continue
+
+                for path in paths:
+                    moved[path] = index.data()[path]
+
+                index.remove(paths)
+                self.saveShard(key, index.data())
+
+        data = {}
+        for path, itemData in moved.items():
+            path = renamePathInData(path, src, dst)
+            data[path] = renamePathInData(itemData, src, dst)
+
+        for key, items in self.split(data, depth).items():
+            self.shard(key).update(items)
+
+        self.touch()
+
+
+registerDatabase("json", JsonDatabase)
+registerDatabase("journal", JournalDatabase)
+registerDatabase("sqlite", SqliteDatabase)
+registerDatabase("sharded", ShardedDatabase)
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+
+    backends = [
+        ("json", "json"),
+        ("journal", "json"),
+        ("sqlite", "json"),
+        ("sharded", "json"),
+        ("json", "gzip"),
+        ("journal", studiolibrary.compactformat.compressions()[-1]),
+    ]
+
+    format_ = studiolibrary.config.get("databaseFormat")
+
+    for name, databaseFormat in backends:
+
+        studiolibrary.config.set("databaseFormat", databaseFormat)
+
+        tmp = tempfile.mkdtemp()
+        root = studiolibrary.normPath(os.path.join(tmp, "library", "data"))
+        path = root + "/.studiolibrary/database.json"
+
+        try:
+            database = _databaseClasses[name](path, root)
+
+            database.save({
+                root + "/a.anim": {"folder": root, "type": "Animation"},
+                root + "/b": {"folder": root, "type": "Folder"},
+                root + "/b/c.anim": {"folder": root + "/b", "type": "Animation"},
+                root + "/bb.anim": {"folder": root, "type": "Animation"},
+            })
+
+            database.update({root + "/a.anim": {"color": "red"}})
+            data = database.read()
+            assert data[root + "/a.anim"]["color"] == "red"
+            assert data[root + "/a.anim"]["type"] == "Animation"
+
+            database.remove([root + "/a.anim"])
+            assert root + "/a.anim" not in database.read()
+
+            database.rename(root + "/b", root + "/d")
+            data = database.read()
+            assert sorted(data.keys()) == [root + "/bb.anim", root + "/d", root + "/d/c.anim"]
+            assert data[root + "/d/c.anim"]["folder"] == root + "/d"
+
+            # Values that look like relative paths should not be changed
+            database.update({root + "/d/c.anim": {"description": "../../x"}})
+            data = database.read()
+            assert data[root + "/d/c.anim"]["description"] == "../../x"
+
+            # The journal should compact into the same data
+            if name == "journal":
+                assert database.compact()
+                assert not os.path.exists(database.journalPath())
+                assert JsonDatabase(path, root).read() == database.read() == data
+
+            if databaseFormat != "json" and name != "sqlite":
+                assert studiolibrary.compactformat.isCompact(path)
+
+                # Either format can be read for any config value
+                studiolibrary.config.set("databaseFormat", "json")
+                assert JsonDatabase(path, root).read() == data
+
+            # The data read is not changed by later writes
+            base = database.read()
+            database.update({root + "/bb.anim": {"color": "blue"}})
+            assert "color" not in base[root + "/bb.anim"]
+
+            # Saving over an older base keeps the changes made since
+            data = dict(base)
+            data[root + "/e.anim"] = {"folder": root, "type": "Animation"}
+            database.save(data, base=base)
+            data = database.read()
+            assert data[root + "/bb.anim"]["color"] == "blue"
+            assert root + "/e.anim" in data
+
+            # A database that cannot be read is never written over
+            if databaseFormat != "json" and name == "json":
+                compression = databaseFormat
+                header = {"format": "studiolibrary", "version": 2, "count": 0}
+
+                with studiolibrary.compactformat.openFile(path, "wb", compression) as f:
+                    f.write(json.dumps(header).encode("utf-8") + b"\n")
+
+                mtime = os.path.getmtime(path)
+                database = _databaseClasses[name](path, root)
+
+                try:
+                    database.update({root + "/bb.anim": {"color": "red"}})
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("The unreadable database was written")
+
+                assert os.path.getmtime(path) == mtime
+        finally:
+            studiolibrary.config.set("databaseFormat", format_)
+            shutil.rmtree(tmp)
+
+
+def testMigrate():
+
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library", "data"))
+    path = root + "/.studiolibrary/database.json"
+
+    try:
+        data = {
+            root + "/a.anim": {"folder": root, "path": root + "/a.anim"},
+            root + "/b": {"folder": root, "path": root + "/b"},
+        }
+
+        # Save the data using the old format
+        studiolibrary.saveJson(path, data)
+
+        assert JsonDatabase(path, root).read() == data
+        assert json.loads(studiolibrary.read(path))["version"] == JsonDatabase.VERSION
+        assert JsonDatabase(path, root).read() == data
+
+        # A file changed since it was read is not written over
+        studiolibrary.saveJson(path, data)
+        database = JsonDatabase(path, root)
+        version = database.version()
+
+        time.sleep(0.01)
+        newer = {root + "/c.anim": {"folder": root}}
+        database.save(newer)
+
+        database.migrate(data, version)
+        assert JsonDatabase(path, root).read() == newer
+    finally:
+        shutil.rmtree(tmp)
+
+
+def testShards():
+
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library", "data"))
+    path = root + "/.studiolibrary/database.json"
+
+    try:
+        data = {
+            root + "/chars": {"folder": root, "type": "Folder"},
+            root + "/chars/a.anim": {"folder": root + "/chars", "type": "Animation"},
+            root + "/chars/b/c.anim": {"folder": root + "/chars/b", "type": "Animation"},
+            root + "/props/d.anim": {"folder": root + "/props", "type": "Animation"},
+        }
+
+        database = ShardedDatabase(path, root)
+        database.save(data)
+
+        assert sorted(database.shardKeys()) == [".", "chars", "props"]
+        assert database.read() == data
+
+        # Only the shards under the given paths are read
+        assert sorted(database.read([root + "/Props"])) == [
+            root + "/chars",
+            root + "/props/d.anim",
+        ]
+
+        # Only the shards that changed are written
+        mtime = os.path.getmtime(database.shardPath("props"))
+        time.sleep(0.01)
+
+        data[root + "/chars/a.anim"] = dict(data[root + "/chars/a.anim"], color="red")
+        database.save(data)
+        assert os.path.getmtime(database.shardPath("props")) == mtime
+        assert ShardedDatabase(path, root).read()[root + "/chars/a.anim"]["color"] == "red"
+
+        database.update({root + "/chars/e.anim": {"folder": root + "/chars"}})
+        assert os.path.getmtime(database.shardPath("props")) == mtime
+
+        # Renamed items are moved to the shard for the new path
+        database.rename(root + "/chars", root + "/props/chars")
+        assert sorted(database.shardKeys()) == ["props"]
+        assert root + "/props/chars/b/c.anim" in ShardedDatabase(path, root).read()
+        assert root + "/chars/b/c.anim" not in database.read()
+
+        # Saving with a new depth splits the data again
+        studiolibrary.config.set("databaseShardDepth", 2)
+        database.save(database.read())
+        assert database.depth() == 2
+        assert sorted(database.shardKeys()) == ["props", "props/chars"]
+    finally:
+        studiolibrary.config.set("databaseShardDepth", 1)
+        shutil.rmtree(tmp)
+
+
+def _testWriter(name, path, root, index, count):
+
+    studiolibrary.config.set("databaseJournalSize", 0)
+
+    database = _databaseClasses[name](path, root)
+
+    for i in range(count):
+        itemPath = "{0}/folder{1}/item{2}.anim".format(root, i % 3, index * count + i)
+
+        if i % 2:
+            # Items updated by every writer must keep all the values
+            database.update({
+                itemPath: {"folder": os.path.dirname(itemPath)},
+                root + "/shared.anim": {itemPath: i},
+            })
+        else:
+            base = database.read()
+            data = dict(base)
+            data[itemPath] = {"folder": os.path.dirname(itemPath)}
+            database.save(data, base=base)
+
+
+def testConcurrentWrites(processes=4, count=20):
+
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    for name in ["json", "journal", "sqlite", "sharded"]:
+
+        tmp = tempfile.mkdtemp()
+        root = studiolibrary.normPath(os.path.join(tmp, "library", "data"))
+        path = root + "/.studiolibrary/database.json"
+
+        try:
+            workers = [
+                multiprocessing.Process(
+                    target=_testWriter,
+                    args=(name, path, root, i, count),
+                )
+                for i in range(processes)
+            ]
+
+            for worker in workers:
+                worker.start()
+
+            for worker in workers:
+                worker.join()
+                assert worker.exitcode == 0, name
+
+            data = _databaseClasses[name](path, root).read()
+            shared = data.pop(root + "/shared.anim")
+            assert len(data) == processes * count, (name, len(data))
+            assert len(shared) == processes * count // 2, (name, len(shared))
+            assert not os.path.exists(path + ".lock"), name
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
+    testMigrate()
+    testShards()
+    testConcurrentWrites()
@@ -0,0 +1,439 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import uuid
+import errno
+import socket
+import logging
+import threading
+
+
+__all__ = [
+    "FileLock",
+    "LockError",
+]
+
+logger = logging.getLogger(__name__)
+
+
+# The locks held by this process with the owning thread and a count
+_held = {}
+_heldLock = threading.Lock()
+_heldChanged = threading.Condition(_heldLock)
+
+# The thread that touches the lock files while they are held
+_refreshThread = None
+
+
+class LockError(IOError):
+    """Raised when a lock cannot be acquired before the timeout."""
+
+
+class FileLock(object):
+
+    # How often to check a lock held by another process in seconds
+    POLL_INTERVAL = 0.05
+
+    # How often to touch the lock files held by this process in seconds,
+    # so that they don't become stale while they are held
+    REFRESH_INTERVAL = 10
+
+    def __init__(self, path, timeout=10, stale=60):
+        """
+        Lock a file across processes and machines using a lock file.
+
+        The lock file is created with O_EXCL, which is atomic on local
+        discs and on network shares where fcntl locks are not reliable.
+        A lock is stale when the process that created it on this machine
+        has exited, or when it hasn't been touched for the stale time in
+        seconds. The lock file is touched every REFRESH_INTERVAL seconds
+        while it's held, so only locks left behind by a process that has
+        exited or stopped responding become stale. Stale locks are removed.
+
+        The lock can be acquired again by the thread that holds it.
+
+        Example:
+            with FileLock(path + ".lock", timeout=5):
+                data = read(path)
+                write(path, data)
+
+        :type path: str
+        :type timeout: float
+        :type stale: float
+        """
+        self._path = path
+        self._stale = stale
+        self._token = None
+        self._timeout = timeout
+
+    def path(self):
+        """
+        Get the location of the lock file.
+
+        :rtype: str
+        """
+        return self._path
+
+    def isLocked(self):
+        """
+        Check if the lock is held by this object.
+
+        :rtype: bool
+        """
+        return self._token is not None
+
+    def owner(self):
+        """
+        Get the host, pid and time saved in the lock file.
+
+        :rtype: dict or None
+        """
+        try:
+            with open(self._path, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def isStale(self):
+        """
+        Check if the lock file was left behind by a process that has exited.
+
+        Locks held by a process on another machine are only stale when
+        they haven't been touched for the stale time.
+
+        :rtype: bool
+        """
+        try:
+            age = time.time() - os.path.getmtime(self._path)
+        except OSError:
+            return False
+
+        owner = self.owner()
+
+        # The process can be checked directly on the same machine
+        if owner and owner.get("host") == socket.gethostname() and os.name != "nt":
+            try:
+                os.kill(owner.get("pid"), 0)
+            except OSError as error:
+                return error.errno == errno.ESRCH
+            except TypeError:
+                pass
+            else:
+                return False
+
+        return age > self._stale
+
+    def breakLock(self):
+        """
+        Remove the lock file if it's stale.
+
+        The lock file is renamed before it's removed so that only one
+        process can break it. The renamed lock is checked again, as it
+        can have been broken and acquired by another process since it
+        was found stale. A lock that isn't stale anymore is put back.
+
+        :rtype: bool
+        """
+        name = "{0}.{1}.stale".format(self._path, uuid.uuid4().hex[:8])
+
+        try:
+            os.rename(self._path, name)
+        except OSError:
+            return False
+
+        if not FileLock(name, stale=self._stale).isStale():
+            self.restoreLock(name)
+            return False
+
+        logger.warning('Removed the stale lock "%s"', self._path)
+
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+        return True
+
+    def restoreLock(self, name):
+        """
+        Move the given lock file back without replacing a new lock file.
+
+        :type name: str
+        :rtype: None
+        """
+        try:
+            # Renaming only fails for an existing file on Windows
+            if os.name == "nt":
+                os.rename(name, self._path)
+            else:
+                os.link(name, self._path)
+                os.remove(name)
+        except (OSError, AttributeError) as error:
+            logger.warning('Cannot restore the lock "%s": %s', self._path, error)
+
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    def acquire(self):
+        """
+        Wait for the lock until the timeout.
+
+        :raises: LockError if the lock is held by another process
+        :rtype: None
+        """
+        key = os.path.abspath(self._path)
+        thread = threading.current_thread()
+
+        with _heldLock:
+            held = _held.get(key)
+            if held and held[0] is thread:
+                _held[key] = (thread, held[1] + 1, held[2])
+                self._token = held[2]
+                return
+
+        dirname = os.path.dirname(self._path)
+        if dirname and not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass
+
+        token = uuid.uuid4().hex
+        deadline = time.time() + self._timeout
+
+        while True:
+            try:
+                fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as error:
+                if error.errno not in (errno.EEXIST, errno.EACCES):
+                    raise
+            else:
+                owner = {
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "time": time.time(),
+                    "token": token,
+                }
+                os.write(fd, json.dumps(owner).encode("utf-8"))
+                os.close(fd)
+                break
+
+            if self.isStale() and self.breakLock():
+                continue
+
+            if time.time() >= deadline:
+                msg = 'Cannot lock "{0}" as it is held by {1}'
+                raise LockError(msg.format(self._path, self.owner()))
+
+            time.sleep(self.POLL_INTERVAL)
+
+        with _heldLock:
+            _held[key] = (thread, 1, token)
+            _startRefreshThread()
+
+        self._token = token
+
+    def release(self):
+        """
+        Release the lock and remove the lock file.
+
+        :rtype: None
+        """
+        if self._token is None:
+            return
+
+        key = os.path.abspath(self._path)
+
+        with _heldLock:
+            thread, count, token = _held[key]
+            count -= 1
+
+            if count:
+                _held[key] = (thread, count, token)
+            else:
+                del _held[key]
+
+        self._token = None
+
+        if count:
+            return
+
+        # Only remove the lock file if it hasn't been broken as stale
+        owner = self.owner()
+        if owner and owner.get("token") == token:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def _startRefreshThread():
+    """
+    Start the thread that touches the held lock files if it isn't running.
+
+    A running thread is woken up so that it uses the current interval.
+    This must be called with the held locks lock.
+
+    :rtype: None
+    """
+    global _refreshThread
+
+    if _refreshThread is None:
+        _refreshThread = threading.Thread(target=_refreshLocks)
+        _refreshThread.daemon = True
+        _refreshThread.start()
+    else:
+        _heldChanged.notify()
+
+
+def _refreshLocks():
+    """
+    Touch the lock files held by this process until none are held.
+
+    :rtype: None
+    """
+    global _refreshThread
+
+    while True:
+        with _heldLock:
+            _heldChanged.wait(FileLock.REFRESH_INTERVAL)
+            held = [(path, token) for path, (_, _, token) in _held.items()]
+
+            if not held:
+                _refreshThread = None
+                return
+
+        for path, token in held:
+            owner = FileLock(path).owner()
+
+            # Don't touch a lock that has been broken as stale
+            if owner and owner.get("token") == token:
+                try:
+                    os.utime(path, None)
+                except OSError:
+                    pass
+
+
+def _testHold(path, seconds, stale=60):
+    with FileLock(path, stale=stale):
+        time.sleep(seconds)
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "database.json.lock")
+
+    # Touch the held locks more often than the stale time used below
+    interval = FileLock.REFRESH_INTERVAL
+    FileLock.REFRESH_INTERVAL = 0.1
+
+    try:
+        lock = FileLock(path, timeout=0)
+
+        with lock:
+            assert os.path.exists(path)
+
+            # The same thread can acquire the lock again
+            with FileLock(path, timeout=0):
+                pass
+
+            assert os.path.exists(path)
+
+        assert not os.path.exists(path)
+
+        # Locks held by another process time out
+        process = multiprocessing.Process(target=_testHold, args=(path, 2))
+        process.start()
+
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+        try:
+            FileLock(path, timeout=0.2).acquire()
+            assert False, "The lock should be held by the other process"
+        except LockError:
+            pass
+
+        process.join()
+
+        # Locks left behind by a process that has exited are stale
+        with open(path, "w") as f:
+            json.dump({"host": socket.gethostname(), "pid": process.pid}, f)
+
+        with FileLock(path, timeout=0):
+            assert FileLock(path).owner()["pid"] == os.getpid()
+
+        # Old locks are stale
+        with open(path, "w") as f:
+            f.write("")
+
+        os.utime(path, (time.time() - 120, time.time() - 120))
+
+        with FileLock(path, timeout=0):
+            pass
+
+        # Locks held by a live process on this machine are not stale
+        process = multiprocessing.Process(target=_testHold, args=(path, 2, 0.5))
+        process.start()
+
+        while not FileLock(path).owner():
+            time.sleep(0.01)
+
+        try:
+            FileLock(path, timeout=1, stale=0.5).acquire()
+            assert False, "The lock should be held by the other process"
+        except LockError:
+            pass
+
+        process.join()
+
+        # Locks held for longer than the stale time are touched
+        with FileLock(path, timeout=0) as lock:
+            # Check the lock like a process on another machine
+            owner = lock.owner()
+            owner["host"] = "other"
+
+            with open(path, "w") as f:
+                json.dump(owner, f)
+
+            time.sleep(1)
+            assert not FileLock(path, stale=0.5).isStale()
+
+        # Locks that are not stale anymore are put back when broken
+        with FileLock(path, timeout=0):
+            owner = FileLock(path).owner()
+            assert not FileLock(path).breakLock()
+            assert FileLock(path).owner() == owner
+    finally:
+        FileLock.REFRESH_INTERVAL = interval
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -20,6 +20,7 @@ from studiovendor.Qt import QtWidgets
 import studioqt
 import studiolibrary
 import studiolibrary.widgets
+import studiolibrary.statcache
 
 
 class FolderItem(studiolibrary.LibraryItem):
@@ -85,7 +86,7 @@ class FolderItem(studiolibrary.LibraryItem):
         :type path: str 
         :rtype: bool 
         """
-        if os.path.isdir(path):
+        if studiolibrary.statcache.isdir(path):
             return True
 
     def itemData(self):
@@ -0,0 +1,126 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+
+from studiovendor import six
+
+import studiolibrary
+
+
+__all__ = [
+    "ItemRecord",
+]
+
+
+class ItemRecord(object):
+
+    __slots__ = ["_path", "_className", "_itemData", "_item", "_searchText", "_sortKeys"]
+
+    def __init__(self, path, itemData):
+        """
+        A lightweight record of the item data for a path in the library.
+
+        Records are used for searching, sorting and grouping. The
+        LibraryItem is only created when a result needs to be shown
+        or used, see Library.itemFromRecord.
+
+        :type path: str
+        :type itemData: dict
+        """
+        self._path = path
+        self._className = itemData.get("__class__")
+        self._itemData = itemData
+        self._item = None
+        self._searchText = None
+        self._sortKeys = None
+
+    def __repr__(self):
+        return "ItemRecord({0!r})".format(self._path)
+
+    def path(self):
+        """
+        Get the path for the record.
+
+        :rtype: str
+        """
+        return self._path
+
+    def className(self):
+        """
+        Get the module path of the item class, e.g. "mod.AnimItem".
+
+        This is None for older databases without the "__class__" key.
+
+        :rtype: str or None
+        """
+        return self._className
+
+    def itemData(self):
+        """
+        Get the item data for the record.
+
+        :rtype: dict
+        """
+        return self._itemData
+
+    def searchText(self):
+        """
+        Get the lowercase text of the item data used by the "*" search filter.
+
+        The text is created on first use. The item data of a record is
+        never changed in place. Library.updateRecords replaces the record,
+        and its search index entry, when the item data read has changed.
+
+        :rtype: str
+        """
+        if self._searchText is None:
+            self._searchText = six.text_type(self._itemData).lower()
+        return self._searchText
+
+    def sortKey(self, field):
+        """
+        Get the key used to sort the record by the given field.
+
+        The key is created on first use, see studiolibrary.naturalSortKey.
+        The keys are replaced with the search text, see searchText.
+
+        :type field: str
+        :rtype: tuple
+        """
+        keys = self._sortKeys
+
+        if keys is None:
+            keys = self._sortKeys = {}
+
+        key = keys.get(field)
+
+        if key is None:
+            key = keys[field] = studiolibrary.naturalSortKey(self._itemData.get(field))
+
+        return key
+
+    def item(self):
+        """
+        Get the item created for the record.
+
+        :rtype: studiolibrary.LibraryItem or None
+        """
+        return self._item
+
+    def setItem(self, item):
+        """
+        Set the item created for the record.
+
+        :type item: studiolibrary.LibraryItem
+        :rtype: None
+        """
+        self._item = item
@@ -15,12 +15,35 @@ import copy
 import re
 import time
 import logging
+import threading
 import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# Use the built-in version of scandir if possible, otherwise
+# use the scandir module version or fallback to os.listdir
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from studiovendor import six
 from studiovendor.Qt import QtCore
 
 import studiolibrary
+import studiolibrary.database
+import studiolibrary.snapshot
+import studiolibrary.metadataindex
+import studiolibrary.itemrecord
+import studiolibrary.searchindex
+import studiolibrary.searchworker
+import studiolibrary.watcher
+import studiolibrary.syncworker
+import studiolibrary.statcache
+import studiolibrary.replica
 
 
 __all__ = [
@@ -75,7 +98,31 @@ class Library(QtCore.QObject):
         },
     ]
 
+    # Paths that are always ignored in addition to the config "ignorePaths"
+    IGNORE_PATHS = [
+        "*/.*",
+        "*.python",
+        "*.playblast",
+        "*.playblast_settings",
+    ]
+
+    # The filter conditions supported by match and compileQueries
+    CONDITIONS = ["contains", "not_contains", "is", "not", "startswith"]
+
+    # The number of records matched between checks for a newer search
+    SEARCH_CHUNK_SIZE = 2000
+
+    # How often to check if the search thread has finished (ms)
+    SEARCH_POLL_INTERVAL = 10
+
+    _ignoreRegex = None
+    _ignorePatterns = None
+
     dataChanged = QtCore.Signal()
+    itemsAdded = QtCore.Signal(object)
+    itemsRemoved = QtCore.Signal(object)
+    itemsChanged = QtCore.Signal(object)
+    syncFinished = QtCore.Signal()
     searchStarted = QtCore.Signal()
     searchFinished = QtCore.Signal()
     searchTimeFinished = QtCore.Signal()
@@ -85,8 +132,28 @@ class Library(QtCore.QObject):
 
         self._path = path
         self._mtime = None
+        self._dirty = True
         self._data = {}
-        self._items = []
+        self._diff = None
+        self._readPaths = None
+        self._database = None
+        self._watcher = None
+        self._replica = None
+        self._replicaRefresher = None
+        self._syncTimer = None
+        self._syncWorker = None
+        self._syncCallback = None
+        self._syncCounters = {}
+        self._syncData = {}
+        self._records = []
+        self._recordsData = None
+        self._searchIndex = None
+        self._searchIndexThread = None
+        self._lastSearch = None
+        self._searchWorker = None
+        self._searchTimer = None
+        self._searchDelayTimer = None
+        self._classes = {}
         self._fields = []
         self._sortBy = []
         self._groupBy = []
@@ -211,7 +278,16 @@ class Library(QtCore.QObject):
 
         :type path: str
         """
+        self.stopWatcher()
+        self.stopReplica()
+        self.cancelSync(wait=True)
+
         self._path = path
+        self._database = None
+
+        if path:
+            self.startReplica()
+            self.startWatcher()
 
     def databasePath(self):
         """
@@ -222,6 +298,142 @@ class Library(QtCore.QObject):
         formatString = studiolibrary.config.get('databasePath')
         return studiolibrary.formatPath(formatString, path=self.path())
 
+    def database(self):
+        """
+        Get the storage backend for the library set in the config.
+
+        :rtype: studiolibrary.database.Database
+        """
+        if not self._database:
+            self._database = studiolibrary.database.createDatabase(
+                self.databasePath(),
+                root=self.path(),
+            )
+
+            if self._replica:
+                self._database = studiolibrary.replica.ReplicaDatabase(
+                    self._database,
+                    self._replica,
+                )
+
+        return self._database
+
+    def replica(self):
+        """
+        Get the local read replica of the library if one has been started.
+
+        :rtype: studiolibrary.replica.Replica or None
+        """
+        return self._replica
+
+    def startReplica(self):
+        """
+        Read the database and the item previews from a local copy.
+
+        The replica is enabled with the "replicaEnabled" config value and
+        is refreshed in a background thread every "replicaRefreshInterval"
+        milliseconds and after every change. Changes are still written to
+        the database at the library path.
+
+        :rtype: None
+        """
+        self.stopReplica()
+
+        if not studiolibrary.config.get("replicaEnabled", False):
+            return
+
+        self._replica = studiolibrary.replica.Replica(self.path(), self.databasePath())
+        self._database = None
+
+        interval = studiolibrary.config.get("replicaRefreshInterval", 30000)
+
+        self._replicaRefresher = studiolibrary.replica.ReplicaRefresher(
+            self._replica,
+            database=self.database().createLocal(),
+            interval=interval / 1000.0,
+            origin=self.database().origin(),
+        )
+        self._replicaRefresher.start()
+
+    def stopReplica(self):
+        """
+        Stop refreshing the replica and read from the library path again.
+
+        :rtype: None
+        """
+        if self._replicaRefresher:
+            self._replicaRefresher.stop()
+            self._replicaRefresher = None
+
+        if self._replica:
+            self._replica = None
+            self._database = None
+
+    def watcher(self):
+        """
+        Get the watcher for the database if one has been started.
+
+        :rtype: studiolibrary.watcher.DatabaseWatcher or None
+        """
+        return self._watcher
+
+    def startWatcher(self):
+        """
+        Watch the database for changes made by other users.
+
+        The watcher is set with the "databaseWatcher" config value and
+        needs a running Qt application to receive events. Without a
+        watcher the database mtime is checked on every read.
+
+        :rtype: None
+        """
+        self.stopWatcher()
+
+        mode = studiolibrary.config.get("databaseWatcher", "auto")
+        interval = studiolibrary.config.get("databasePollInterval", 5000)
+
+        # The watcher needs the event loop of the thread for the library
+        if not QtCore.QCoreApplication.instance():
+            return
+
+        if QtCore.QThread.currentThread() != self.thread():
+            return
+
+        if mode:
+            self._watcher = studiolibrary.watcher.DatabaseWatcher(
+                self.database(),
+                mode=mode,
+                interval=interval,
+                parent=self,
+            )
+            self._watcher.changed.connect(self._databaseChanged)
+            self._watcher.start()
+
+    def stopWatcher(self):
+        """
+        Stop watching the database for changes.
+
+        :rtype: None
+        """
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher.changed.disconnect(self._databaseChanged)
+            self._watcher.deleteLater()
+            self._watcher = None
+
+    def _databaseChanged(self):
+        """
+        Triggered when the watcher finds a change to the database.
+
+        Changes saved by this library have already set the dirty flag.
+
+        :rtype: None
+        """
+        if self._mtime is not None and self._mtime != self.mtime():
+            logger.debug("The database has been changed by another process")
+            self.setDirty(True)
+            self.emitDataChanged()
+
     def distinct(self, field, queries=None, sortBy="name"):
         """
         Get all the values for the given field.
@@ -235,13 +447,14 @@ class Library(QtCore.QObject):
         queries = queries or []
         queries.extend(self._globalQueries.values())
 
-        items = self.createItems()
-        for item in items:
-            value = item.itemData().get(field)
+        match = self.compileQueries(queries)
+
+        records = self.createRecords()
+        for record in records:
+            value = record.itemData().get(field)
             if value:
                 results.setdefault(value, {'count': 0, 'name': value})
-                match = self.match(item.itemData(), queries)
-                if match:
+                if match(record.itemData()):
                     results[value]['count'] += 1
 
         def sortKey(facet):
@@ -255,13 +468,7 @@ class Library(QtCore.QObject):
 
         :rtype: float or None
         """
-        path = self.databasePath()
-        mtime = None
-
-        if os.path.exists(path):
-            mtime = os.path.getmtime(path)
-
-        return mtime
+        return self.database().mtime()
 
     def setDirty(self, value):
         """
@@ -269,6 +476,8 @@ class Library(QtCore.QObject):
 
         :type: bool
         """
+        self._dirty = value
+
         if value:
             self._mtime = None
         else:
@@ -278,46 +487,139 @@ class Library(QtCore.QObject):
         """
         Return True if the database has changed on disc.
 
+        When the database is being watched only the dirty flag is checked.
+
+        :rtype: bool
+        """
+        if self._watcher:
+            return not self._records or self._dirty
+
+        return not self._records or self._mtime != self.mtime()
+
+    def isRead(self, paths=None):
+        """
+        Check if the item data under the given paths has been read.
+
+        :type paths: list[str] or None
         :rtype: bool
         """
-        return not self._items or self._mtime != self.mtime()
+        if self._readPaths is None:
+            return True
 
-    def read(self):
+        return paths is not None and set(paths) <= set(self._readPaths)
+
+    def read(self, paths=None):
         """
         Read the database from disc and return a dict object.
 
+        The paths can be used to only read the item data under the given
+        folders when the database backend supports it, see queryPaths.
+
+        :type paths: list[str] or None
         :rtype: dict
         """
         if self.path():
-            if self.isDirty():
-                self._data = studiolibrary.readJson(self.databasePath())
+            if self.isDirty() or not self.isRead(paths):
+                self._data = self.database().read(paths)
+                self._readPaths = paths
                 self.setDirty(False)
         else:
             logger.info('No path set for reading the data from disc.')
 
         return self._data
 
-    def save(self, data):
+    def save(self, data, base=None):
         """
         Write the given dict object to the database on disc.
 
+        Use base for the data that was read before making the changes,
+        so that changes saved by other users since are merged by item.
+
         :type data: dict
+        :type base: dict or None
         :rtype: None
         """
         if self.path():
-            studiolibrary.saveJson(self.databasePath(), data)
+            self.database().save(data, base=base)
             self.setDirty(True)
-            self.updatePermissions(self.databasePath())
+            self.updatePermissions(self.database().path())
         else:
             logger.info('No path set for saving the data to disc.')
 
+    @staticmethod
+    def diffData(old, new):
+        """
+        Get the paths that were added, removed and changed from old to new.
+
+        Example:
+            diff = Library.diffData(old, new)
+            print(diff["added"], diff["removed"], diff["changed"])
+
+        :type old: dict
+        :type new: dict
+        :rtype: dict
+        """
+        added = []
+        changed = []
+
+        for path, itemData in new.items():
+            oldData = old.get(path)
+
+            if oldData is None:
+                added.append(path)
+            elif oldData is not itemData and oldData != itemData:
+                changed.append(path)
+
+        removed = [path for path in old if path not in new]
+
+        return {"added": added, "removed": removed, "changed": changed}
+
+    def dataDiff(self):
+        """
+        Get the paths that changed while the dataChanged signal is emitted.
+
+        This is None when the change is unknown and all the data should
+        be updated, e.g. when the database was changed by another user.
+
+        :rtype: dict or None
+        """
+        return self._diff
+
+    def emitDataChanged(self, diff=None):
+        """
+        Emit the item signals for the given diff and then dataChanged.
+
+        :type diff: dict or None
+        :rtype: None
+        """
+        self._diff = diff
+        self._lastSearch = None
+
+        try:
+            if diff:
+                if diff.get("added"):
+                    self.itemsAdded.emit(diff["added"])
+                if diff.get("removed"):
+                    self.itemsRemoved.emit(diff["removed"])
+                if diff.get("changed"):
+                    self.itemsChanged.emit(diff["changed"])
+
+            self.dataChanged.emit()
+        finally:
+            self._diff = None
+
     def clear(self):
         """Clear all the item data."""
-        self._items = []
+        self.cancelSearch()
+
+        self._records = []
+        self._searchIndex = None
+        self._searchIndexThread = None
+        self._lastSearch = None
         self._results = []
         self._groupedResults = {}
         self._registeredItems = None
-        self.dataChanged.emit()
+        self.emitDataChanged()
 
     def registeredItems(self):
         """
@@ -327,6 +629,33 @@ class Library(QtCore.QObject):
         """
         return studiolibrary.registeredItems()
 
+    @classmethod
+    def ignorePathsRegex(cls):
+        """
+        Get the compiled regex for the ignore paths.
+
+        The config patterns and the built-in IGNORE_PATHS are compiled into
+        a single regex that is only compiled again when the config changes.
+
+        :rtype: re.Pattern
+        """
+        patterns = studiolibrary.config.get('ignorePaths', [])
+        patterns = tuple(patterns) + tuple(cls.IGNORE_PATHS)
+
+        if patterns != cls._ignorePatterns:
+            # Paths are normalized to forward slashes before matching
+            regex = "|".join(
+                fnmatch.translate(p.replace("\\", "/")) for p in patterns
+            )
+
+            # Match the case sensitivity of fnmatch for the current platform
+            flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+
+            cls._ignoreRegex = re.compile(regex or "(?!)", flags)
+            cls._ignorePatterns = patterns
+
+        return cls._ignoreRegex
+
     def isValidPath(self, path):
         """
         Check if the given item path should be ignored.
@@ -334,214 +663,1187 @@ class Library(QtCore.QObject):
         :type path: str
         :rtype: bool
         """
-        patterns = studiolibrary.config.get('ignorePaths', [])
-        patterns.append("*/.*")
-        patterns.append("*.python")
-        patterns.append("*.playblast")
-        patterns.append("*.playblast_settings")
+        return not self.ignorePathsRegex().match(path)
 
-        for pattern in patterns:
-            if fnmatch.fnmatch(path, pattern):
-                return False
-        return True
+    def listDirectory(self, path, snapshot):
+        """
+        Stat and list the valid children of the given directory.
+
+        The children are taken from the snapshot if the directory hasn't
+        changed. This method is called from the walker worker threads.
+        The stat and the listing are added to the active stat cache.
+
+        :type path: str
+        :type snapshot: studiolibrary.snapshot.Snapshot
+        :rtype: (os.stat_result or None, list[list] or None, bool)
+        """
+        statCache = studiolibrary.statcache.current()
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+
+        if statCache:
+            statCache.addStat(path, stat)
+
+        if stat is None:
+            return None, None, False
 
-    def walker(self, path):
+        children = snapshot.children(path, stat)
+        if children is not None:
+            return stat, children, True
+
+        try:
+            if scandir:
+                entries = [(e.name, e) for e in scandir(path)]
+            else:
+                entries = [(name, None) for name in os.listdir(path)]
+        except OSError as error:
+            logger.warning("Cannot list directory: %s", error)
+            return stat, None, False
+
+        listing = []
+        entries_ = dict(entries)
+
+        for filename, entry in entries:
+            try:
+                isdir = entry.is_dir() if entry else None
+            except OSError:
+                isdir = False
+            listing.append((filename, isdir))
+
+        if statCache:
+            statCache.addListing(path, listing)
+
+        children = []
+
+        for filename, isdir in sorted(listing, key=lambda e: e[0]):
+
+            # Normalise the path for consistent matching
+            path_ = studiolibrary.normPath(path + "/" + filename)
+
+            # Ignore any paths that have been specified in the config
+            if not self.isValidPath(path_):
+                continue
+
+            # Match the path with a registered item
+            cls = self.itemClassFromPath(path_)
+            className = cls.__name__ if cls else None
+
+            if isdir is None:
+                isdir = studiolibrary.statcache.isdir(path_)
+
+            # The stat from scandir is free on Windows
+            elif statCache and os.name == "nt":
+                try:
+                    statCache.addStat(path_, entries_[filename].stat())
+                except OSError as error:
+                    # The entry was removed since the directory was listed
+                    logger.debug("Cannot stat path: %s", error)
+                    continue
+
+            children.append([filename, className, isdir])
+
+        return stat, children, False
+
+    def walker(
+            self,
+            path,
+            snapshot=None,
+            cache=None,
+            processes=0,
+            statCache=None,
+            isCancelled=None,
+            metadataIndex=None,
+    ):
         """
         Walk the given root path for valid items and return the item data.
 
+        The directories are listed in parallel using the number of threads
+        set by "syncWorkerCount" in the config. The item data for the
+        children of each directory is returned as soon as the directory
+        has been listed. The directories finish in the order of how long
+        each listing takes, so the item data returned for each directory
+        or batch is sorted by path. Library.sync sorts all the item data
+        so that syncing the same tree always gives the same order. The
+        walk stops between directories when isCancelled returns True.
+
+        When processes is greater than 1 the item data is created in a
+        pool of worker processes. The items from many directories are sent
+        to the pool in batches of "syncProcessBatchSize" so that the
+        workers aren't waiting on each directory. See Library.sync.
+
+        The listings and stats are added to the given stat cache so that
+        creating the item data doesn't have to ask the file system again.
+
+        The metadata files are only read when their mtime is different
+        from the record in the given metadata index. The records used are
+        set in the index for the next sync.
+
+        When a snapshot from a previous sync is given, directories with an
+        unchanged mtime and inode are not listed again, and the item data
+        for their children is taken from the given cache. Only the
+        directories are checked, so no file system calls are made for
+        the items in them. Studio Library saves, renames and removes items
+        by moving them, which changes the directory. The items with
+        metadata saved since the last sync are found with the metadata
+        index, see studiolibrary.metadataindex. Changes made to the files
+        inside an item by other tools need a full sync.
+
         :type path: str
+        :type snapshot: studiolibrary.snapshot.Snapshot or None
+        :type cache: dict or None
+        :type processes: int
+        :type statCache: studiolibrary.statcache.StatCache or None
+        :type isCancelled: callable or None
+        :type metadataIndex: studiolibrary.metadataindex.MetadataIndex or None
 
         :rtype: collections.Iterable[dict]
         """
         path = studiolibrary.normPath(path)
         maxDepth = self.recursiveDepth()
-        startDepth = path.count(os.path.sep)
 
-        for root, dirs, files in os.walk(path, followlinks=True):
+        cache = cache or {}
+        snapshot = snapshot or studiolibrary.snapshot.Snapshot(path)
+        statCache = statCache or studiolibrary.statcache.StatCache()
+        metadataIndex = metadataIndex or studiolibrary.metadataindex.MetadataIndex(path)
 
-            files.extend(dirs)
+        classes = {}
+        for cls in self.registeredItems():
+            classes[cls.__name__] = cls
 
-            for filename in files:
+        workers = int(studiolibrary.config.get("syncWorkerCount", 1) or 1)
+        pool = ThreadPool(workers) if workers > 1 else None
 
-                # Normalise the path for consistent matching
-                path = studiolibrary.normPath(os.path.join(root, filename))
+        processPool = multiprocessing.Pool(processes) if processes > 1 else None
+        batchSize = int(studiolibrary.config.get("syncProcessBatchSize", 1000) or 1)
 
-                # Ignore any paths that have been specified in the config
-                remove = False
-                if not self.isValidPath(path):
-                    remove = True
-                else:
-                    # Match the path with a registered item
-                    item = self.itemFromPath(path)
-                    if item:
+        # The listed directories in the order they finish
+        results = six.moves.queue.Queue()
 
-                        # Yield the item data that matches the current path
-                        yield item.createItemData()
+        def listDirectory(args):
+            # Errors are returned so that the walk doesn't wait for them
+            try:
+                with statCache.activate():
+                    return args, self.listDirectory(args[0], snapshot)
+            except Exception as error:
+                return args, error
 
-                        # Stop walking if the item doesn't support nested items
-                        if not item.ENABLE_NESTED_ITEMS:
-                            remove = True
+        def submit(args):
+            if pool:
+                pool.apply_async(listDirectory, (args,), callback=results.put)
+            else:
+                results.put(listDirectory(args))
 
-                if remove and filename in dirs:
-                    dirs.remove(filename)
+        # Each directory is (path, depth, cls). Nested items are created
+        # after listing so that their own stat can be checked.
+        submit((path, 0, None))
+        pending = 1
 
-            if maxDepth == 1:
-                break
+        # The items of the listed directories waiting to be created
+        batch = []
 
-            # Stop walking the directory if the maximum depth has been reached
-            currentDepth = root.count(os.path.sep)
-            if (currentDepth - startDepth) >= maxDepth:
-                del dirs[:]
+        try:
+            while pending:
+                if isCancelled and isCancelled():
+                    return
 
-    def sync(self, progressCallback=None):
-        """
-        Sync the file system with the database.
+                (root, depth, cls), result = results.get()
+                pending -= 1
 
-        :type progressCallback: None or func
-        """
-        if not self.path():
-            logger.info('No path set for syncing data')
-            return
+                if isinstance(result, Exception):
+                    raise result
 
-        if progressCallback:
-            progressCallback("Syncing")
+                stat, children, unchanged = result
 
-        new = {}
-        old = self.read()
-        items = list(self.walker(self.path()))
-        count = len(items)
+                if stat is None:
+                    continue
 
-        for i, item in enumerate(items):
-            percent = (float(i+1)/float(count))
-            if progressCallback:
-                percent *= 100
-                label = "{0:.0f}%".format(percent)
-                progressCallback(label, percent)
+                # The item data or the (cls, path) to create it
+                items = []
 
-            path = item.get("path")
-            new[path] = old.get(path, {})
-            new[path].update(item)
+                if cls:
+                    if unchanged and root in cache and not metadataIndex.isChanged(root):
+                        metadataIndex.setRecord(root, metadataIndex.record(root))
+                        items.append(cache[root])
+                    else:
+                        items.append((cls, root))
+
+                if children is not None:
+                    snapshot.setChildren(root, stat, children)
+
+                # Stop walking the directory if the maximum depth has been reached
+                walk = maxDepth != 1 and depth < maxDepth
+
+                for filename, className, isdir in children or []:
+
+                    path = root + "/" + filename
+                    cls = classes.get(className)
+
+                    # Stop walking if the item doesn't support nested items
+                    if cls and not cls.ENABLE_NESTED_ITEMS:
+                        isdir = False
+
+                    if walk and isdir:
+                        submit((path, depth + 1, cls))
+                        pending += 1
+                        continue
+
+                    if not cls:
+                        continue
+
+                    # Add the item data that matches the current path
+                    if unchanged and path in cache and not metadataIndex.isChanged(path):
+                        metadataIndex.setRecord(path, metadataIndex.record(path))
+                        items.append(cache[path])
+                    else:
+                        items.append((cls, path))
+
+                batch.extend(items)
+
+                if processPool and len(batch) < batchSize:
+                    continue
+
+                items = self.createItemData(
+                    batch,
+                    processPool,
+                    processes,
+                    statCache,
+                    metadataIndex,
+                )
+
+                batch = []
+
+                for itemData in sorted(items, key=self.itemDataPath):
+                    yield itemData
+
+            items = self.createItemData(
+                batch,
+                processPool,
+                processes,
+                statCache,
+                metadataIndex,
+            )
+
+            for itemData in sorted(items, key=self.itemDataPath):
+                yield itemData
+        finally:
+            # Drop the directories that haven't been listed when cancelled
+            if pool:
+                pool.terminate()
+                pool.join()
+
+            if processPool:
+                processPool.close()
+                processPool.join()
+
+    def createItemData(
+            self,
+            items,
+            processPool=None,
+            processes=1,
+            statCache=None,
+            metadataIndex=None,
+    ):
+        """
+        Create the item data for the given items in order.
+
+        Each item is either existing item data or a (cls, path) tuple.
+        When a process pool is given, the item data for classes that
+        don't override LibraryItem.createItemData is created with
+        studiolibrary.createItemDataFromArgs in the worker processes.
+
+        The metadata records of the items are taken from the given
+        metadata index, and the records used are set in it.
+
+        :type items: list[dict or (LibraryItem.__class__, str)]
+        :type processPool: multiprocessing.pool.Pool or None
+        :type processes: int
+        :type statCache: studiolibrary.statcache.StatCache or None
+        :type metadataIndex: studiolibrary.metadataindex.MetadataIndex or None
+        :rtype: collections.Iterable[dict]
+        """
+        statCache = statCache or studiolibrary.statcache.StatCache()
+        metadataIndex = metadataIndex or studiolibrary.metadataindex.MetadataIndex(self.path())
+        results = {}
 
-        if progressCallback:
-            progressCallback("Post Callbacks")
+        if processPool:
+            metadataPath = studiolibrary.config.get("metadataPath")
 
-        self.postSync(new)
+            args = []
 
-        if progressCallback:
-            progressCallback("Saving Cache")
+            for item in items:
+                if isinstance(item, tuple):
+                    cls, path = item
+                    if not studiolibrary.isItemDataOverridden(cls):
+                        className = cls.__module__ + "." + cls.__name__
+                        record = metadataIndex.record(path)
+                        args.append((path, className, cls.TYPE, metadataPath, record))
 
-        self.save(new)
+            if args:
+                # Send a few chunks to each process to balance the load
+                chunksize = max(1, len(args) // (processes * 4))
+                values = processPool.imap_unordered(
+                    studiolibrary.createItemDataFromArgs,
+                    args,
+                    chunksize,
+                )
 
-        self.dataChanged.emit()
+                # The results finish in any order so merge them by path
+                for path, itemData, record in values:
+                    results[path] = (itemData, record)
 
-    def postSync(self, data):
+        for item in items:
+            if isinstance(item, tuple) and item[1] in results:
+                itemData, record = results[item[1]]
+                metadataIndex.setRecord(item[1], record)
+                yield itemData
+            elif isinstance(item, tuple):
+                cls, path = item
+                item = cls(path)
+                item.setMetadataRecord(metadataIndex.record(path))
+                with statCache.activate():
+                    itemData = item.createItemData()
+                metadataIndex.setRecord(path, item.metadataRecord())
+                yield itemData
+            else:
+                yield item
+
+    def snapshotPath(self):
         """
-        Use this function to execute code on the data after sync, but before save and dataChanged.emit
+        Get the path to the directory snapshot used for incremental syncs.
 
-        :type data: dict
-        :rtype: None
+        :rtype: str
         """
-        pass
+        dirname = os.path.dirname(self.database().path())
+        return dirname + "/snapshot.json"
 
-    def createItems(self):
+    def snapshot(self):
         """
-        Create all the items for the model.
+        Create the directory snapshot used for incremental syncs.
 
-        :rtype: list[studiolibrary.LibraryItem] 
+        :rtype: studiolibrary.snapshot.Snapshot
         """
-        # Check if the cache has changed since the last read call
-        if self.isDirty():
+        signature = [
+            [cls.__module__ + "." + cls.__name__ for cls in self.registeredItems()],
+            studiolibrary.config.get("ignorePaths", []),
+        ]
 
-            logger.debug("Creating items")
+        snapshot = studiolibrary.snapshot.Snapshot(
+            self.path(),
+            path=self.snapshotPath(),
+            signature=repr(signature),
+        )
 
-            self._items = []
+        return snapshot
 
-            data = self.read()
+    def metadataIndexPath(self):
+        """
+        Get the path to the index of the item metadata files.
 
-            modules = []
-            for itemData in data.values():
-                if '__class__' in itemData:
-                    modules.append(itemData.get("__class__"))
-            modules = set(modules)
+        :rtype: str
+        """
+        dirname = os.path.dirname(self.database().path())
+        return dirname + "/metadataindex.json"
 
-            classes = {}
-            for module in modules:
-                classes[module] = studiolibrary.resolveModule(module)
+    def metadataIndex(self):
+        """
+        Create the index of the item metadata files.
 
-            for path in data.keys():
-                module = data[path].get("__class__")
-                cls = classes.get(module)
-                if cls:
-                    item = cls(path, library=self, libraryWindow=self._libraryWindow)
-                    item.setItemData(data[path])
-                    self._items.append(item)
-                else:
-                    # This is to support the older database data before v2.6.
-                    # Will remove in a later version.
-                    item = self.itemFromPath(path, library=self, libraryWindow=self._libraryWindow)
-                    if item:
-                        item.setItemData(data[path])
-                        self._items.append(item)
+        :rtype: studiolibrary.metadataindex.MetadataIndex
+        """
+        return studiolibrary.metadataindex.MetadataIndex(
+            self.path(),
+            path=self.metadataIndexPath(),
+        )
 
-        return self._items
+    def createSyncMetadataIndex(self):
+        """
+        Create and read the metadata index for a new sync.
 
-    def itemFromPath(self, path, **kwargs):
+        :rtype: studiolibrary.metadataindex.MetadataIndex
         """
-        Return a new item instance for the given path.
+        metadataIndex = self.metadataIndex()
+        metadataIndex.read()
+        return metadataIndex
 
-        :type path: str
-        :rtype: studiolibrary.LibraryItem or None
+    def createSyncSnapshot(self, incremental=None):
         """
-        path = studiolibrary.normPath(path)
+        Create the snapshot for a new sync.
 
-        for cls in self.registeredItems():
-            if cls.match(path):
-                return cls(path, **kwargs)
+        The previous snapshot is only read when syncing incrementally.
 
-    def itemsFromPaths(self, paths, **kwargs):
+        :type incremental: bool or None
+        :rtype: studiolibrary.snapshot.Snapshot
         """
-        Return new item instances for the given paths.
+        if incremental is None:
+            incremental = studiolibrary.config.get("incrementalSyncEnabled", True)
 
-        :type paths: list[str]:
-        :rtype: collections.Iterable[studiolibrary.LibraryItem]
-        """
-        for path in paths:
-            item = self.itemFromPath(path, **kwargs)
-            if item:
-                yield item
+        snapshot = self.snapshot()
+        if incremental:
+            snapshot.read()
 
-    def itemsFromUrls(self, urls, **kwargs):
+        return snapshot
+
+    @staticmethod
+    def itemDataPath(itemData):
         """
-        Return new item instances for the given QUrl objects.
+        Get the path of the given item data for sorting the synced items.
 
-        :type urls: list[QtGui.QUrl]
-        :rtype: list[studiolibrary.LibraryItem]
+        :type itemData: dict
+        :rtype: str
         """
-        items = []
-        for path in studiolibrary.pathsFromUrls(urls):
+        return itemData.get("path", "")
 
-            item = self.itemFromPath(path, **kwargs)
+    @staticmethod
+    def mergeSyncData(new, old, items):
+        """
+        Merge the item data from the walker into the new data.
 
-            if item:
-                data = item.createItemData()
-                item.setItemData(data)
+        Any custom values for an item in the old data are kept.
 
-                items.append(item)
+        :type new: dict
+        :type old: dict
+        :type items: list[dict]
+        :rtype: None
+        """
+        for item in items:
+            path = item.get("path")
+            if old.get(path) is item:
+                new[path] = item
             else:
-                msg = 'Cannot find the item for path "{0}"'
-                msg = msg.format(path)
-                logger.warning(msg)
+                new[path] = dict(old.get(path, {}))
+                new[path].update(item)
+
+    def finishSync(
+            self,
+            new,
+            old,
+            snapshot,
+            progressCallback=None,
+            statCache=None,
+            metadataIndex=None,
+    ):
+        """
+        Run the post sync callbacks and save the new data if it has changed.
+
+        Returns the paths that were added, removed and changed compared
+        to the data being shown, see diffData.
+
+        :type new: dict
+        :type old: dict
+        :type snapshot: studiolibrary.snapshot.Snapshot
+        :type progressCallback: None or func
+        :type statCache: studiolibrary.statcache.StatCache or None
+        :type metadataIndex: studiolibrary.metadataindex.MetadataIndex or None
+        :rtype: dict
+        """
+        if statCache:
+            self._syncCounters = statCache.counters()
 
-        return items
+            msg = "Sync avoided %s of %s file system calls"
+            avoided = self._syncCounters["avoided"]
+            logger.info(msg, avoided, avoided + self._syncCounters["calls"])
 
-    def findItems(self, queries):
+        if progressCallback:
+            progressCallback("Post Callbacks")
+
+        self.postSync(new)
+
+        if progressCallback:
+            progressCallback("Saving Cache")
+
+        # The data being shown includes the items found by a background sync
+        diff = self.diffData(self._data, new)
+
+        if new != old or not self.database().exists():
+            self.save(new, base=old)
+
+        snapshot.save()
+
+        if metadataIndex:
+            metadataIndex.save()
+
+        self.emitDataChanged(diff)
+
+        return diff
+
+    def sync(self, progressCallback=None, incremental=None, processes=0):
         """
-        Get the items that match the given queries.
-        
-        Examples:
-            
-            queries = [
-                {
+        Sync the file system with the database.
+
+        Use processes to create the item data in a pool of worker
+        processes when rebuilding very large libraries headless, e.g.
+        from a cron job using mayapy or python. This should not be used
+        from within the Maya UI. The script calling this needs a
+        "if __name__ == '__main__'" guard on Windows.
+
+        :type progressCallback: None or func
+        :type incremental: bool or None
+        :type processes: int
+        :rtype: dict or None
+        """
+        if not self.path():
+            logger.info('No path set for syncing data')
+            return None
+
+        if progressCallback:
+            progressCallback("Syncing")
+
+        new = collections.OrderedDict()
+        old = self.read()
+        snapshot = self.createSyncSnapshot(incremental)
+        statCache = studiolibrary.statcache.StatCache()
+        metadataIndex = self.createSyncMetadataIndex()
+
+        items = self.walker(
+            self.path(),
+            snapshot=snapshot,
+            cache=old,
+            processes=processes,
+            statCache=statCache,
+            metadataIndex=metadataIndex,
+        )
+        items = sorted(items, key=self.itemDataPath)
+        count = len(items)
+
+        for i, item in enumerate(items):
+            percent = (float(i+1)/float(count))
+            if progressCallback:
+                percent *= 100
+                label = "{0:.0f}%".format(percent)
+                progressCallback(label, percent)
+
+            self.mergeSyncData(new, old, [item])
+
+        return self.finishSync(
+            new,
+            old,
+            snapshot,
+            progressCallback,
+            statCache,
+            metadataIndex,
+        )
+
+    def syncCounters(self):
+        """
+        Get the number of file system calls avoided by the last sync.
+
+        Example:
+            library.sync()
+            print(library.syncCounters())
+            # {"avoided": 1200, "calls": 300, "hits": {...}, "misses": {...}}
+
+        :rtype: dict
+        """
+        return dict(self._syncCounters)
+
+    def isSyncing(self):
+        """
+        Check if a sync is running in the background.
+
+        :rtype: bool
+        """
+        return self._syncWorker is not None
+
+    def startSync(self, progressCallback=None, incremental=None):
+        """
+        Sync the file system with the database in a background thread.
+
+        The item data found so far is shown every "syncBatchInterval"
+        milliseconds. The database is only saved once the walk has
+        finished. The syncFinished signal is emitted when the sync has
+        finished or has been cancelled. This needs a running event loop,
+        use the sync method otherwise.
+
+        :type progressCallback: None or func
+        :type incremental: bool or None
+        :rtype: studiolibrary.syncworker.SyncWorker or None
+        """
+        if not self.path():
+            logger.info('No path set for syncing data')
+            return None
+
+        if self.isSyncing():
+            return self._syncWorker
+
+        if progressCallback:
+            progressCallback("Syncing")
+
+        old = self.read()
+        snapshot = self.createSyncSnapshot(incremental)
+        metadataIndex = self.createSyncMetadataIndex()
+
+        self._syncData = {"new": {}, "old": old, "preview": dict(old)}
+        self._syncCallback = progressCallback
+
+        self._syncWorker = studiolibrary.syncworker.SyncWorker(
+            self,
+            snapshot,
+            old,
+            metadataIndex=metadataIndex,
+        )
+        self._syncWorker.start()
+
+        interval = studiolibrary.config.get("syncBatchInterval", 1000)
+
+        self._syncTimer = QtCore.QTimer(self)
+        self._syncTimer.timeout.connect(self._syncTimeout)
+        self._syncTimer.start(interval)
+
+        return self._syncWorker
+
+    def cancelSync(self, wait=False):
+        """
+        Cancel the background sync without saving any changes.
+
+        :type wait: bool
+        :rtype: None
+        """
+        worker = self._syncWorker
+        if worker:
+            worker.cancel()
+            if wait:
+                worker.join()
+                self._syncTimeout()
+
+    def _syncTimeout(self):
+        """
+        Triggered by the sync timer to merge the item data found so far.
+
+        :rtype: None
+        """
+        worker = self._syncWorker
+        if not worker:
+            return
+
+        finished = not worker.is_alive()
+        items = worker.takeItems()
+
+        if worker.isCancelled() or worker.error():
+            if finished:
+                self._syncFinished(worker)
+            return
+
+        if items:
+            data = self._syncData
+            new = {}
+
+            self.mergeSyncData(new, data["old"], items)
+            data["new"].update(new)
+
+            if self._syncCallback:
+                self._syncCallback("Syncing {0} items".format(len(data["new"])))
+
+            # Show the items found so far without saving them
+            if not finished:
+                diff = self.diffData(data["preview"], new)
+                diff["removed"] = []
+
+                data["preview"].update(new)
+                self.setData(data["preview"])
+                self.emitDataChanged(diff)
+
+        if finished:
+            self._syncFinished(worker)
+
+    def _syncFinished(self, worker):
+        """
+        Save the item data from the finished worker and emit syncFinished.
+
+        :type worker: studiolibrary.syncworker.SyncWorker
+        :rtype: None
+        """
+        data = self._syncData
+        callback = self._syncCallback
+
+        self._syncTimer.stop()
+        self._syncTimer.deleteLater()
+
+        self._syncTimer = None
+        self._syncWorker = None
+        self._syncCallback = None
+        self._syncData = {}
+
+        if worker.isCancelled() or worker.error():
+            self.setDirty(True)
+            self.emitDataChanged()
+        else:
+            # Sort the items found in the order the directories finished
+            new = collections.OrderedDict(sorted(data["new"].items()))
+
+            self.finishSync(
+                new,
+                data["old"],
+                worker.snapshot(),
+                callback,
+                worker.statCache(),
+                worker.metadataIndex(),
+            )
+
+        self.syncFinished.emit()
+
+    def setData(self, data):
+        """
+        Set the item data in memory without saving it to disc.
+
+        The records for item data that hasn't changed are kept.
+
+        :type data: dict
+        :rtype: None
+        """
+        self._data = data
+        self._readPaths = None
+
+        self.updateRecords(data)
+        self.setDirty(False)
+
+    def postSync(self, data):
+        """
+        Use this function to execute code on the data after sync, but before save and dataChanged.emit
+
+        :type data: dict
+        :rtype: None
+        """
+        pass
+
+    def createRecords(self, paths=None):
+        """
+        Create a lightweight record for each path in the database.
+
+        :type paths: list[str] or None
+        :rtype: list[studiolibrary.itemrecord.ItemRecord]
+        """
+        # Check if the cache has changed since the last read call. The
+        # data can also be read by other methods, e.g. isResultsChanged.
+        if self.isDirty() or not self.isRead(paths) or self._recordsData is not self._data:
+
+            logger.debug("Creating records")
+
+            self.updateRecords(self.read(paths))
+
+        return self._records
+
+    def updateRecords(self, data):
+        """
+        Update the records for the given item data.
+
+        The records, and the items created for them, are kept for the
+        item data that hasn't changed.
+
+        :type data: dict
+        :rtype: None
+        """
+        # The search thread reads the records, so search again after
+        if self._searchWorker is not None:
+            self.startSearch()
+
+        records = {}
+        for record in self._records:
+            records[record.path()] = record
+
+        self._records = []
+        added = []
+        fields = set()
+
+        for path, itemData in data.items():
+            record = records.pop(path, None)
+
+            if record is None or (
+                record.itemData() is not itemData and record.itemData() != itemData
+            ):
+                if record is not None:
+                    records[path] = record
+
+                record = studiolibrary.itemrecord.ItemRecord(path, itemData)
+                added.append(record)
+
+            self._records.append(record)
+            fields.update(itemData)
+
+        self._fields = list(fields)
+        self._recordsData = data
+        self._lastSearch = None
+
+        if self._searchIndex is not None:
+            self._searchIndex.remove(records.values())
+            self._searchIndex.add(added)
+        elif self._searchIndexThread is None and self._records:
+            self.startSearchIndex()
+
+    def startSearchIndex(self):
+        """
+        Create the search index for the current records in a thread.
+
+        Searches check the text of every record until the index has been
+        created, see searchIndex.
+
+        :rtype: None
+        """
+        index = studiolibrary.searchindex.SearchIndex()
+
+        thread = threading.Thread(target=index.add, args=(list(self._records),))
+        thread.daemon = True
+        thread.start()
+
+        self._searchIndex = None
+        self._searchIndexThread = (thread, index)
+
+    def searchIndex(self, wait=False):
+        """
+        Get the index of the words in the records used by the "*" filter.
+
+        The index is created in a thread when the records are first
+        created and is then updated with the records that change. None is
+        returned while the index is being created, unless wait is True.
+
+        :type wait: bool
+        :rtype: studiolibrary.searchindex.SearchIndex or None
+        """
+        if self._searchIndex is None and self._searchIndexThread is not None:
+            thread, index = self._searchIndexThread
+
+            if wait:
+                thread.join()
+
+            if not thread.is_alive():
+                # Update the index with the records changed while creating it
+                index.sync(self._records)
+
+                self._searchIndex = index
+                self._searchIndexThread = None
+
+        return self._searchIndex
+
+    @staticmethod
+    def findCandidates(queries, index):
+        """
+        Get the records that can match the "*" contains filters in the queries.
+
+        Returns None if the queries don't have "*" contains filters or
+        the search index can't narrow them down. The records still need
+        to be matched with the other filters.
+
+        :type queries: list[dict]
+        :type index: studiolibrary.searchindex.SearchIndex or None
+        :rtype: set[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        if index is None:
+            return None
+
+        results = None
+
+        for query in queries:
+            filters = query.get('filters')
+            operator = query.get('operator', 'and')
+
+            if not filters or operator not in ('and', 'or'):
+                continue
+
+            terms = [
+                value for key, cond, value in filters
+                if key == '*' and cond == 'contains' and isinstance(value, six.string_types)
+            ]
+
+            # Each filter of an "or" query has to be found in the index
+            if not terms or (operator == 'or' and len(terms) != len(filters)):
+                continue
+
+            found = [index.find(term) for term in terms]
+
+            if operator == 'or' and len(found) > 1:
+                if None in found:
+                    continue
+                found = [set().union(*found)]
+
+            for records in found:
+                if records is not None:
+                    results = records if results is None else results & records
+
+        return results
+
+    def refineRecords(self, queries):
+        """
+        Get the results of the last search if the queries narrow it down.
+
+        When the queries only narrow the last search, for example when
+        more characters are typed in the search field, the items that
+        match are a subset of the last results. Returns None when the
+        queries can match other items or the records have changed.
+
+        :type queries: list[dict]
+        :rtype: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        if self._lastSearch is None:
+            return None
+
+        previous, records = self._lastSearch
+
+        if self.isNarrowerSearch(queries, previous):
+            return records
+
+        return None
+
+    @staticmethod
+    def isNarrowerFilter(filter_, other):
+        """
+        Check if every item matching the filter also matches the other filter.
+
+        A "contains" filter on all the item data narrows the other one
+        when its value contains the other value. A "startswith" filter
+        narrows the other one when its value starts with the other value.
+
+        :type filter_: tuple
+        :type other: tuple
+        :rtype: bool
+        """
+        key, cond, value = filter_
+        otherKey, otherCond, otherValue = other
+
+        if key != otherKey or cond != otherCond or cond not in Library.CONDITIONS:
+            return False
+
+        if value == otherValue:
+            return True
+
+        stringTypes = six.string_types
+        if not isinstance(value, stringTypes) or not isinstance(otherValue, stringTypes):
+            return False
+
+        # A longer term only narrows a list value for the "*" key
+        if cond == 'contains' and key == '*':
+            return otherValue.lower() in value.lower()
+
+        elif cond == 'startswith':
+            return value.lower().startswith(otherValue.lower())
+
+        return False
+
+    @staticmethod
+    def isNarrowerQuery(query, other):
+        """
+        Check if every item matching the query also matches the other query.
+
+        :type query: dict
+        :type other: dict
+        :rtype: bool
+        """
+        filters = [tuple(filter_) for filter_ in query.get('filters') or []]
+        otherFilters = [tuple(filter_) for filter_ in other.get('filters') or []]
+
+        if filters == otherFilters and query.get('operator') == other.get('operator'):
+            return True
+
+        operators = ('and', 'or')
+        operator = query.get('operator', 'and')
+        otherOperator = other.get('operator', 'and')
+
+        if not filters or operator not in operators or otherOperator not in operators:
+            return False
+
+        # The operator doesn't change the match of a single filter
+        isAnd = operator == 'and' or len(filters) == 1
+        isOtherAnd = otherOperator == 'and' or len(otherFilters) == 1
+
+        def narrows(otherFilter):
+            results = [Library.isNarrowerFilter(f, otherFilter) for f in filters]
+            return any(results) if isAnd else all(results)
+
+        if isOtherAnd:
+            return all(narrows(f) for f in otherFilters)
+
+        if any(narrows(f) for f in otherFilters):
+            return True
+
+        # Removing a filter from an "or" query narrows it
+        return not isAnd and all(
+            any(Library.isNarrowerFilter(f, otherFilter) for otherFilter in otherFilters)
+            for f in filters
+        )
+
+    @staticmethod
+    def isNarrowerSearch(queries, other):
+        """
+        Check if every item matching the queries also matches the other queries.
+
+        Each of the other queries with filters must be narrowed by one of
+        the given queries. Extra queries only narrow the search further.
+
+        :type queries: list[dict]
+        :type other: list[dict]
+        :rtype: bool
+        """
+        for otherQuery in other:
+            if not otherQuery.get('filters'):
+                continue
+
+            if not any(Library.isNarrowerQuery(query, otherQuery) for query in queries):
+                return False
+
+        return True
+
+    def createItems(self):
+        """
+        Create all the items for the model.
+
+        This creates an item for every record. Use findItems to only
+        create the items that match a search.
+
+        :rtype: list[studiolibrary.LibraryItem] 
+        """
+        return self.itemsFromRecords(self.createRecords())
+
+    def createdItems(self):
+        """
+        Get the items that have already been created from the records.
+
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        return [r.item() for r in self._records if r.item() is not None]
+
+    def classFromRecord(self, record):
+        """
+        Return the item class for the given record.
+
+        :type record: studiolibrary.itemrecord.ItemRecord
+        :rtype: studiolibrary.LibraryItem.__class__ or None
+        """
+        className = record.className()
+
+        if not className:
+            # This is to support the older database data before v2.6.
+            # Will remove in a later version.
+            return self.itemClassFromPath(record.path())
+
+        if className not in self._classes:
+            self._classes[className] = studiolibrary.resolveModule(className)
+
+        return self._classes[className]
+
+    def itemFromRecord(self, record):
+        """
+        Return the item for the given record and create it if needed.
+
+        :type record: studiolibrary.itemrecord.ItemRecord
+        :rtype: studiolibrary.LibraryItem or None
+        """
+        item = record.item()
+
+        if item is None:
+            cls = self.classFromRecord(record)
+            if cls:
+                item = cls(
+                    record.path(),
+                    library=self,
+                    libraryWindow=self._libraryWindow
+                )
+                # Changes made to the item data by the item, e.g. the
+                # custom order, shouldn't change the record before saving
+                item.setItemData(dict(record.itemData()))
+                record.setItem(item)
+
+        return item
+
+    def itemsFromRecords(self, records):
+        """
+        Return the items for the given records.
+
+        Records without a registered item class are skipped.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        items = []
+
+        for record in records:
+            item = self.itemFromRecord(record)
+            if item is not None:
+                items.append(item)
+
+        return items
+
+    def itemFromPath(self, path, **kwargs):
+        """
+        Return a new item instance for the given path.
+
+        :type path: str
+        :rtype: studiolibrary.LibraryItem or None
+        """
+        cls = self.itemClassFromPath(path)
+        if cls:
+            return cls(studiolibrary.normPath(path), **kwargs)
+
+    def itemClassFromPath(self, path):
+        """
+        Return the registered item class that supports the given path.
+
+        :type path: str
+        :rtype: studiolibrary.LibraryItem.__class__ or None
+        """
+        return self.itemClassIndex().match(studiolibrary.normPath(path))
+
+    def itemClassIndex(self):
+        """
+        Get the extension index for the registered item classes.
+
+        The index is created again when the registered items change.
+
+        :rtype: studiolibrary.ItemClassIndex
+        """
+        classes = list(self.registeredItems())
+
+        index = self._registeredItems
+        if index is None or index.classes() != classes:
+            index = studiolibrary.ItemClassIndex(classes)
+            self._registeredItems = index
+
+        return index
+
+    def itemsFromPaths(self, paths, **kwargs):
+        """
+        Return new item instances for the given paths.
+
+        :type paths: list[str]:
+        :rtype: collections.Iterable[studiolibrary.LibraryItem]
+        """
+        for path in paths:
+            item = self.itemFromPath(path, **kwargs)
+            if item:
+                yield item
+
+    def itemsFromUrls(self, urls, **kwargs):
+        """
+        Return new item instances for the given QUrl objects.
+
+        :type urls: list[QtGui.QUrl]
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        items = []
+        for path in studiolibrary.pathsFromUrls(urls):
+
+            item = self.itemFromPath(path, **kwargs)
+
+            if item:
+                data = item.createItemData()
+                item.setItemData(data)
+
+                items.append(item)
+            else:
+                msg = 'Cannot find the item for path "{0}"'
+                msg = msg.format(path)
+                logger.warning(msg)
+
+        return items
+
+    def findItems(self, queries):
+        """
+        Get the items that match the given queries.
+        
+        Examples:
+            
+            queries = [
+                {
                     'operator': 'or',
                     'filters': [
                         ('folder', 'is' '/library/proj/test'),
@@ -562,9 +1864,25 @@ class Library(QtCore.QObject):
         :type queries: list[dict]            
         :rtype: list[studiolibrary.LibraryItem]
         """
-        fields = []
-        results = []
+        queries = self.searchQueries(queries)
+        records = self.searchRecords(queries)
+
+        results = self.matchRecords(records, queries, index=self.searchIndex())
+
+        self._lastSearch = (copy.deepcopy(queries), results)
+
+        if self.sortBy():
+            results = self.sorted(results, self.sortBy())
+
+        return self.itemsFromRecords(results)
+
+    def searchQueries(self, queries):
+        """
+        Get the given queries with the global queries added.
 
+        :type queries: list[dict]
+        :rtype: list[dict]
+        """
         queries = copy.copy(queries)
         queries.extend(self._globalQueries.values())
 
@@ -572,20 +1890,82 @@ class Library(QtCore.QObject):
         for query in queries:
             logger.debug('Query: %s', query)
 
-        items = self.createItems()
-        for item in items:
-            match = self.match(item.itemData(), queries)
-            if match:
-                results.append(item)
-            fields.extend(item.itemData().keys())
+        return queries
 
-        self._fields = list(set(fields))
+    def searchRecords(self, queries):
+        """
+        Get the records that need to be matched with the given queries.
 
-        if self.sortBy():
-            results = self.sorted(results, self.sortBy())
+        :type queries: list[dict]
+        :rtype: list[studiolibrary.itemrecord.ItemRecord]
+        """
+        # Reading the records resets the last search when they changed
+        records = self.createRecords(self.queryPaths(queries))
+        refined = self.refineRecords(queries)
+
+        if refined is not None:
+            logger.debug("Refining the %s results of the last search", len(refined))
+            records = refined
+
+        return records
+
+    @staticmethod
+    def matchRecords(records, queries, index=None, isCancelled=None):
+        """
+        Get the records that match the given queries.
+
+        This only reads the records and the index so that it can run in
+        a thread. Returns None when isCancelled returns True.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :type queries: list[dict]
+        :type index: studiolibrary.searchindex.SearchIndex or None
+        :type isCancelled: callable or None
+        :rtype: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        results = []
+        match = Library.compileQueries(queries)
+        candidates = Library.findCandidates(queries, index)
+
+        if candidates is not None:
+            records = [record for record in records if record in candidates]
+
+        for i in range(0, len(records), Library.SEARCH_CHUNK_SIZE):
+            if isCancelled and isCancelled():
+                return None
+
+            for record in records[i:i + Library.SEARCH_CHUNK_SIZE]:
+                if match(record.itemData(), record.searchText):
+                    results.append(record)
 
         return results
 
+    def isResultsChanged(self, diff):
+        """
+        Check if the given diff changes the results of the last search.
+
+        :type diff: dict
+        :rtype: bool
+        """
+        results = set(item.path() for item in self._results)
+
+        for path in diff.get("removed", []) + diff.get("changed", []):
+            if path in results:
+                return True
+
+        paths = diff.get("added", []) + diff.get("changed", [])
+        if not paths:
+            return False
+
+        data = self.read()
+        match = self.compileQueries(self.queries() + list(self._globalQueries.values()))
+
+        for path in paths:
+            if path in data and match(data[path]):
+                return True
+
+        return False
+
     def queries(self, exclude=None):
         """
         Get all the queries for the dataset excluding the given ones.
@@ -653,6 +2033,9 @@ class Library(QtCore.QObject):
             logger.debug('Search is disabled')
             return
 
+        # The results of an older search in a thread are not needed
+        self.cancelSearch()
+
         t = time.time()
 
         logger.debug("Searching items")
@@ -671,6 +2054,141 @@ class Library(QtCore.QObject):
 
         logger.debug('Search time: %s', self._searchTime)
 
+    def startSearch(self, delay=None):
+        """
+        Run a search in a thread after the given delay in milliseconds.
+
+        Calling this again before the delay has passed starts the delay
+        again, and a search that is still running is cancelled. Only the
+        last search emits searchFinished, so typing in the search field
+        only shows the results for the final text. The items are created
+        on the main thread once the search has finished. This needs a
+        running event loop, use the search method otherwise.
+
+        The delay defaults to the "searchDelay" config value.
+
+        :type delay: int or None
+        :rtype: None
+        """
+        if not self.isSearchEnabled():
+            logger.debug('Search is disabled')
+            return
+
+        if delay is None:
+            delay = studiolibrary.config.get("searchDelay", 150)
+
+        self.cancelSearch()
+
+        if self._searchDelayTimer is None:
+            self._searchDelayTimer = QtCore.QTimer(self)
+            self._searchDelayTimer.setSingleShot(True)
+            self._searchDelayTimer.timeout.connect(self._searchDelayTimeout)
+
+        self._searchDelayTimer.start(delay)
+
+    def isSearching(self):
+        """
+        Check if a search has been started and has not finished yet.
+
+        :rtype: bool
+        """
+        delayed = self._searchDelayTimer is not None and self._searchDelayTimer.isActive()
+        return delayed or self._searchWorker is not None
+
+    def cancelSearch(self, wait=False):
+        """
+        Cancel the search started with startSearch without any results.
+
+        :type wait: bool
+        :rtype: None
+        """
+        if self._searchDelayTimer is not None:
+            self._searchDelayTimer.stop()
+
+        if self._searchTimer is not None:
+            self._searchTimer.stop()
+
+        worker = self._searchWorker
+        self._searchWorker = None
+
+        if worker:
+            worker.cancel()
+            if wait:
+                worker.join()
+
+    def _searchDelayTimeout(self):
+        """
+        Triggered after the search delay to start the search thread.
+
+        :rtype: None
+        """
+        if not self.isSearchEnabled():
+            return
+
+        logger.debug("Searching items in a thread")
+
+        self.searchStarted.emit()
+
+        # The thread gets a copy so the queries can be changed meanwhile
+        queries = copy.deepcopy(self.searchQueries(self.queries()))
+        records = self.searchRecords(queries)
+
+        self._searchWorker = studiolibrary.searchworker.SearchWorker(
+            self,
+            records,
+            queries,
+            index=self.searchIndex(),
+        )
+        self._searchWorker.start()
+
+        if self._searchTimer is None:
+            self._searchTimer = QtCore.QTimer(self)
+            self._searchTimer.timeout.connect(self._searchTimeout)
+
+        self._searchTimer.start(self.SEARCH_POLL_INTERVAL)
+
+    def _searchTimeout(self):
+        """
+        Triggered by the search timer to check if the thread has finished.
+
+        :rtype: None
+        """
+        worker = self._searchWorker
+
+        if worker is None:
+            self._searchTimer.stop()
+        elif not worker.is_alive():
+            self._searchTimer.stop()
+            self._searchFinished(worker)
+
+    def _searchFinished(self, worker):
+        """
+        Create the items for the results of the worker and emit searchFinished.
+
+        :type worker: studiolibrary.searchworker.SearchWorker
+        :rtype: None
+        """
+        self._searchWorker = None
+
+        if worker.isCancelled() or worker.error():
+            return
+
+        self._lastSearch = (worker.queries(), worker.matches())
+
+        self._results = self.itemsFromRecords(worker.results())
+
+        self._groupedResults = collections.OrderedDict()
+        for group, records in worker.groups().items():
+            self._groupedResults[group] = self.itemsFromRecords(records)
+
+        self.searchFinished.emit()
+
+        self._searchTime = time.time() - worker.startTime()
+
+        self.searchTimeFinished.emit()
+
+        logger.debug('Search time: %s', self._searchTime)
+
     def results(self):
         """
         Return the items found after a search is ran.
@@ -718,22 +2236,21 @@ class Library(QtCore.QObject):
 
         :type items: list[studiolibrary.LibraryItem]
         :type emitDataChanged: bool
+        :rtype: dict
         """
         logger.debug("Save item data %s", items)
 
-        data_ = self.read()
-
+        data = {}
         for item in items:
-            path = item.path()
-            data = item.itemData()
-            data_.setdefault(path, {})
-            data_[path].update(data)
+            data[item.path()] = item.itemData()
 
-        self.save(data_)
+        diff = self.updateItemData(data)
 
         if emitDataChanged:
             self.search()
-            self.dataChanged.emit()
+            self.emitDataChanged(diff)
+
+        return diff
 
     def addPaths(self, paths, data=None):
         """
@@ -741,10 +2258,10 @@ class Library(QtCore.QObject):
     
         :type paths: list[str]
         :type data: dict or None
-        :rtype: None 
+        :rtype: dict
         """
         data = data or {}
-        self.updatePaths(paths, data)
+        return self.updatePaths(paths, data)
 
     def updatePaths(self, paths, data):
         """
@@ -752,18 +2269,38 @@ class Library(QtCore.QObject):
 
         :type paths: list[str]
         :type data: dict
-        :rtype: None
+        :rtype: dict
         """
-        data_ = self.read()
         paths = studiolibrary.normPaths(paths)
+        return self.updateItemData(dict((path, data) for path in paths))
 
-        for path in paths:
-            if path in data_:
-                data_[path].update(data)
+    def updateItemData(self, data):
+        """
+        Insert or update the item data for each path in the database.
+
+        Only the given paths are written when the backend supports it.
+        Returns the paths that were added and changed compared to the
+        data last read by the library, see diffData.
+
+        :type data: dict
+        :rtype: dict
+        """
+        diff = {"added": [], "removed": [], "changed": []}
+
+        for path in data:
+            if path in self._data:
+                diff["changed"].append(path)
             else:
-                data_[path] = data
+                diff["added"].append(path)
+
+        if self.path():
+            self.database().update(data)
+            self.setDirty(True)
+            self.updatePermissions(self.database().path())
+        else:
+            logger.info('No path set for saving the data to disc.')
 
-        self.save(data_)
+        return diff
 
     def copyPath(self, src, dst):
         """
@@ -784,9 +2321,9 @@ class Library(QtCore.QObject):
         :type dst: str
         :rtype: str
         """
-        studiolibrary.renamePathInFile(self.databasePath(), src, dst)
+        self.database().rename(src, dst)
         self.setDirty(True)
-        self.updatePermissions(self.databasePath())
+        self.updatePermissions(self.database().path())
         return dst
 
     def updatePermissions(self, dst):
@@ -820,26 +2357,67 @@ class Library(QtCore.QObject):
         Remove the given path from the database.
 
         :type path: str
-        :rtype: None
+        :rtype: dict
         """
-        self.removePaths([path])
+        return self.removePaths([path])
 
     def removePaths(self, paths):
         """
         Remove the given paths from the database.
 
         :type paths: list[str]
-        :rtype: None
+        :rtype: dict
         """
-        data = self.read()
-
         paths = studiolibrary.normPaths(paths)
+        diff = {"added": [], "removed": paths, "changed": []}
 
-        for path in paths:
-            if path in data:
-                del data[path]
+        if self.path():
+            self.database().remove(paths)
+            self.setDirty(True)
+            self.updatePermissions(self.database().path())
+        else:
+            logger.info('No path set for saving the data to disc.')
+
+        return diff
+
+    @staticmethod
+    def queryPaths(queries):
+        """
+        Get the folders that contain all the items matching the queries.
+
+        A query only limits the folders when each of its filters, or one
+        of them for the "and" operator, matches the "path" or "folder"
+        with "is" or "startswith". Returns None when the items can be
+        anywhere in the library.
+
+        :type queries: list[dict]
+        :rtype: list[str] or None
+        """
+        results = None
+
+        for query in queries:
+            filters = query.get('filters')
+            operator = query.get('operator', 'and')
+
+            if not filters:
+                continue
+
+            paths = [
+                value for key, cond, value in filters
+                if key in ('path', 'folder') and cond in ('is', 'startswith')
+                and isinstance(value, six.string_types)
+            ]
+
+            if operator == 'or' and len(paths) < len(filters):
+                continue
+
+            if operator != 'or':
+                paths = paths[:1]
 
-        self.save(data)
+            if paths and (results is None or len(paths) < len(results)):
+                results = paths
+
+        return results
 
     @staticmethod
     def match(data, queries):
@@ -867,100 +2445,352 @@ class Library(QtCore.QObject):
             
             print(library.find(queries))
         """
-        matches = []
+        matches = []
+
+        for query in queries:
+
+            filters = query.get('filters')
+            operator = query.get('operator', 'and')
+
+            if not filters:
+                continue
+
+            match = False
+
+            for key, cond, value in filters:
+
+                if key == '*':
+                    itemValue = six.text_type(data)
+                else:
+                    itemValue = data.get(key)
+
+                if isinstance(value, six.string_types):
+                    value = value.lower()
+
+                if isinstance(itemValue, six.string_types):
+                    itemValue = itemValue.lower()
+
+                if not itemValue:
+                    match = False
+
+                elif cond == 'contains':
+                    match = value in itemValue
+
+                elif cond == 'not_contains':
+                    match = value not in itemValue
+
+                elif cond == 'is':
+                    match = value == itemValue
+
+                elif cond == 'not':
+                    match = value != itemValue
+
+                elif cond == 'startswith':
+                    match = itemValue.startswith(value)
+
+                if operator == 'or' and match:
+                    break
+
+                if operator == 'and' and not match:
+                    break
+
+            matches.append(match)
+
+        return all(matches)
+
+    @staticmethod
+    def compileFilter(key, cond, value):
+        """
+        Compile the given filter into a function that matches item data.
+
+        The function takes the item data and the lowercase text of the
+        item data, which is only used by filters with the "*" key. It
+        returns None for unknown conditions so that the previous match
+        is kept, the same as the match method.
+
+        :type key: str
+        :type cond: str
+        :type value: object
+        :rtype: callable
+        """
+        stringTypes = six.string_types
+
+        if isinstance(value, stringTypes):
+            value = value.lower()
+
+        if key == '*':
+            tests = {
+                'contains': lambda text: value in text,
+                'not_contains': lambda text: value not in text,
+                'is': lambda text: value == text,
+                'not': lambda text: value != text,
+                'startswith': lambda text: text.startswith(value),
+            }
+
+            test = tests.get(cond, lambda text: None)
+            return lambda data, text: test(text)
+
+        if cond == 'contains':
+            def test(data, text):
+                itemValue = data.get(key)
+                if not itemValue:
+                    return False
+                if isinstance(itemValue, stringTypes):
+                    return value in itemValue.lower()
+                return value in itemValue
+
+        elif cond == 'not_contains':
+            def test(data, text):
+                itemValue = data.get(key)
+                if not itemValue:
+                    return False
+                if isinstance(itemValue, stringTypes):
+                    return value not in itemValue.lower()
+                return value not in itemValue
+
+        elif cond == 'is':
+            def test(data, text):
+                itemValue = data.get(key)
+                if not itemValue:
+                    return False
+                if isinstance(itemValue, stringTypes):
+                    return value == itemValue.lower()
+                return value == itemValue
+
+        elif cond == 'not':
+            def test(data, text):
+                itemValue = data.get(key)
+                if not itemValue:
+                    return False
+                if isinstance(itemValue, stringTypes):
+                    return value != itemValue.lower()
+                return value != itemValue
+
+        elif cond == 'startswith':
+            def test(data, text):
+                itemValue = data.get(key)
+                if not itemValue:
+                    return False
+                if isinstance(itemValue, stringTypes):
+                    return itemValue.lower().startswith(value)
+                return itemValue.startswith(value)
+
+        else:
+            def test(data, text):
+                if not data.get(key):
+                    return False
+                return None
+
+        return test
+
+    @staticmethod
+    def compileQueries(queries):
+        """
+        Compile the given queries into a function that matches item data.
 
-        for query in queries:
+        The queries are compiled once for each search instead of being
+        interpreted for every item. Queries without filters are dropped
+        and the search values are lowercased once. The function gives
+        the same results as the match method.
+
+        The function takes the item data and an optional function that
+        returns the lowercase text of the item data for the "*" filters,
+        see ItemRecord.searchText.
+
+        Example:
+            match = Library.compileQueries(queries)
+            results = [data for data in items if match(data)]
 
+        :type queries: list[dict]
+        :rtype: callable
+        """
+        compiled = []
+        starred = []
+
+        for query in queries:
             filters = query.get('filters')
             operator = query.get('operator', 'and')
 
             if not filters:
                 continue
 
-            match = False
+            tests = [Library.compileFilter(*filter_) for filter_ in filters]
+            known = all(cond in Library.CONDITIONS for key, cond, value in filters)
 
-            for key, cond, value in filters:
+            if len(tests) == 1 and known:
+                test = tests[0]
 
-                if key == '*':
-                    itemValue = six.text_type(data)
+            elif operator == 'and' and known:
+                def test(data, text, tests=tests):
+                    for test_ in tests:
+                        if not test_(data, text):
+                            return False
+                    return True
+
+            elif operator == 'or' and known:
+                def test(data, text, tests=tests):
+                    for test_ in tests:
+                        if test_(data, text):
+                            return True
+                    return False
+
+            else:
+                def test(data, text, tests=tests, operator=operator):
+                    match = False
+                    for test_ in tests:
+                        result = test_(data, text)
+                        if result is not None:
+                            match = result
+                        if operator == 'or' and match:
+                            break
+                        if operator == 'and' and not match:
+                            break
+                    return match
+
+            # The queries that search all the item data are run last
+            # as the text of the item data is only created when needed.
+            if any(key == '*' for key, cond, value in filters):
+                starred.append(test)
+            else:
+                compiled.append(test)
+
+        def match(data, searchText=None):
+            for test in compiled:
+                if not test(data, None):
+                    return False
+
+            if starred:
+                if searchText:
+                    text = searchText()
                 else:
-                    itemValue = data.get(key)
+                    text = six.text_type(data).lower()
 
-                if isinstance(value, six.string_types):
-                    value = value.lower()
+                for test in starred:
+                    if not test(data, text):
+                        return False
 
-                if isinstance(itemValue, six.string_types):
-                    itemValue = itemValue.lower()
+            return True
 
-                if not itemValue:
-                    match = False
+        return match
 
-                elif cond == 'contains':
-                    match = value in itemValue
+    @staticmethod
+    def sortFields(sortBy):
+        """
+        Get the field and the sort direction for each value in sortBy.
 
-                elif cond == 'not_contains':
-                    match = value not in itemValue
+        Example:
+            print(Library.sortFields(['index:dsc', 'name']))
+            # [('index', True), ('name', False)]
 
-                elif cond == 'is':
-                    match = value == itemValue
+        :type sortBy: list[str]
+        :rtype: list[(str, bool)]
+        """
+        results = []
 
-                elif cond == 'not':
-                    match = value != itemValue
+        for field in sortBy:
+            tokens = field.split(':')
 
-                elif cond == 'startswith':
-                    match = itemValue.startswith(value)
+            reverse = False
+            if len(tokens) > 1:
+                reverse = tokens[1] != 'asc'
 
-                if operator == 'or' and match:
-                    break
+            results.append((tokens[0], reverse))
 
-                if operator == 'and' and not match:
-                    break
+        return results
 
-            matches.append(match)
+    @staticmethod
+    def sortedByKeys(values, columns):
+        """
+        Return the given values sorted by the keys in each column.
 
-        return all(matches)
+        Each column has a key from studiolibrary.naturalSortKey for every
+        value and is sorted in reverse when the second item is True. The
+        indexes of the values are sorted by each column, starting with
+        the last one, as the sort is stable. Values with the same keys
+        keep their order.
+
+        :type values: list
+        :type columns: list[(list[tuple], bool)]
+        :rtype: list
+        """
+        order = range(len(values))
+
+        for column, reverse in reversed(columns):
+
+            # Values of one type are faster to compare than the keys
+            if len(set(key[0] for key in column)) == 1:
+                column = [key[1] for key in column]
+
+            order = sorted(order, key=column.__getitem__, reverse=reverse)
+
+        return [values[i] for i in order]
 
     @staticmethod
-    def sorted(items, sortBy):
+    def sortedData(data, sortBy):
         """
-        Return the given data sorted using the sortBy argument.
-        
+        Return the given item data sorted using the sortBy argument.
+
         Example:
             data = [
                 {'name':'red', 'index':1},
                 {'name':'green', 'index':2},
                 {'name':'blue', 'index':3},
             ]
-            
+
             sortBy = ['index:asc', 'name']
             # sortBy = ['index:dsc', 'name']
-            
-            print(sortedData(data, sortBy))
-            
-        :type items: list[Item]
+
+            print(Library.sortedData(data, sortBy))
+
+        :type data: list[dict]
         :type sortBy: list[str]
-        :rtype: list[Item]
+        :rtype: list[dict]
         """
-        logger.debug('Sort by: %s', sortBy)
+        columns = []
 
-        t = time.time()
+        for field, reverse in Library.sortFields(sortBy):
+            keys = [studiolibrary.naturalSortKey(itemData.get(field)) for itemData in data]
+            columns.append((keys, reverse))
 
-        for field in reversed(sortBy):
+        return Library.sortedByKeys(data, columns)
 
-            tokens = field.split(':')
+    @staticmethod
+    def sorted(items, sortBy):
+        """
+        Return the given items or records sorted using the sortBy argument.
 
-            reverse = False
-            if len(tokens) > 1:
-                field = tokens[0]
-                reverse = tokens[1] != 'asc'
+        The keys for each field are only created once, and each field is
+        sorted in ascending or descending order. Text is sorted in natural
+        order and values of different types can be sorted, see
+        studiolibrary.naturalSortKey. Records keep their keys until the
+        item data changes.
+
+        Example:
+            sortBy = ['type', 'modified:dsc', 'name']
+            print(Library.sorted(library.createRecords(), sortBy))
+
+        :type items: list[Item] or list[studiolibrary.itemrecord.ItemRecord]
+        :type sortBy: list[str]
+        :rtype: list[Item] or list[studiolibrary.itemrecord.ItemRecord]
+        """
+        logger.debug('Sort by: %s', sortBy)
+
+        t = time.time()
 
-            def sortKey(item):
+        itemRecord = studiolibrary.itemrecord.ItemRecord
+        records = all(isinstance(item, itemRecord) for item in items)
+        columns = []
 
-                default = False if reverse else ''
+        for field, reverse in Library.sortFields(sortBy):
+            if records:
+                keys = [record.sortKey(field) for record in items]
+            else:
+                sortKey = studiolibrary.naturalSortKey
+                keys = [sortKey(item.itemData().get(field)) for item in items]
 
-                return item.itemData().get(field, default)
+            columns.append((keys, reverse))
 
-            items = sorted(items, key=sortKey, reverse=reverse)
+        items = Library.sortedByKeys(items, columns)
 
         logger.debug("Sort items took %s", time.time() - t)
 
@@ -1076,6 +2906,605 @@ def testsuite():
     }]
     assert not Library.match(data, queries)
 
+    testCompileQueries()
+    testSyncEdits()
+    testIncrementalSync()
+    testMetadataIndex()
+    testSyncOrder()
+    testCancelWalker()
+    testSearchEdits()
+    testSortEdits()
+    testSearchIndex()
+    testRefineSearch()
+    testSorted()
+
+    queries = [
+        {'operator': 'or', 'filters': [('folder', 'is', '/a'), ('folder', 'startswith', '/a/')]},
+        {'filters': [('name', 'is', 'red'), ('path', 'startswith', '/a/b')]},
+    ]
+    assert Library.queryPaths(queries) == ['/a/b']
+
+    queries = [{'operator': 'or', 'filters': [('folder', 'is', '/a'), ('name', 'is', 'red')]}]
+    assert Library.queryPaths(queries) is None
+
+    library = Library()
+    assert library.isValidPath("/library/data/test.anim")
+    assert not library.isValidPath("/library/data/.studiolibrary")
+    assert not library.isValidPath("/library/data/test.playblast")
+
+    patterns = studiolibrary.config.get("ignorePaths", [])
+    count = len(patterns)
+    library.isValidPath("/library/data/test.anim")
+    assert len(studiolibrary.config.get("ignorePaths", [])) == count
+
+
+
+def testSorted(count=2000, seed=0):
+    """
+    Check that the records and item data are sorted by each field in turn.
+
+    :type count: int
+    :type seed: int
+    """
+    import random
+
+    rand = random.Random(seed)
+
+    data = []
+    for i in range(count):
+        data.append({
+            'name': rand.choice(['item2', 'Item10', 'item1', 'walk', '', None]),
+            'modified': rand.choice([1.5, 3, '', None]),
+            'tags': rand.choice([['a'], ['b', 'a'], []]),
+            'index': i,
+        })
+
+    fields = ['name', 'name:dsc', 'modified', 'modified:dsc', 'tags:dsc', 'missing']
+
+    for _ in range(20):
+        sortBy = rand.sample(fields, rand.randint(1, 3))
+
+        expected = data
+        for field, reverse in reversed(Library.sortFields(sortBy)):
+            key = lambda itemData: studiolibrary.naturalSortKey(itemData.get(field))
+            expected = sorted(expected, key=key, reverse=reverse)
+
+        assert Library.sortedData(data, sortBy) == expected, sortBy
+
+    records = [studiolibrary.itemrecord.ItemRecord(str(i), d) for i, d in enumerate(data)]
+    results = Library.sorted(records, ['modified:dsc', 'name'])
+    assert [r.itemData() for r in results] == Library.sortedData(data, ['modified:dsc', 'name'])
+
+    # Names are sorted in natural order and empty values come first
+    data = [{'name': 'item10'}, {'name': 'Item2'}, {}, {'name': 'item1'}]
+    results = [d.get('name') for d in Library.sortedData(data, ['name'])]
+    assert results == [None, 'item1', 'Item2', 'item10'], results
+
+    results = [d.get('name') for d in Library.sortedData(data, ['name:dsc'])]
+    assert results == ['item10', 'Item2', 'item1', None], results
+
+
+def testCompileQueries(count=5000, seed=0):
+    """
+    Check that compiled queries match the same data as Library.match.
+
+    Random item data and queries are generated with the given seed.
+    Cases where Library.match raises an error are skipped.
+
+    :type count: int
+    :type seed: int
+    """
+    import random
+
+    rand = random.Random(seed)
+
+    keys = ['name', 'type', 'folder', 'tags', 'index', '*', 'missing']
+    conds = Library.CONDITIONS + ['unknown']
+    operators = ['and', 'or', 'xor', None]
+    values = ['Red', 'red', 're', 'ED', 'blue', '', 'Anim', 'a', 3, 0, None, 'name']
+
+    def randomData():
+        return {
+            'name': rand.choice(['red', 'Red.anim', 'blue', '', 'RED BLUE']),
+            'type': rand.choice(['Animation', 'Pose', None]),
+            'folder': rand.choice(['/a', '/a/Red', '']),
+            'tags': rand.choice([['red', 'a'], [], ['Anim']]),
+            'index': rand.choice([0, 3, 4]),
+        }
+
+    def randomQuery():
+        query = {
+            'filters': [
+                (rand.choice(keys), rand.choice(conds), rand.choice(values))
+                for _ in range(rand.randint(0, 3))
+            ]
+        }
+        operator = rand.choice(operators)
+        if operator:
+            query['operator'] = operator
+        return query
+
+    checked = 0
+
+    for _ in range(count):
+        data = randomData()
+        queries = [randomQuery() for _ in range(rand.randint(0, 3))]
+
+        try:
+            expected = Library.match(data, queries)
+        except (TypeError, AttributeError):
+            continue
+
+        result = Library.compileQueries(queries)(data)
+        assert result == expected, (data, queries, result, expected)
+        checked += 1
+
+    assert checked > count / 2, checked
+
+
+def testSyncEdits():
+    """
+    Check that the changes saved while syncing are kept and shown.
+    """
+    import shutil
+    import tempfile
+    import studiolibrary.folderitem
+
+    studiolibrary.registerItem(studiolibrary.folderitem.FolderItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+    path = root + "/b"
+
+    for name in ["a", "b", "c"]:
+        os.makedirs(os.path.join(root, name))
+
+    try:
+        library = Library(root)
+        library.sync()
+
+        records = dict((r.path(), r) for r in library.createRecords())
+        assert "tags" not in records[path].itemData()
+
+        edits = []
+
+        def progressCallback(label, percent=None):
+            # Save changes after the sync has read the database
+            if percent is not None and not edits:
+                os.makedirs(os.path.join(root, "d"))
+                edits.append(library.updatePaths([path], {"tags": "zebra"}))
+                edits.append(library.addPaths([root + "/d"], {"tags": "new"}))
+
+        library.sync(progressCallback=progressCallback)
+
+        assert edits and edits[0]["changed"] == [path]
+        assert library.read()[path]["tags"] == "zebra"
+        assert library.read()[root + "/d"]["tags"] == "new"
+
+        records = dict((r.path(), r) for r in library.createRecords())
+        assert records[path].itemData()["tags"] == "zebra"
+    finally:
+        shutil.rmtree(tmp)
+
+
+def testIncrementalSync():
+    """
+    Check that an incremental sync only checks the directories.
+    """
+    import shutil
+    import tempfile
+
+    class TestItem(studiolibrary.LibraryItem):
+        EXTENSION = ".test"
+
+    studiolibrary.registerItem(TestItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+    path = root + "/a/b.test"
+    metadataPath = studiolibrary.formatPath(studiolibrary.config.get("metadataPath"), path)
+
+    stat = os.stat
+    paths = []
+
+    def countStats(path_, *args, **kwargs):
+        path_ = studiolibrary.normPath(path_)
+        if path_.startswith(root) and "/.studiolibrary" not in path_:
+            paths.append(path_)
+        return stat(path_, *args, **kwargs)
+
+    try:
+        os.makedirs(os.path.join(root, "a", "c.test"))
+        os.makedirs(os.path.join(root, "d.test"))
+        os.makedirs(os.path.dirname(metadataPath))
+        studiolibrary.saveJson(metadataPath, {"description": "old"})
+
+        library = Library(root)
+        library.sync(incremental=True)
+        assert library.read()[path]["description"] == "old"
+
+        # The first sync changes the root by creating the database
+        library.sync(incremental=True)
+
+        # Only the walked directories are checked when nothing has changed
+        os.stat = countStats
+        library.sync(incremental=True)
+        os.stat = stat
+
+        assert len(paths) == len(set(paths)), paths
+        assert path not in paths and metadataPath not in paths, paths
+        assert library.syncCounters()["calls"] == 0, library.syncCounters()
+
+        # Metadata saved for an item is found with the metadata index
+        item = library.itemFromPath(path, library=library)
+        item.saveMetadata({"description": "new"})
+
+        library.setDirty(True)
+        library.sync(incremental=True)
+        assert library.read()[path]["description"] == "new"
+
+        # Items moved into a folder change the folder
+        os.makedirs(os.path.join(root, "a", "e.test"))
+        library.sync(incremental=True)
+        assert root + "/a/e.test" in library.read()
+
+        # Changes made inside an item by other tools need a full sync
+        modified = library.read()[path]["modified"]
+        os.utime(path, (modified + 10, modified + 10))
+
+        library.sync(incremental=True)
+        assert library.read()[path]["modified"] == modified
+
+        library.sync(incremental=False)
+        assert library.read()[path]["modified"] == modified + 10
+    finally:
+        os.stat = stat
+        shutil.rmtree(tmp)
+
+
+def testMetadataIndex():
+    """
+    Check that the metadata index is kept outside of the item data.
+    """
+    import shutil
+    import tempfile
+
+    class TestItem(studiolibrary.LibraryItem):
+        EXTENSION = ".test"
+
+    studiolibrary.registerItem(TestItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+    path = root + "/a.test"
+    metadataPath = studiolibrary.formatPath(studiolibrary.config.get("metadataPath"), path)
+
+    os.makedirs(os.path.dirname(metadataPath))
+    os.makedirs(os.path.join(root, "b.test"))
+    studiolibrary.saveJson(metadataPath, {"description": "hello"})
+
+    readJson = studiolibrary.utils.readJson
+    paths = []
+
+    def countReads(path_):
+        paths.append(path_)
+        return readJson(path_)
+
+    def search(text):
+        queries = [{"filters": [("*", "contains", text)]}]
+        return [item.path() for item in library.findItems(queries)]
+
+    try:
+        library = Library(root)
+        library.sync()
+
+        data = library.read()
+        assert data[path]["description"] == "hello"
+        assert "__metadata__" not in data[path]
+        assert search("mtime") == []
+
+        index = library.metadataIndex()
+        index.read()
+        assert index.record(path)["data"] == {"description": "hello"}
+        assert index.record(root + "/b.test") is None
+
+        # The metadata file is only read again when it has changed
+        studiolibrary.utils.readJson = countReads
+        library.sync()
+        assert metadataPath not in paths
+
+        # Saving the metadata updates the index
+        item = library.itemFromPath(path, library=library)
+        item.saveMetadata({"description": "world"})
+
+        index.read()
+        assert index.record(path)["data"] == {"description": "world"}
+        assert library.read()[path]["description"] == "world"
+    finally:
+        studiolibrary.utils.readJson = readJson
+        shutil.rmtree(tmp)
+
+
+def testSyncOrder():
+    """
+    Check that syncing the same tree always gives the same order.
+    """
+    import shutil
+    import tempfile
+    import studiolibrary.folderitem
+
+    studiolibrary.registerItem(studiolibrary.folderitem.FolderItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+
+    for i in range(5):
+        for j in range(5):
+            os.makedirs(os.path.join(root, "folder%d" % i, "folder%d" % j))
+
+    workers = studiolibrary.config.get("syncWorkerCount")
+
+    try:
+        studiolibrary.config.set("syncWorkerCount", 8)
+
+        library = Library(root)
+        orders = []
+
+        def finishSync(new, *args, **kwargs):
+            orders.append(list(new))
+
+        library.finishSync = finishSync
+
+        library.sync(incremental=False)
+        library.sync(incremental=False)
+
+        assert len(orders[0]) == 30, orders[0]
+        assert orders[0] == orders[1]
+        assert orders[0] == sorted(orders[0])
+    finally:
+        studiolibrary.config.set("syncWorkerCount", workers)
+        shutil.rmtree(tmp)
+
+
+def testCancelWalker():
+    """
+    Check that the walker stops between directories when cancelled.
+    """
+    import shutil
+    import tempfile
+    import studiolibrary.folderitem
+
+    studiolibrary.registerItem(studiolibrary.folderitem.FolderItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+
+    for i in range(3):
+        for j in range(3):
+            os.makedirs(os.path.join(root, "a{0}".format(i), "b{0}".format(j)))
+
+    try:
+        library = Library(root)
+        assert len(list(library.walker(root))) == 12
+
+        # A folder item is returned when the folder has been listed
+        items = []
+        for itemData in library.walker(root, isCancelled=lambda: bool(items)):
+            items.append(itemData)
+
+        assert len(items) == 1, items
+    finally:
+        shutil.rmtree(tmp)
+
+
+def testSearchEdits():
+    """
+    Check that the search index finds the changes saved for an item.
+    """
+    import shutil
+    import tempfile
+    import studiolibrary.folderitem
+
+    studiolibrary.registerItem(studiolibrary.folderitem.FolderItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+    path = root + "/b"
+
+    for name in ["a", "b", "c"]:
+        os.makedirs(os.path.join(root, name))
+
+    def search(text):
+        queries = [{"filters": [("*", "contains", text)]}]
+        return [item.path() for item in library.findItems(queries)]
+
+    try:
+        library = Library(root)
+        library.sync()
+        library.createRecords()
+        library.searchIndex(wait=True)
+
+        assert search("zebra") == []
+
+        library.updatePaths([path], {"tags": "zebra"})
+        assert search("zebra") == [path]
+
+        library.updatePaths([path], {"tags": "lion"})
+        assert search("zebra") == []
+        assert search("lion") == [path]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def testSortEdits():
+    """
+    Check that the items are sorted again by the changes saved for them.
+    """
+    import shutil
+    import tempfile
+    import studiolibrary.folderitem
+
+    studiolibrary.registerItem(studiolibrary.folderitem.FolderItem)
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(os.path.join(tmp, "library"))
+
+    for name in ["a", "b", "c"]:
+        os.makedirs(os.path.join(root, name))
+
+    def names():
+        return [item.name() for item in library.findItems([])]
+
+    try:
+        library = Library(root)
+        library.sync()
+        library.setSortBy(["rank:dsc", "name"])
+
+        for rank, name in enumerate(["a", "b", "c"]):
+            library.updatePaths([root + "/" + name], {"rank": rank})
+        assert names() == ["c", "b", "a"]
+
+        library.updatePaths([root + "/a"], {"rank": 5})
+        assert names() == ["a", "c", "b"]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def testSearchIndex():
+    """
+    Check that the search index finds the same records as matching each one.
+    """
+    library = Library()
+
+    data = {}
+    for i in range(300):
+        path = "/library/folder{0}/item{1}.anim".format(i % 7, i)
+        data[path] = {"path": path, "name": "item{0}.anim".format(i), "tags": ["Walk"]}
+
+    library.updateRecords(data)
+    index = library.searchIndex(wait=True)
+    assert len(index) == 300
+
+    # Changes to the records are added to the index
+    data = dict(data)
+    data["/library/folder0/item0.anim"] = {"name": "run_cycle"}
+    library.updateRecords(data)
+    assert len(index) == 300
+
+    for term in ["item12", "run", "RUN_C", "folder3/item1", "walk", "i", "xyz", "'name'"]:
+        queries = [{"operator": "and", "filters": [("*", "contains", term)]}]
+        candidates = Library.findCandidates(queries, index)
+
+        expected = [
+            record for record in library._records
+            if Library.match(record.itemData(), queries)
+        ]
+
+        if candidates is None:
+            assert expected, term
+        else:
+            assert set(expected) == candidates, term
+
+
+def testRefineSearch(count=3000, seed=0):
+    """
+    Check that the queries found to narrow a search only match a subset.
+
+    Random queries are changed the way a search is typed, and every
+    change that is found to narrow the search is checked with random
+    item data.
+
+    :type count: int
+    :type seed: int
+    """
+    import random
+
+    rand = random.Random(seed)
+
+    keys = ['name', 'tags', 'folder', '*']
+    conds = Library.CONDITIONS + ['unknown']
+    values = ['r', 're', 'red', 'Red', 'a', 'an', 'anim', '/a', '/a/r', 'e', "e'"]
+
+    def randomData():
+        return {
+            'name': rand.choice(['red', 'Red.anim', 'blue', '', 'RED BLUE']),
+            'folder': rand.choice(['/a', '/a/Red', '']),
+            'tags': rand.choice([['red', 'a'], [], ['Anim'], ['anim']]),
+        }
+
+    def randomFilter():
+        return (rand.choice(keys), rand.choice(conds), rand.choice(values))
+
+    def randomQuery():
+        return {
+            'operator': rand.choice(['and', 'or']),
+            'filters': [randomFilter() for _ in range(rand.randint(1, 3))],
+        }
+
+    def change(queries):
+        queries = copy.deepcopy(queries)
+        query = rand.choice(queries)
+        filters = query['filters']
+        action = rand.randint(0, 4)
+
+        if action == 0:
+            i = rand.randrange(len(filters))
+            key, cond, value = filters[i]
+            filters[i] = (key, cond, value + rand.choice(['d', 'n', 'R', '/']))
+        elif action == 1:
+            filters.append(randomFilter())
+        elif action == 2 and len(filters) > 1:
+            filters.pop(rand.randrange(len(filters)))
+        elif action == 3:
+            queries.append(randomQuery())
+        else:
+            query['operator'] = rand.choice(['and', 'or'])
+
+        return queries
+
+    narrowed = 0
+    dataset = [randomData() for _ in range(50)]
+
+    for _ in range(count):
+        queries = [randomQuery() for _ in range(rand.randint(1, 2))]
+        changed = change(queries)
+
+        if not Library.isNarrowerSearch(changed, queries):
+            continue
+
+        narrowed += 1
+        match = Library.compileQueries(queries)
+        matchChanged = Library.compileQueries(changed)
+
+        for data in dataset:
+            try:
+                if matchChanged(data):
+                    assert match(data), (data, changed, queries)
+            except (TypeError, AttributeError):
+                continue
+
+    assert narrowed > count / 10, narrowed
+
+    # Typing a search one character at a time narrows the results
+    queries = [{'operator': 'and', 'filters': [('*', 'contains', 'wal')]}]
+    for text in ['walk', 'walk c', 'walk cy']:
+        query = {'operator': 'and', 'filters': [('*', 'contains', t) for t in text.split()]}
+        assert Library.isNarrowerSearch([query], queries), text
+        queries = [query]
+
+    # Deleting a character or adding an "or" filter widens the results
+    old = [{'operator': 'and', 'filters': [('*', 'contains', 'walk')]}]
+    new = [{'operator': 'and', 'filters': [('*', 'contains', 'wal')]}]
+    assert not Library.isNarrowerSearch(new, old)
+
+    new = [{'operator': 'or', 'filters': [('*', 'contains', 'walk'), ('*', 'contains', 'c')]}]
+    assert not Library.isNarrowerSearch(new, old)
+
+    # A longer value doesn't narrow a "contains" filter on a list field
+    old = [{'filters': [('tags', 'contains', 'anim')]}]
+    new = [{'filters': [('tags', 'contains', 'animation')]}]
+    assert not Library.isNarrowerSearch(new, old)
+
 
 if __name__ == "__main__":
     testsuite()
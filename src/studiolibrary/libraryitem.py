@@ -86,38 +86,14 @@ class LibraryItem(studiolibrary.widgets.Item):
 
         :rtype: dict
         """
-        import studiolibrary.library
+        className = self.__class__.__module__ + "." + self.__class__.__name__
 
-        path = self.path()
-        path = studiolibrary.latestVersionPath(path) or path
-
-        if studiolibrary.isVersionPath(path):
-            dirname = os.path.dirname(path)
-            name = os.path.basename(dirname)
-            dirname, basename, extension = studiolibrary.splitPath(dirname)
-        else:
-            dirname, basename, extension = studiolibrary.splitPath(path)
-            name = os.path.basename(path)
-
-        category = os.path.basename(dirname) or dirname
-        modified = ""
-
-        if os.path.exists(path):
-            modified = os.path.getmtime(path)
-
-        itemData = dict(self.readMetadata())
-
-        itemData.update({
-            "name": name,
-            "path": path,
-            "type": self.TYPE or extension,
-            "folder": dirname,
-            "category": category,
-            "modified": modified,
-            "__class__": self.__class__.__module__ + "." + self.__class__.__name__
-        })
-
-        return itemData
+        return studiolibrary.createItemData(
+            self.path(),
+            className,
+            itemType=self.TYPE,
+            metadata=self.readMetadata,
+        )
 
     @classmethod
     def createAction(cls, menu, libraryWindow):
@@ -200,6 +176,7 @@ class LibraryItem(studiolibrary.widgets.Item):
         self._modal = None
         self._library = None
         self._metadata = None
+        self._metadataRecord = None
         self._libraryWindow = None
 
         self._readOnly = False
@@ -358,7 +335,7 @@ class LibraryItem(studiolibrary.widgets.Item):
 
         :rtype: str
         """
-        thumbnailPath = self.path() + "/thumbnail.jpg"
+        thumbnailPath = self.replicaPath(self.path() + "/thumbnail.jpg")
         if os.path.exists(thumbnailPath):
             return thumbnailPath
 
@@ -368,6 +345,24 @@ class LibraryItem(studiolibrary.widgets.Item):
 
         return self.THUMBNAIL_PATH
 
+    def replicaPath(self, path):
+        """
+        Get the local copy of the given file when the library is replicated.
+
+        The given path is returned when there is no replica or the item
+        hasn't been copied yet.
+
+        :type path: str
+        :rtype: str
+        """
+        library = self.library()
+        replica = library.replica() if library else None
+
+        if replica:
+            return replica.localPath(path)
+
+        return path
+
     def isTHUMBNAIL_PATH(self):
         """
         Check if the thumbnail path is the default path.
@@ -607,6 +602,15 @@ class LibraryItem(studiolibrary.widgets.Item):
         if self.updatePermissionsEnabled():
             self.library().updatePermissions(path)
 
+        self._metadataRecord = {
+            "mtime": os.path.getmtime(path),
+            "data": metadata,
+        }
+
+        # Update the metadata index so other syncs don't read the file
+        if self.library():
+            self.library().metadataIndex().update({self.path(): self._metadataRecord})
+
         self.setMetadata(metadata)
         self.syncItemData(emitDataChanged=False)
         self.dataChanged.emit(self)
@@ -618,16 +622,36 @@ class LibraryItem(studiolibrary.widgets.Item):
         :rtype: dict
         """
         if self._metadata is None:
-            formatString = studiolibrary.config.get('metadataPath')
-            path = studiolibrary.formatPath(formatString, self.path())
-
-            if os.path.exists(path):
-                self._metadata = studiolibrary.readJson(path)
-            else:
-                self._metadata = {}
+            record = studiolibrary.readMetadataRecord(
+                self.path(),
+                record=self._metadataRecord,
+            )
+            self._metadataRecord = record
+            self._metadata = record["data"]
 
         return self._metadata
 
+    def metadataRecord(self):
+        """
+        Get the metadata and its mtime from when the metadata was last read.
+
+        :rtype: dict or None
+        """
+        return self._metadataRecord
+
+    def setMetadataRecord(self, record):
+        """
+        Set the metadata record from the metadata index.
+
+        The metadata is only read from disc if its mtime has changed
+        since the record was created. See studiolibrary.readMetadataRecord.
+
+        :type record: dict or None
+        :rtype: None
+        """
+        self._metadata = None
+        self._metadataRecord = record
+
     def syncItemData(self, emitDataChanged=True):
         """Sync the item data to the database."""
         data = self.createItemData()
@@ -235,6 +235,9 @@ class LibraryWindow(QtWidgets.QWidget):
         self._lightbox = None
         self._refreshEnabled = False
         self._progressBar = None
+        self._syncTime = 0
+        self._syncCancelled = False
+        self._pendingDiff = None
         self._superusers = None
         self._lockRegExp = None
         self._unlockRegExp = None
@@ -259,8 +262,18 @@ class LibraryWindow(QtWidgets.QWidget):
         # Create Widgets
         # --------------------------------------------------------------------
 
+        # Update once for all the item signals emitted by a change
+        self._diffTimer = QtCore.QTimer(self)
+        self._diffTimer.setSingleShot(True)
+        self._diffTimer.setInterval(0)
+        self._diffTimer.timeout.connect(self._updateFromPendingDiff)
+
         library = self.LIBRARY_CLASS(libraryWindow=self)
-        library.dataChanged.connect(self.refresh)
+        library.dataChanged.connect(self._dataChanged)
+        library.itemsAdded.connect(self._itemsAdded)
+        library.itemsRemoved.connect(self._itemsRemoved)
+        library.itemsChanged.connect(self._itemsChanged)
+        library.syncFinished.connect(self._syncFinished)
         library.searchTimeFinished.connect(self._searchFinished)
 
         self._sidebarFrame = SidebarFrame(self)
@@ -277,6 +290,7 @@ class LibraryWindow(QtWidgets.QWidget):
 
         self._filterByMenu = self.FILTERBY_MENU_CLASS(self)
         self._statusWidget = self.STATUS_WIDGET_CLASS(self)
+        self._statusWidget.progressBar().cancelClicked.connect(self.cancelSync)
 
         # Add the update available button to the status widget
         self._updateAvailableButton = QtWidgets.QPushButton(self._statusWidget)
@@ -600,7 +614,7 @@ class LibraryWindow(QtWidgets.QWidget):
         library = self.library()
         library.setPath(path)
 
-        if not os.path.exists(library.databasePath()):
+        if not library.database().exists():
             self.sync()
 
         self.refresh()
@@ -703,30 +717,59 @@ class LibraryWindow(QtWidgets.QWidget):
     def sync(self):
         """
         Sync any data that might be out of date with the model. 
-        
+
+        The sync runs in a background thread and the items are shown as
+        they are found. Click the cancel button to stop the sync.
+
         :rtype: None 
         """
+        if self.library().isSyncing():
+            return
+
         progressBar = self.statusWidget().progressBar()
+        progressBar.setCancelEnabled(True)
 
-        @studioqt.showWaitCursor
-        def _sync():
-            elapsedTime = time.time()
-            self.library().sync(progressCallback=self.setProgressBarValue)
+        self._syncTime = time.time()
 
-            elapsedTime = time.time() - elapsedTime
+        self.setProgressBarValue("Syncing")
+        studioqt.fadeIn(progressBar, duration=1)
 
-            msg = "Synced items in {0:.3f} seconds."
-            msg = msg.format(elapsedTime)
+        progressBar.show()
 
-            self.statusWidget().showInfoMessage(msg)
-            self.setProgressBarValue("Done")
+        self.library().startSync(progressCallback=self.setProgressBarValue)
 
-            studioqt.fadeOut(progressBar, duration=500, onFinished=progressBar.close)
+    def cancelSync(self):
+        """
+        Cancel the sync running in the background.
 
-        self.setProgressBarValue("Syncing")
-        studioqt.fadeIn(progressBar, duration=1, onFinished=_sync)
+        :rtype: None
+        """
+        if self.library().isSyncing():
+            self._syncCancelled = True
+            self.library().cancelSync()
 
-        progressBar.show()
+    def _syncFinished(self):
+        """
+        Triggered when the library has finished syncing.
+
+        :rtype: None
+        """
+        progressBar = self.statusWidget().progressBar()
+        progressBar.setCancelEnabled(False)
+
+        elapsedTime = time.time() - self._syncTime
+
+        if self._syncCancelled:
+            self.statusWidget().showWarningMessage("The sync was cancelled.")
+        else:
+            msg = "Synced items in {0:.3f} seconds."
+            self.statusWidget().showInfoMessage(msg.format(elapsedTime))
+
+        self._syncCancelled = False
+
+        self.setProgressBarValue("Done")
+
+        studioqt.fadeOut(progressBar, duration=500, onFinished=progressBar.close)
 
     def setProgressBarValue(self, label, value=-1):
         """Set the progress bar label and value"""
@@ -740,6 +783,85 @@ class LibraryWindow(QtWidgets.QWidget):
         progressBar.setValue(value)
         progressBar.setText(label)
 
+    def _dataChanged(self):
+        """
+        Triggered when the library data has changed.
+
+        Everything is refreshed only when the library doesn't know which
+        items have changed. Otherwise the item signals are used.
+
+        :rtype: None
+        """
+        if self.library().dataDiff() is None:
+            self._pendingDiff = None
+            self._diffTimer.stop()
+            self.refresh()
+
+    def _itemsAdded(self, paths):
+        self.addPendingDiff("added", paths)
+
+    def _itemsRemoved(self, paths):
+        self.addPendingDiff("removed", paths)
+
+    def _itemsChanged(self, paths):
+        self.addPendingDiff("changed", paths)
+
+    def addPendingDiff(self, key, paths):
+        """
+        Add the given paths to the diff used for the next update.
+
+        :type key: str
+        :type paths: list[str]
+        :rtype: None
+        """
+        if self._pendingDiff is None:
+            self._pendingDiff = {"added": [], "removed": [], "changed": []}
+
+        self._pendingDiff[key].extend(paths)
+        self._diffTimer.start()
+
+    def _updateFromPendingDiff(self):
+        """
+        Triggered by the diff timer to update from the pending diff.
+
+        :rtype: None
+        """
+        diff = self._pendingDiff
+        self._pendingDiff = None
+
+        if diff:
+            self.updateFromDiff(diff)
+
+    def updateFromDiff(self, diff):
+        """
+        Update the sidebar and the items for the paths in the given diff.
+
+        The sidebar is only updated when folders were added, removed or
+        changed. The search is only run again when the results change.
+
+        :type diff: dict
+        :rtype: None
+        """
+        if not self.isRefreshEnabled():
+            return
+
+        library = self.library()
+        data = library.read()
+        treeWidget = self.sidebarWidget().treeWidget()
+
+        folders = any(
+            data.get(path, {}).get("type") == "Folder"
+            for path in diff["added"] + diff["changed"]
+        ) or any(
+            treeWidget.itemFromPath(path) is not None
+            for path in diff["removed"]
+        )
+
+        if folders:
+            self.refreshSidebar()
+        elif library.isResultsChanged(diff):
+            library.search()
+
     def refresh(self):
         """
         Refresh all sidebar items and library items.
@@ -1453,7 +1575,7 @@ class LibraryWindow(QtWidgets.QWidget):
 
         :rtype:  None
         """
-        self.library().saveItemData(self.library()._items, emitDataChanged=True)
+        self.library().saveItemData(self.library().createdItems(), emitDataChanged=True)
 
     # -------------------------------------------------------------------
     # Support for moving items with drag and drop
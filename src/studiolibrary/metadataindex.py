@@ -0,0 +1,302 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import logging
+
+import studiolibrary
+import studiolibrary.filelock
+
+
+__all__ = [
+    "MetadataIndex",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataIndex(object):
+
+    VERSION = 1
+
+    # Remove lock files older than this in seconds
+    STALE_LOCK_TIMEOUT = 60
+
+    def __init__(self, root, path=None):
+        """
+        An index of the metadata files of the items in a library.
+
+        Each record has the mtime and the data of the metadata file for an
+        item path. The metadata files are still the source of truth. The
+        index is used when syncing to only read the metadata files that
+        have changed, see studiolibrary.readMetadataRecord.
+
+        Records set with update, e.g. by LibraryItem.saveMetadata, are
+        marked as changed until the next sync has saved the index. An
+        incremental sync uses this to find the items with new metadata
+        without checking every metadata file.
+
+        Items without a metadata file have no record.
+
+        :type root: str
+        :type path: str or None
+        """
+        self._root = studiolibrary.normPath(root)
+        self._path = path
+        self._old = {}
+        self._new = {}
+        self._changed = set()
+
+    def path(self):
+        """
+        Get the location of the index on disc.
+
+        :rtype: str or None
+        """
+        return self._path
+
+    def key(self, path):
+        """
+        Get the key for the given path relative to the library root.
+
+        :type path: str
+        :rtype: str
+        """
+        if path.startswith(self._root):
+            return path[len(self._root):]
+        return path
+
+    def lock(self):
+        """
+        Get a lock for writing to the index from other processes.
+
+        :rtype: studiolibrary.filelock.FileLock
+        """
+        return studiolibrary.filelock.FileLock(
+            self.path() + ".lock",
+            timeout=studiolibrary.config.get("databaseLockTimeout", 30),
+            stale=self.STALE_LOCK_TIMEOUT,
+        )
+
+    def load(self):
+        """
+        Load the records by key and the changed keys from disc.
+
+        :rtype: (dict, set)
+        """
+        path = self.path()
+
+        if not path or not os.path.isfile(path):
+            return {}, set()
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as error:
+            logger.warning('Cannot read the metadata index "%s": %s', path, error)
+            return {}, set()
+
+        if data.get("version") != self.VERSION:
+            return {}, set()
+
+        return data.get("records", {}), set(data.get("changed", []))
+
+    def dump(self, records, changed):
+        """
+        Write the given records by key and the changed keys to disc.
+
+        :type records: dict
+        :type changed: set
+        :rtype: None
+        """
+        data = {
+            "version": self.VERSION,
+            "records": records,
+            "changed": sorted(changed),
+        }
+
+        studiolibrary.write(self.path(), json.dumps(data), relative=False)
+
+    def read(self):
+        """
+        Read the index from disc.
+
+        :rtype: None
+        """
+        self._old, self._changed = self.load()
+        self._new = {}
+
+    def isChanged(self, path):
+        """
+        Check if the record for the given item path was set with update.
+
+        :type path: str
+        :rtype: bool
+        """
+        return self.key(path) in self._changed
+
+    def record(self, path):
+        """
+        Get the record read for the given item path.
+
+        :type path: str
+        :rtype: dict or None
+        """
+        return self._old.get(self.key(path))
+
+    def mtime(self, path):
+        """
+        Get the metadata mtime read for the given item path.
+
+        :type path: str
+        :rtype: float or None
+        """
+        record = self.record(path)
+        return record.get("mtime") if record else None
+
+    def setRecord(self, path, record):
+        """
+        Set the record for the given item path in the new index.
+
+        Records for items without a metadata file are not stored.
+
+        :type path: str
+        :type record: dict or None
+        :rtype: None
+        """
+        key = self.key(path)
+
+        if record and record.get("mtime") is not None:
+            self._new[key] = record
+        else:
+            self._new.pop(key, None)
+
+    def save(self):
+        """
+        Replace the index on disc with the records set since it was read.
+
+        Records that have been changed by another process since the index
+        was read are kept and stay marked as changed. Errors are logged,
+        as the metadata files are read again when the index cannot be
+        written.
+
+        :rtype: None
+        """
+        try:
+            with self.lock():
+                records = dict(self._new)
+                changed = set()
+
+                current, changed_ = self.load()
+
+                for key, record in current.items():
+                    if self._old.get(key) != record:
+                        records[key] = record
+                        if key in changed_:
+                            changed.add(key)
+
+                self.dump(records, changed)
+
+        except (IOError, OSError) as error:
+            logger.warning('Cannot save the metadata index "%s": %s', self.path(), error)
+            return
+
+        self._old = records
+        self._new = {}
+        self._changed = changed
+
+    def update(self, records):
+        """
+        Set the given records by item path in the index on disc.
+
+        Use None to remove the record for an item. The items are marked
+        as changed for the next sync. Errors are logged, as for save.
+
+        :type records: dict
+        :rtype: None
+        """
+        try:
+            with self.lock():
+                records_, changed = self.load()
+
+                for path, record in records.items():
+                    key = self.key(path)
+                    changed.add(key)
+
+                    if record and record.get("mtime") is not None:
+                        records_[key] = record
+                    else:
+                        records_.pop(key, None)
+
+                self.dump(records_, changed)
+
+        except (IOError, OSError) as error:
+            logger.warning('Cannot update the metadata index "%s": %s', self.path(), error)
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(tmp)
+    path = root + "/.studiolibrary/metadataindex.json"
+
+    try:
+        index = MetadataIndex(root, path=path)
+        index.read()
+        assert index.record(root + "/a.anim") is None
+
+        index.setRecord(root + "/a.anim", {"mtime": 1.0, "data": {"color": "red"}})
+        index.setRecord(root + "/b.anim", {"mtime": None, "data": {}})
+        index.save()
+
+        index = MetadataIndex(root, path=path)
+        index.read()
+        assert index.mtime(root + "/a.anim") == 1.0
+        assert index.record(root + "/a.anim")["data"] == {"color": "red"}
+        assert index.record(root + "/b.anim") is None
+
+        # Records saved by another process while syncing are kept
+        other = MetadataIndex(root, path=path)
+        other.update({
+            root + "/a.anim": {"mtime": 2.0, "data": {"color": "blue"}},
+            root + "/c.anim": {"mtime": 3.0, "data": {}},
+        })
+
+        index.setRecord(root + "/a.anim", index.record(root + "/a.anim"))
+        index.save()
+
+        index.read()
+        assert index.mtime(root + "/a.anim") == 2.0
+        assert index.mtime(root + "/c.anim") == 3.0
+        assert index.isChanged(root + "/a.anim")
+
+        # Saving the index after the next sync clears the changes
+        index.setRecord(root + "/a.anim", index.record(root + "/a.anim"))
+        index.save()
+
+        index.read()
+        assert index.mtime(root + "/a.anim") == 2.0
+        assert not index.isChanged(root + "/a.anim")
+
+        other.update({root + "/c.anim": None})
+        index.read()
+        assert index.record(root + "/c.anim") is None
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,127 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = [
+    "PathTrie",
+]
+
+
+class PathTrie(object):
+
+    def __init__(self):
+        """
+        A trie of path segments for finding all the values under a path.
+
+        Each node is a list of [children, values] where children is a
+        dict of path segments to nodes.
+        """
+        self._root = [{}, set()]
+
+    @staticmethod
+    def split(path):
+        """
+        Split the given path into segments.
+
+        :type path: str
+        :rtype: list[str]
+        """
+        return path.rstrip("/").split("/")
+
+    def node(self, path, create=False):
+        """
+        Return the node for the given path.
+
+        :type path: str
+        :type create: bool
+        :rtype: list or None
+        """
+        node = self._root
+
+        for name in self.split(path):
+            children = node[0]
+            child = children.get(name)
+
+            if child is None:
+                if not create:
+                    return None
+                child = [{}, set()]
+                children[name] = child
+
+            node = child
+
+        return node
+
+    def add(self, path, value):
+        """
+        Add the given value to the given path.
+
+        :type path: str
+        :type value: object
+        :rtype: None
+        """
+        self.node(path, create=True)[1].add(value)
+
+    def discard(self, path, value):
+        """
+        Remove the given value from the given path if it exists.
+
+        Empty nodes are left in place as they are likely to be used again.
+
+        :type path: str
+        :type value: object
+        :rtype: None
+        """
+        node = self.node(path)
+        if node:
+            node[1].discard(value)
+
+    def find(self, path):
+        """
+        Return all the values for the given path and its children.
+
+        :type path: str
+        :rtype: set
+        """
+        values = set()
+        node = self.node(path)
+
+        if node:
+            nodes = [node]
+            while nodes:
+                children, values_ = nodes.pop()
+                values.update(values_)
+                nodes.extend(children.values())
+
+        return values
+
+
+def testsuite():
+
+    trie = PathTrie()
+    trie.add("P:/Library/a", 1)
+    trie.add("P:/Library/a/b.anim", 2)
+    trie.add("P:/Library/ab", 3)
+    trie.add("P:/Library/a/b/c.anim", 4)
+
+    assert trie.find("P:/Library/a") == set([1, 2, 4])
+    assert trie.find("P:/Library/a/") == set([1, 2, 4])
+    assert trie.find("P:/Library") == set([1, 2, 3, 4])
+    assert trie.find("P:/Library/b") == set()
+
+    trie.discard("P:/Library/a/b.anim", 2)
+    trie.discard("P:/Library/x", 2)
+    assert trie.find("P:/Library/a") == set([1, 4])
+
+
+if __name__ == "__main__":
+    testsuite()
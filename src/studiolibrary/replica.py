@@ -0,0 +1,812 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+A local read replica of a library on a network share.
+
+The database files, and the thumbnails and image sequences of each item,
+are copied to "{replicaPath}/<library-hash>". The library reads the local
+copy of the database and the items show the local thumbnails, while all
+changes are still written to the origin.
+
+A refresher thread compares the mtime and size of the origin files with
+the local copies and only copies the files that have changed. Database
+files are saved by replacing them, so they are copied without taking the
+database lock and never block the users writing to the origin. SQLite
+databases are copied with the backup API. A copy is never taken halfway
+through a save.
+The files of an item are only checked again when the "modified" value of
+the item in the database has changed, so a refresh doesn't have to visit
+every item folder on the share.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from stat import S_ISDIR
+
+import studiolibrary
+import studiolibrary.database
+
+
+__all__ = [
+    "Replica",
+    "ReplicaDatabase",
+    "ReplicaRefresher",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Replica(object):
+
+    VERSION = 1
+
+    # The files of each item that are copied. Folders are copied recursively.
+    ITEM_NAMES = ("thumbnail.jpg", "thumbnail.png", "sequence")
+
+    # Lock files and temporary files are never copied
+    IGNORE_EXTENSIONS = (".lock", ".delete", ".stale", ".tmp")
+
+    def __init__(self, root, databasePath, path=None):
+        """
+        Mirror the database and the item previews of a library locally.
+
+        :type root: str
+        :type databasePath: str
+        :type path: str or None
+        """
+        self._root = studiolibrary.normPath(root)
+        self._databasePath = studiolibrary.normPath(databasePath)
+        self._path = studiolibrary.normPath(path or self.defaultPath(root))
+
+        self._lock = threading.Lock()
+        self._items = {}
+        self._refreshed = None
+        self._requested = threading.Event()
+
+        self.loadManifest()
+
+    @staticmethod
+    def key(root):
+        """
+        Get the name of the cache folder for the given library root.
+
+        :type root: str
+        :rtype: str
+        """
+        root = studiolibrary.normPath(root)
+        return hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def defaultPath(cls, root):
+        """
+        Get the cache folder for the given root from the "replicaPath" config.
+
+        :type root: str
+        :rtype: str
+        """
+        formatString = studiolibrary.config.get("replicaPath", "{local}/StudioLibrary/cache")
+        return studiolibrary.formatPath(formatString) + "/" + cls.key(root)
+
+    def path(self):
+        """
+        Get the local folder of the replica.
+
+        :rtype: str
+        """
+        return self._path
+
+    def root(self):
+        """
+        Get the root path of the library on the origin.
+
+        :rtype: str
+        """
+        return self._root
+
+    def databaseDir(self):
+        """
+        Get the folder of the database on the origin.
+
+        :rtype: str
+        """
+        return os.path.dirname(self._databasePath)
+
+    def manifestPath(self):
+        """
+        Get the file that records the items that have been copied.
+
+        :rtype: str
+        """
+        return self.path() + "/replica.json"
+
+    def refreshed(self):
+        """
+        Get the time when the last complete refresh was started.
+
+        :rtype: float or None
+        """
+        return self._refreshed
+
+    def requestRefresh(self):
+        """
+        Ask the refresher to refresh the replica now.
+
+        :rtype: None
+        """
+        self._requested.set()
+
+    def waitForRequest(self, timeout):
+        """
+        Wait until a refresh is requested or the timeout has passed.
+
+        :type timeout: float
+        :rtype: None
+        """
+        self._requested.wait(timeout)
+        self._requested.clear()
+
+    def mirrorPath(self, path):
+        """
+        Get the location in the replica for the given origin path.
+
+        The database files are kept in a "database" folder and the item
+        files in an "items" folder of the replica.
+
+        :type path: str
+        :rtype: str or None
+        """
+        path = studiolibrary.normPath(path)
+
+        for src, dst in [(self.databaseDir(), "/database"), (self._root, "/items")]:
+            if path == src:
+                return self.path() + dst
+            if path.startswith(src + "/"):
+                return self.path() + dst + path[len(src):]
+
+        return None
+
+    def localPath(self, path):
+        """
+        Get the local copy of the given item file if its item is mirrored.
+
+        The origin path is returned for the items that haven't been
+        copied yet, so it's safe to use for any path.
+
+        Example:
+            replica.localPath("/library/a.anim/thumbnail.jpg")
+            # /home/user/StudioLibrary/cache/<key>/items/a.anim/thumbnail.jpg
+
+        :type path: str
+        :rtype: str
+        """
+        path = studiolibrary.normPath(path)
+        dirname = os.path.dirname(path)
+
+        while dirname.startswith(self._root):
+            if dirname in self._items:
+                return self.mirrorPath(path)
+
+            parent = os.path.dirname(dirname)
+            if parent == dirname:
+                break
+            dirname = parent
+
+        return path
+
+    def loadManifest(self):
+        """
+        Read the items that have been copied in a previous session.
+
+        :rtype: None
+        """
+        try:
+            with open(self.manifestPath(), "r") as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if manifest.get("version") != self.VERSION or manifest.get("root") != self._root:
+            return
+
+        self._items = dict(
+            (self._root + "/" + path if path != "." else self._root, modified)
+            for path, modified in manifest.get("items", {}).items()
+        )
+        self._refreshed = manifest.get("refreshed")
+
+    def saveManifest(self):
+        """
+        Write the copied items so they are reused in the next session.
+
+        :rtype: None
+        """
+        with self._lock:
+            items = dict(
+                (os.path.relpath(path, self._root).replace("\\", "/"), modified)
+                for path, modified in self._items.items()
+            )
+
+            manifest = {
+                "version": self.VERSION,
+                "root": self._root,
+                "refreshed": self._refreshed,
+                "items": items,
+            }
+
+        studiolibrary.write(self.manifestPath(), json.dumps(manifest), relative=False)
+
+    def isIgnored(self, name):
+        """
+        Check if the given file name should not be copied.
+
+        :type name: str
+        :rtype: bool
+        """
+        return name.endswith(self.IGNORE_EXTENSIONS)
+
+    def copyFile(self, src, dst, stat):
+        """
+        Copy the given file if its mtime or size is different to the local copy.
+
+        The file is copied to a temporary file first and then renamed so
+        that readers never see a partial file. The mtime is copied as well,
+        so the local database has the same mtime as the origin. Files that
+        are removed from the origin while copying are skipped.
+
+        :type src: str
+        :type dst: str
+        :type stat: os.stat_result
+        :rtype: bool
+        """
+        try:
+            local = os.stat(dst)
+        except OSError:
+            local = None
+
+        if local and local.st_mtime == stat.st_mtime and local.st_size == stat.st_size:
+            return False
+
+        dirname = os.path.dirname(dst)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        tmp = dst + ".tmp"
+
+        try:
+            shutil.copy2(src, tmp)
+        except (IOError, OSError) as error:
+            logger.debug("Cannot copy the file to the replica: %s", error)
+            studiolibrary.silentRemove(tmp)
+            return False
+
+        if hasattr(os, "replace"):
+            os.replace(tmp, dst)
+        else:
+            studiolibrary.silentRemove(dst)
+            os.rename(tmp, dst)
+
+        return True
+
+    def removeLocal(self, dst, names):
+        """
+        Remove the given files and folders from the given local folder.
+
+        :type dst: str
+        :type names: list[str]
+        :rtype: None
+        """
+        for name in names:
+            path = dst + "/" + name
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                studiolibrary.silentRemove(path)
+
+    def mirror(self, src, dst, match=None):
+        """
+        Copy the changed files in the given origin folder to the replica.
+
+        Sub folders are copied first, and the local files and folders that
+        have been removed from the origin are removed.
+
+        :type src: str
+        :type dst: str
+        :type match: callable or None
+        :rtype: int
+        """
+        copied = 0
+        files = []
+        folders = []
+
+        try:
+            names = os.listdir(src)
+        except OSError:
+            names = []
+
+        for name in names:
+            if self.isIgnored(name) or (match and not match(name)):
+                continue
+
+            try:
+                stat = os.stat(src + "/" + name)
+            except OSError:
+                continue
+
+            if S_ISDIR(stat.st_mode):
+                folders.append(name)
+            else:
+                files.append((name, stat))
+
+        for name in sorted(folders):
+            copied += self.mirror(src + "/" + name, dst + "/" + name)
+
+        for name, stat in sorted(files):
+            if self.copyFile(src + "/" + name, dst + "/" + name, stat):
+                copied += 1
+
+        try:
+            local = os.listdir(dst)
+        except OSError:
+            local = []
+
+        names = set(folders) | set(name for name, stat in files)
+        removed = [
+            name for name in local
+            if name not in names and (not match or match(name))
+        ]
+        self.removeLocal(dst, removed)
+
+        return copied
+
+    def backupDatabase(self, src):
+        """
+        Copy the given SQLite database if it has changed on the origin.
+
+        The database is copied with the SQLite backup API, so the copy
+        only has committed changes even while other processes write to
+        it. The "-wal" and "-journal" files are never copied.
+
+        :type src: str
+        :rtype: int
+        """
+        try:
+            stat = os.stat(src)
+        except OSError:
+            return 0
+
+        dst = self.mirrorPath(src)
+
+        try:
+            local = os.stat(dst)
+        except OSError:
+            local = None
+
+        if local and local.st_mtime == stat.st_mtime and local.st_size == stat.st_size:
+            return 0
+
+        dirname = os.path.dirname(dst)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        tmp = dst + ".tmp"
+        studiolibrary.silentRemove(tmp)
+
+        source = sqlite3.connect(src, timeout=30, isolation_level=None)
+
+        try:
+            if hasattr(source, "backup"):
+                target = sqlite3.connect(tmp)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            else:
+                # Older Python versions don't have the backup API. Writers
+                # can't commit while the read transaction is open.
+                source.execute("BEGIN")
+                source.execute("SELECT count(*) FROM sqlite_master").fetchall()
+                shutil.copyfile(src, tmp)
+                source.execute("ROLLBACK")
+        finally:
+            source.close()
+
+        # Keep the mtime of the origin, like copyFile
+        os.utime(tmp, (stat.st_atime, stat.st_mtime))
+
+        if hasattr(os, "replace"):
+            os.replace(tmp, dst)
+        else:
+            studiolibrary.silentRemove(dst)
+            os.rename(tmp, dst)
+
+        return 1
+
+    def refreshDatabase(self, origin=None):
+        """
+        Copy the database files that have changed on the given origin.
+
+        Only the files with the same name as the configured database path,
+        and the "shards" folder of the sharded backend, are copied. The
+        origin is not locked, as a refresh over a slow connection would
+        stop other users from saving. The json files and shards are
+        replaced when written and the journal is only read up to the last
+        complete record, so each file copy is whole. Files changed while
+        copying are copied again on the next refresh.
+
+        :type origin: studiolibrary.database.Database or None
+        :rtype: int
+        """
+        if isinstance(origin, studiolibrary.database.SqliteDatabase):
+            return self.backupDatabase(origin.path())
+
+        stem = os.path.splitext(os.path.basename(self._databasePath))[0]
+
+        def match(name):
+            return name == "shards" or name.startswith(stem + ".")
+
+        src = self.databaseDir()
+        dst = self.path() + "/database"
+
+        return self.mirror(src, dst, match=match)
+
+    def refreshItems(self, items, full=False):
+        """
+        Copy the thumbnails and sequences of the items that have changed.
+
+        The items are a dict of the "modified" value for each item path.
+        Items with the same modified value as the last copy are skipped
+        unless full is True.
+
+        :type items: dict
+        :type full: bool
+        :rtype: int
+        """
+        copied = 0
+
+        def match(name):
+            return name in self.ITEM_NAMES
+
+        for path, modified in items.items():
+            if not full and path in self._items and self._items[path] == modified:
+                continue
+
+            dst = self.mirrorPath(path)
+            if dst:
+                copied += self.mirror(path, dst, match=match)
+
+            with self._lock:
+                self._items[path] = modified
+
+        for path in [path for path in self._items if path not in items]:
+            dst = self.mirrorPath(path)
+            if dst:
+                self.removeLocal(dst, self.ITEM_NAMES)
+
+            with self._lock:
+                self._items.pop(path, None)
+
+        return copied
+
+    def refresh(self, database=None, full=False, origin=None):
+        """
+        Copy the database and the item files that have changed on the origin.
+
+        The items are read from the given database, which should read the
+        local copy of the database. The origin database is used to copy
+        the database files safely, see refreshDatabase.
+
+        :type database: studiolibrary.database.Database or None
+        :type full: bool
+        :type origin: studiolibrary.database.Database or None
+        :rtype: int
+        """
+        started = time.time()
+        copied = self.refreshDatabase(origin)
+
+        if database:
+            items = dict(
+                (path, itemData.get("modified"))
+                for path, itemData in database.read().items()
+            )
+            copied += self.refreshItems(items, full=full)
+
+        self._refreshed = started
+        self.saveManifest()
+
+        logger.debug("Refreshed the replica %s in %.3fs", self.path(), time.time() - started)
+
+        return copied
+
+
+class ReplicaDatabase(studiolibrary.database.Database):
+
+    def __init__(self, database, replica):
+        """
+        Read the item data from the local replica of the given database.
+
+        All changes are written to the origin database. The item data is
+        read from the origin after a change until the replica has been
+        refreshed with it.
+
+        :type database: studiolibrary.database.Database
+        :type replica: Replica
+        """
+        super(ReplicaDatabase, self).__init__(database.path(), database.root())
+
+        self._origin = database
+        self._replica = replica
+        self._local = self.createLocal()
+        self._written = None
+
+    def origin(self):
+        """
+        Get the database on the origin.
+
+        :rtype: studiolibrary.database.Database
+        """
+        return self._origin
+
+    def replica(self):
+        """
+        Get the replica that has the local copy of the database.
+
+        :rtype: Replica
+        """
+        return self._replica
+
+    def createLocal(self):
+        """
+        Create a database of the same backend that reads the local copy.
+
+        Each thread should use its own instance.
+
+        :rtype: studiolibrary.database.Database
+        """
+        path = self._replica.mirrorPath(self._origin.path())
+        return self._origin.__class__(path, self._origin.root())
+
+    def isLocal(self):
+        """
+        Check if the local copy has every change written by this database.
+
+        :rtype: bool
+        """
+        refreshed = self._replica.refreshed()
+
+        if refreshed is None:
+            return False
+
+        return self._written is None or refreshed > self._written
+
+    def current(self):
+        """
+        Get the database that should be read from.
+
+        :rtype: studiolibrary.database.Database
+        """
+        return self._local if self.isLocal() else self._origin
+
+    def exists(self):
+        return self._origin.exists()
+
+    def lockPath(self):
+        return self._origin.lockPath()
+
+    def lock(self, timeout=None):
+        return self._origin.lock(timeout=timeout)
+
+    def watchPaths(self):
+        return self._local.watchPaths()
+
+    def mtime(self):
+        return self.current().mtime()
+
+    def read(self, paths=None):
+        return self.current().read(paths)
+
+    def written(self):
+        """
+        Called after every change to the origin database.
+
+        :rtype: None
+        """
+        self._written = time.time()
+        self._replica.requestRefresh()
+
+    def save(self, data, base=None):
+        self._origin.save(data, base=base)
+        self.written()
+
+    def update(self, data):
+        self._origin.update(data)
+        self.written()
+
+    def remove(self, paths):
+        self._origin.remove(paths)
+        self.written()
+
+    def rename(self, src, dst):
+        self._origin.rename(src, dst)
+        self.written()
+
+
+class ReplicaRefresher(threading.Thread):
+
+    def __init__(self, replica, database=None, interval=30, origin=None):
+        """
+        Refresh the given replica in the background at the given interval.
+
+        The given database should read the local copy and is only used
+        by this thread. The origin database is only used to find the
+        backend, see refreshDatabase.
+
+        :type replica: Replica
+        :type database: studiolibrary.database.Database or None
+        :type interval: float
+        :type origin: studiolibrary.database.Database or None
+        """
+        super(ReplicaRefresher, self).__init__()
+
+        self.daemon = True
+
+        self._replica = replica
+        self._origin = origin
+        self._database = database
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self, wait=False):
+        """
+        Stop refreshing the replica.
+
+        :type wait: bool
+        :rtype: None
+        """
+        self._stopped.set()
+        self._replica.requestRefresh()
+
+        if wait and self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._replica.refresh(self._database, origin=self._origin)
+            except Exception:
+                logger.exception("Cannot refresh the replica %s", self._replica.path())
+
+            self._replica.waitForRequest(self._interval)
+
+
+def testsuite():
+
+    import tempfile
+
+    tmp = tempfile.mkdtemp().replace("\\", "/")
+    root = tmp + "/library"
+
+    try:
+        for name in ["a.anim", "b.anim"]:
+            os.makedirs(root + "/" + name + "/sequence")
+            studiolibrary.write(root + "/" + name + "/thumbnail.jpg", name, relative=False)
+            studiolibrary.write(root + "/" + name + "/sequence/0001.jpg", name, relative=False)
+            studiolibrary.write(root + "/" + name + "/scene.anim", name, relative=False)
+
+        data = {
+            root + "/a.anim": {"name": "a.anim", "modified": 1.0},
+            root + "/b.anim": {"name": "b.anim", "modified": 1.0},
+        }
+
+        databasePath = root + "/.studiolibrary/database.json"
+        origin = studiolibrary.database.JsonDatabase(databasePath, root)
+        origin.save(data)
+
+        replica = Replica(root, databasePath, path=tmp + "/cache")
+        db = ReplicaDatabase(origin, replica)
+
+        # Read from the origin until the replica has been refreshed
+        assert db.current() is origin
+        assert replica.localPath(root + "/a.anim/thumbnail.jpg") == root + "/a.anim/thumbnail.jpg"
+
+        assert replica.refresh(db.createLocal()) == 5
+        assert db.current() is not origin
+        assert db.read() == data
+        assert db.mtime() == origin.mtime()
+
+        local = replica.localPath(root + "/a.anim/thumbnail.jpg")
+        assert local == tmp + "/cache/items/a.anim/thumbnail.jpg", local
+        assert studiolibrary.read(local) == "a.anim"
+        assert os.path.exists(replica.localPath(root + "/a.anim/sequence/0001.jpg"))
+        assert not os.path.exists(tmp + "/cache/items/a.anim/scene.anim")
+
+        # Nothing is copied when nothing has changed
+        assert replica.refresh(db.createLocal()) == 0
+
+        # Changes are written to the origin and read from it until refreshed
+        data[root + "/a.anim"] = {"name": "a.anim", "modified": 2.0}
+        studiolibrary.write(root + "/a.anim/thumbnail.jpg", "changed", relative=False)
+        db.update({root + "/a.anim": data[root + "/a.anim"]})
+
+        assert db.current() is origin
+        assert origin.read() == data
+
+        time.sleep(0.01)
+        assert replica.refresh(db.createLocal()) == 2
+        assert db.current() is not origin
+        assert db.read() == data
+        assert studiolibrary.read(local) == "changed"
+
+        # Removed items are removed from the replica
+        db.remove([root + "/b.anim"])
+        time.sleep(0.01)
+        replica.refresh(db.createLocal())
+        assert not os.path.exists(tmp + "/cache/items/b.anim/thumbnail.jpg")
+
+        # The copied files are reused by the next session
+        replica = Replica(root, databasePath, path=tmp + "/cache")
+        assert replica.refreshed() is not None
+        assert replica.localPath(root + "/a.anim/thumbnail.jpg") == local
+        assert replica.refresh(db.createLocal()) == 0
+
+        # Refreshing doesn't wait for the users writing to the origin
+        def hold(seconds):
+            with origin.lock():
+                time.sleep(seconds)
+
+        thread = threading.Thread(target=hold, args=(2,))
+        thread.start()
+
+        while not os.path.exists(origin.lockPath()):
+            time.sleep(0.01)
+
+        started = time.time()
+        replica.refresh(db.createLocal(), origin=origin)
+        assert time.time() - started < 1
+        thread.join()
+
+        # Files removed from the origin while refreshing are skipped
+        stat = os.stat(databasePath)
+        assert not replica.copyFile(root + "/missing.json", tmp + "/cache/missing.json", stat)
+        assert not os.path.exists(tmp + "/cache/missing.json.tmp")
+
+        # SQLite databases are copied with the backup API
+        origin = studiolibrary.database.SqliteDatabase(databasePath, root)
+        origin.save(data)
+
+        replica = Replica(root, databasePath, path=tmp + "/sqlite")
+        db = ReplicaDatabase(origin, replica)
+
+        with origin.connect(write=True) as connection:
+            # A transaction that hasn't been committed isn't copied
+            connection.execute("DELETE FROM items")
+            assert replica.refreshDatabase(origin) == 1
+            connection.rollback()
+
+        replica.refresh(db.createLocal(), origin=origin)
+        assert db.current() is not origin
+        assert db.read() == data
+        assert db.mtime() == origin.mtime()
+        assert not os.path.exists(tmp + "/sqlite/database/database.sqlite-journal")
+        assert replica.refresh(db.createLocal(), origin=origin) == 0
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
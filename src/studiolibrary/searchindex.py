@@ -0,0 +1,279 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import bisect
+import logging
+
+
+__all__ = [
+    "SearchIndex",
+]
+
+logger = logging.getLogger(__name__)
+
+
+# The words in the search text of an item and in a search term
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchIndex(object):
+
+    # Words found in more tokens than this are not looked up in the index
+    MAX_TOKENS = 20000
+
+    # Words found in more than this fraction of the records are not used
+    MAX_FRACTION = 0.5
+
+    def __init__(self, records=None):
+        """
+        An inverted index of the words in the search text of each record.
+
+        The index is used to find the records for "*" contains filters
+        without checking the text of every record. Any text that contains
+        a search term also contains each word of the term within one of
+        its own words, so the records with those words are a superset of
+        the matches. The candidates are then checked against their text.
+
+        Terms with common words can't narrow the search, so find returns
+        None and the caller checks the text of every record instead.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        self._postings = {}
+        self._tokens = {}
+        self._vocabulary = None
+
+        if records:
+            self.add(records)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, record):
+        return record in self._tokens
+
+    def records(self):
+        """
+        Get the records in the index.
+
+        :rtype: list[studiolibrary.itemrecord.ItemRecord]
+        """
+        return list(self._tokens)
+
+    def sync(self, records):
+        """
+        Add and remove records so that the index has the given records.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :rtype: None
+        """
+        current = set(records)
+
+        self.remove([record for record in self._tokens if record not in current])
+        self.add([record for record in records if record not in self._tokens])
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Get the unique words in the given text.
+
+        :type text: str
+        :rtype: set[str]
+        """
+        return set(TOKEN_RE.findall(text))
+
+    def add(self, records):
+        """
+        Add the given records to the index.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :rtype: None
+        """
+        postings = self._postings
+
+        for record in records:
+            if record in self._tokens:
+                continue
+
+            tokens = self.tokenize(record.searchText())
+            self._tokens[record] = tokens
+
+            for token in tokens:
+                posting = postings.get(token)
+                if posting is None:
+                    postings[token] = set([record])
+                    self._vocabulary = None
+                else:
+                    posting.add(record)
+
+    def remove(self, records):
+        """
+        Remove the given records from the index.
+
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :rtype: None
+        """
+        postings = self._postings
+
+        for record in records:
+            tokens = self._tokens.pop(record, None)
+
+            for token in tokens or []:
+                posting = postings[token]
+                posting.discard(record)
+
+                if not posting:
+                    del postings[token]
+                    self._vocabulary = None
+
+    def vocabulary(self):
+        """
+        Get all the words joined by new lines and the offset of each word.
+
+        The joined text is searched with str.find to get the words that
+        contain a search word, and is created again when words are added
+        or removed.
+
+        :rtype: (str, list[int], list[str])
+        """
+        if self._vocabulary is None:
+            tokens = list(self._postings)
+            offsets = []
+            offset = 0
+
+            for token in tokens:
+                offsets.append(offset)
+                offset += len(token) + 1
+
+            self._vocabulary = ("\n".join(tokens), offsets, tokens)
+
+        return self._vocabulary
+
+    def tokensContaining(self, word, limit=None):
+        """
+        Get the words in the index that contain the given word.
+
+        :type word: str
+        :type limit: int or None
+        :rtype: list[str] or None
+        """
+        text, offsets, tokens = self.vocabulary()
+        results = []
+
+        # The word can be found more than once in a token
+        if limit is not None and text.count(word) > limit * 2:
+            return None
+
+        index = text.find(word)
+
+        while index != -1:
+            i = bisect.bisect_right(offsets, index) - 1
+            results.append(tokens[i])
+
+            if limit is not None and len(results) > limit:
+                return None
+
+            index = text.find(word, offsets[i] + len(tokens[i]) + 1)
+
+        return results
+
+    def find(self, term):
+        """
+        Get the records with a search text that contains the given term.
+
+        Returns None when the term is too common for the index to help.
+
+        :type term: str
+        :rtype: set[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        term = term.lower()
+        words = sorted(set(TOKEN_RE.findall(term)), key=len, reverse=True)
+        maximum = len(self._tokens) * self.MAX_FRACTION
+        exact = words == [term]
+        results = None
+
+        for word in words:
+            tokens = self.tokensContaining(word, limit=self.MAX_TOKENS)
+
+            if tokens is None or sum(len(self._postings[t]) for t in tokens) > maximum:
+                exact = False
+                continue
+
+            records = set()
+            for token in tokens:
+                records.update(self._postings[token])
+
+            results = records if results is None else results & records
+
+            if not results:
+                return results
+
+        if results is None:
+            return None
+
+        # The records only need to be checked when the term has other
+        # characters than a single word, or when a word was too common
+        if not exact:
+            results = set(record for record in results if term in record.searchText())
+
+        return results
+
+
+def testsuite():
+
+    import random
+
+    import studiolibrary.itemrecord
+
+    rand = random.Random(0)
+    words = ["red", "Blue", "green", "anim", "pose", "walk_cycle", "run", "v002"]
+
+    records = []
+    for i in range(500):
+        itemData = {
+            "name": "{0}_{1}.anim".format(rand.choice(words), i),
+            "tags": [rand.choice(words) for _ in range(2)],
+            "index": i,
+        }
+        records.append(studiolibrary.itemrecord.ItemRecord(str(i), itemData))
+
+    index = SearchIndex(records[:400])
+    index.add(records[400:])
+    index.remove(records[:50])
+
+    # Sync removes and adds the difference
+    index.sync(records[50:450])
+    assert len(index) == 400
+    index.sync(records[50:])
+
+    current = records[50:]
+    assert len(index) == len(current)
+
+    terms = words + ["e", "ed", "re", "cycle", "e_c", "anim', '", "12", "_1", "xyz", "'", ""]
+
+    for term in terms:
+        expected = set(r for r in current if term.lower() in r.searchText())
+        found = index.find(term)
+
+        if found is None:
+            assert len(expected) > 0 or not term.strip("'"), term
+        else:
+            assert found == expected, (term, len(found), len(expected))
+
+    # Terms found in a few records are resolved by the index
+    assert index.find("v002_1") is not None
+    assert index.find("xyz") == set()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,154 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import logging
+import threading
+
+
+__all__ = [
+    "SearchWorker",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class SearchWorker(threading.Thread):
+
+    def __init__(self, library, records, queries, index=None):
+        """
+        Match, sort and group the given records in a thread.
+
+        The worker only reads the records and the search index. The
+        library creates the items for the results on the main thread,
+        see Library.startSearch.
+
+        :type library: studiolibrary.Library
+        :type records: list[studiolibrary.itemrecord.ItemRecord]
+        :type queries: list[dict]
+        :type index: studiolibrary.searchindex.SearchIndex or None
+        """
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+
+        self._index = index
+        self._error = None
+        self._records = records
+        self._queries = queries
+        self._sortBy = list(library.sortBy())
+        self._groupBy = list(library.groupBy())
+        self._library = library
+        self._matches = None
+        self._results = None
+        self._groups = None
+        self._cancelled = False
+        self._startTime = time.time()
+
+    def queries(self):
+        """
+        Get the queries used for the search.
+
+        :rtype: list[dict]
+        """
+        return self._queries
+
+    def startTime(self):
+        """
+        Get the time when the search was started.
+
+        :rtype: float
+        """
+        return self._startTime
+
+    def error(self):
+        """
+        Get the error raised by the worker if it failed.
+
+        :rtype: Exception or None
+        """
+        return self._error
+
+    def cancel(self):
+        """
+        Stop the worker without finishing the search.
+
+        :rtype: None
+        """
+        self._cancelled = True
+
+    def isCancelled(self):
+        """
+        Check if the worker has been cancelled.
+
+        :rtype: bool
+        """
+        return self._cancelled
+
+    def matches(self):
+        """
+        Get the records that match the queries before sorting.
+
+        :rtype: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        return self._matches
+
+    def results(self):
+        """
+        Get the sorted records that match the queries.
+
+        :rtype: list[studiolibrary.itemrecord.ItemRecord] or None
+        """
+        return self._results
+
+    def groups(self):
+        """
+        Get the sorted records grouped by the group by field.
+
+        :rtype: dict or None
+        """
+        return self._groups
+
+    def run(self):
+        """
+        Overriding this method to run the search in the thread.
+
+        :rtype: None
+        """
+        library = self._library
+
+        try:
+            self._matches = library.matchRecords(
+                self._records,
+                self._queries,
+                index=self._index,
+                isCancelled=self.isCancelled,
+            )
+
+            if self._matches is None or self._cancelled:
+                return
+
+            results = self._matches
+            if self._sortBy:
+                results = library.sorted(results, self._sortBy)
+
+            if self._cancelled:
+                return
+
+            self._groups = library.groupItems(results, self._groupBy)
+            self._results = results
+
+        except Exception as error:
+            # The records of a cancelled search can change while reading
+            if not self._cancelled:
+                logger.exception("Cannot search the library")
+            self._error = error
@@ -0,0 +1,200 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import logging
+
+import studiolibrary
+
+
+__all__ = [
+    "Snapshot",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(object):
+
+    VERSION = 1
+
+    def __init__(self, root, path=None, signature=None):
+        """
+        A snapshot of the directories visited when syncing a library.
+
+        Each directory entry stores the mtime, inode and the valid children
+        found when the directory was last listed. A directory whose mtime
+        and inode have not changed can reuse the stored children without
+        listing the directory again.
+
+        :type root: str
+        :type path: str or None
+        :type signature: str or None
+        """
+        self._root = studiolibrary.normPath(root)
+        self._path = path
+        self._signature = signature or ""
+        self._old = {}
+        self._new = {}
+
+    def path(self):
+        """
+        Get the location of the snapshot on disc.
+
+        :rtype: str or None
+        """
+        return self._path
+
+    def signature(self):
+        """
+        Get the signature used to invalidate snapshots from other settings.
+
+        :rtype: str
+        """
+        return self._signature
+
+    def key(self, path):
+        """
+        Get the key for the given path relative to the library root.
+
+        :type path: str
+        :rtype: str
+        """
+        if path.startswith(self._root):
+            return path[len(self._root):]
+        return path
+
+    def read(self):
+        """
+        Read the previous snapshot from disc.
+
+        The snapshot is ignored if the version or signature doesn't match.
+
+        :rtype: None
+        """
+        self._old = {}
+        path = self.path()
+
+        if not path or not os.path.isfile(path):
+            return
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as error:
+            logger.warning('Cannot read the sync snapshot "%s": %s', path, error)
+            return
+
+        if data.get("version") != self.VERSION:
+            return
+
+        if data.get("signature") != self.signature():
+            logger.debug("The sync snapshot signature has changed")
+            return
+
+        self._old = data.get("entries", {})
+
+    def save(self):
+        """
+        Write the directories visited during the current sync to disc.
+
+        :rtype: None
+        """
+        data = {
+            "version": self.VERSION,
+            "signature": self.signature(),
+            "entries": self._new,
+        }
+
+        studiolibrary.write(self.path(), json.dumps(data), relative=False)
+
+    def isUnchanged(self, path, stat):
+        """
+        Check if the given directory has the same mtime and inode as before.
+
+        :type path: str
+        :type stat: os.stat_result
+        :rtype: bool
+        """
+        entry = self._old.get(self.key(path))
+        return bool(
+            entry and
+            entry["mtime"] == stat.st_mtime and
+            entry["inode"] == stat.st_ino
+        )
+
+    def children(self, path, stat):
+        """
+        Get the stored children for the given directory if it hasn't changed.
+
+        Each child is a list of [name, className, isdir].
+
+        :type path: str
+        :type stat: os.stat_result
+        :rtype: list[list] or None
+        """
+        if self.isUnchanged(path, stat):
+            return self._old[self.key(path)].get("children")
+        return None
+
+    def setChildren(self, path, stat, children):
+        """
+        Store the children for the given directory in the new snapshot.
+
+        :type path: str
+        :type stat: os.stat_result
+        :type children: list[list]
+        :rtype: None
+        """
+        self._new[self.key(path)] = {
+            "mtime": stat.st_mtime,
+            "inode": stat.st_ino,
+            "children": children,
+        }
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    root = studiolibrary.normPath(tmp)
+    path = root + "/.studiolibrary/snapshot.json"
+
+    try:
+        os.makedirs(root + "/folder")
+        stat = os.stat(root + "/folder")
+
+        snapshot = Snapshot(root, path=path, signature="test")
+        snapshot.setChildren(root + "/folder", stat, [["a.anim", "AnimItem", True]])
+        snapshot.save()
+
+        snapshot = Snapshot(root, path=path, signature="test")
+        snapshot.read()
+        assert snapshot.isUnchanged(root + "/folder", stat)
+        assert snapshot.children(root + "/folder", stat) == [["a.anim", "AnimItem", True]]
+
+        os.makedirs(root + "/folder/b.anim")
+        stat = os.stat(root + "/folder")
+        assert snapshot.children(root + "/folder", stat) is None
+
+        snapshot = Snapshot(root, path=path, signature="other")
+        snapshot.read()
+        assert not snapshot.isUnchanged(root + "/folder", stat)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    testsuite()
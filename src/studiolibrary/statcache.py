@@ -0,0 +1,373 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+import contextlib
+import collections
+from stat import S_ISDIR
+
+
+__all__ = [
+    "StatCache",
+    "current",
+    "stat",
+    "exists",
+    "isdir",
+    "getmtime",
+    "listdir",
+]
+
+
+_local = threading.local()
+
+
+class StatCache(object):
+
+    def __init__(self):
+        """
+        Cache the directory listings and stats seen while syncing.
+
+        The walker adds the listings from os.scandir and the stats of the
+        directories it walks. Use the module functions, e.g. exists and
+        getmtime, to query the cache that is active for the current
+        thread. They fall back to the file system for unknown paths.
+
+        The cache is not invalidated, so only use it for a single sync.
+        """
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._listings = {}
+        self._hits = collections.Counter()
+        self._misses = collections.Counter()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Use the cache for the module functions in the current thread.
+
+        :rtype: None
+        """
+        previous = current()
+        _local.cache = self
+        try:
+            yield self
+        finally:
+            _local.cache = previous
+
+    def addStat(self, path, stat_):
+        """
+        Add the stat for the given path. None if the path doesn't exist.
+
+        :type path: str
+        :type stat_: os.stat_result or None
+        :rtype: None
+        """
+        self._stats[path] = stat_
+
+    def addListing(self, path, entries):
+        """
+        Add the complete listing for the given directory.
+
+        :type path: str
+        :type entries: list[(str, bool or None)]
+        :rtype: None
+        """
+        self._listings[path] = dict(entries)
+
+    def hits(self):
+        """
+        Get the number of file system calls avoided for each function.
+
+        :rtype: dict
+        """
+        return dict(self._hits)
+
+    def misses(self):
+        """
+        Get the number of file system calls made for each function.
+
+        :rtype: dict
+        """
+        return dict(self._misses)
+
+    def counters(self):
+        """
+        Get the number of file system calls avoided and made.
+
+        :rtype: dict
+        """
+        return {
+            "avoided": sum(self._hits.values()),
+            "calls": sum(self._misses.values()),
+            "hits": self.hits(),
+            "misses": self.misses(),
+        }
+
+    def _count(self, name, hit):
+        """
+        Count a call to the given function.
+
+        :type name: str
+        :type hit: bool
+        :rtype: None
+        """
+        with self._lock:
+            if hit:
+                self._hits[name] += 1
+            else:
+                self._misses[name] += 1
+
+    def _lookup(self, path):
+        """
+        Check if the path exists using only the cached data.
+
+        Returns None if the cache doesn't know. A path inside a directory
+        that is known to not exist doesn't exist either.
+
+        :type path: str
+        :rtype: bool or None
+        """
+        if path in self._stats:
+            return self._stats[path] is not None
+
+        dirname, name = path.rsplit("/", 1) if "/" in path else ("", path)
+
+        if dirname in self._listings:
+            return name in self._listings[dirname]
+
+        if dirname and dirname != path and self._lookup(dirname) is False:
+            return False
+
+        return None
+
+    def stat(self, path):
+        """
+        Get the stat for the given path. None if it doesn't exist.
+
+        :type path: str
+        :rtype: os.stat_result or None
+        """
+        if path in self._stats:
+            self._count("stat", True)
+            return self._stats[path]
+
+        if self._lookup(path) is False:
+            self._count("stat", True)
+            return None
+
+        self._count("stat", False)
+
+        try:
+            stat_ = os.stat(path)
+        except OSError:
+            stat_ = None
+
+        self._stats[path] = stat_
+        return stat_
+
+    def exists(self, path):
+        """
+        Check if the given path exists.
+
+        :type path: str
+        :rtype: bool
+        """
+        exists_ = self._lookup(path)
+
+        if exists_ is not None:
+            self._count("exists", True)
+            return exists_
+
+        self._count("exists", False)
+
+        try:
+            self._stats[path] = os.stat(path)
+        except OSError:
+            self._stats[path] = None
+
+        return self._stats[path] is not None
+
+    def isdir(self, path):
+        """
+        Check if the given path is a directory.
+
+        :type path: str
+        :rtype: bool
+        """
+        if path in self._stats:
+            self._count("isdir", True)
+            stat_ = self._stats[path]
+            return stat_ is not None and S_ISDIR(stat_.st_mode)
+
+        dirname, name = path.rsplit("/", 1) if "/" in path else ("", path)
+        isdir_ = self._listings.get(dirname, {}).get(name)
+
+        if isdir_ is not None:
+            self._count("isdir", True)
+            return isdir_
+
+        if self._lookup(path) is False:
+            self._count("isdir", True)
+            return False
+
+        self._count("isdir", False)
+        return os.path.isdir(path)
+
+    def getmtime(self, path):
+        """
+        Get the modified time for the given path.
+
+        :type path: str
+        :raises: OSError if the path doesn't exist
+        :rtype: float
+        """
+        if path in self._stats and self._stats[path] is not None:
+            self._count("getmtime", True)
+            return self._stats[path].st_mtime
+
+        self._count("getmtime", False)
+
+        stat_ = os.stat(path)
+        self._stats[path] = stat_
+
+        return stat_.st_mtime
+
+    def listdir(self, path):
+        """
+        Get the names in the given directory.
+
+        :type path: str
+        :rtype: list[str]
+        """
+        if path in self._listings:
+            self._count("listdir", True)
+            return list(self._listings[path])
+
+        self._count("listdir", False)
+
+        names = os.listdir(path)
+        self._listings[path] = dict((name, None) for name in names)
+
+        return names
+
+
+def current():
+    """
+    Get the stat cache that is active for the current thread.
+
+    :rtype: StatCache or None
+    """
+    return getattr(_local, "cache", None)
+
+
+def stat(path):
+    """
+    Get the stat for the given path using the active stat cache.
+
+    :type path: str
+    :rtype: os.stat_result or None
+    """
+    cache = current()
+
+    if cache:
+        return cache.stat(path)
+
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def exists(path):
+    """
+    Check if the given path exists using the active stat cache.
+
+    :type path: str
+    :rtype: bool
+    """
+    cache = current()
+    return cache.exists(path) if cache else os.path.exists(path)
+
+
+def isdir(path):
+    """
+    Check if the given path is a directory using the active stat cache.
+
+    :type path: str
+    :rtype: bool
+    """
+    cache = current()
+    return cache.isdir(path) if cache else os.path.isdir(path)
+
+
+def getmtime(path):
+    """
+    Get the modified time for the given path using the active stat cache.
+
+    :type path: str
+    :rtype: float
+    """
+    cache = current()
+    return cache.getmtime(path) if cache else os.path.getmtime(path)
+
+
+def listdir(path):
+    """
+    Get the names in the given directory using the active stat cache.
+
+    :type path: str
+    :rtype: list[str]
+    """
+    cache = current()
+    return cache.listdir(path) if cache else os.listdir(path)
+
+
+def testsuite():
+
+    import shutil
+    import tempfile
+
+    root = tempfile.mkdtemp().replace("\\", "/")
+
+    try:
+        os.makedirs(root + "/a/v001")
+        os.makedirs(root + "/a/v002")
+
+        cache = StatCache()
+        cache.addStat(root + "/a", os.stat(root + "/a"))
+        cache.addListing(root + "/a", [("v001", True), ("v002", True)])
+
+        with cache.activate():
+            assert current() is cache
+            assert sorted(listdir(root + "/a")) == ["v001", "v002"]
+            assert exists(root + "/a/v002")
+            assert not exists(root + "/a/v003")
+            assert not exists(root + "/a/.studiolibrary/metadata.json")
+            assert isdir(root + "/a/v001")
+            assert getmtime(root + "/a") == os.path.getmtime(root + "/a")
+
+            # Unknown paths fall back to the file system
+            assert exists(root)
+
+        assert current() is None
+
+        counters = cache.counters()
+        assert counters["avoided"] == 6, counters
+        assert counters["calls"] == 1, counters
+
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,151 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import collections
+
+import studiolibrary.statcache
+
+
+__all__ = [
+    "SyncWorker",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class SyncWorker(threading.Thread):
+
+    def __init__(self, library, snapshot, cache, metadataIndex=None):
+        """
+        Walk the library in a thread and queue the item data.
+
+        The worker only reads from disc. The library takes the queued
+        item data on the main thread to merge and save it, see
+        Library.startSync.
+
+        :type library: studiolibrary.Library
+        :type snapshot: studiolibrary.snapshot.Snapshot
+        :type cache: dict
+        :type metadataIndex: studiolibrary.metadataindex.MetadataIndex or None
+        """
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+
+        self._cache = cache
+        self._error = None
+        self._count = 0
+        self._queue = collections.deque()
+        self._library = library
+        self._snapshot = snapshot
+        self._metadataIndex = metadataIndex
+        self._statCache = studiolibrary.statcache.StatCache()
+        self._cancelled = False
+
+    def snapshot(self):
+        """
+        Get the snapshot being updated by the worker.
+
+        :rtype: studiolibrary.snapshot.Snapshot
+        """
+        return self._snapshot
+
+    def metadataIndex(self):
+        """
+        Get the metadata index being updated by the worker.
+
+        :rtype: studiolibrary.metadataindex.MetadataIndex or None
+        """
+        return self._metadataIndex
+
+    def statCache(self):
+        """
+        Get the stat cache used by the worker.
+
+        :rtype: studiolibrary.statcache.StatCache
+        """
+        return self._statCache
+
+    def count(self):
+        """
+        Get the number of items found so far.
+
+        :rtype: int
+        """
+        return self._count
+
+    def error(self):
+        """
+        Get the error raised by the worker if it failed.
+
+        :rtype: Exception or None
+        """
+        return self._error
+
+    def cancel(self):
+        """
+        Stop the worker after the current directory has been listed.
+
+        :rtype: None
+        """
+        self._cancelled = True
+
+    def isCancelled(self):
+        """
+        Check if the worker has been cancelled.
+
+        :rtype: bool
+        """
+        return self._cancelled
+
+    def takeItems(self):
+        """
+        Remove and return the item data queued since the last call.
+
+        :rtype: list[dict]
+        """
+        items = []
+
+        while self._queue:
+            items.append(self._queue.popleft())
+
+        return items
+
+    def run(self):
+        """
+        Overriding this method to walk the library in the thread.
+
+        :rtype: None
+        """
+        try:
+            walker = self._library.walker(
+                self._library.path(),
+                snapshot=self._snapshot,
+                cache=self._cache,
+                statCache=self._statCache,
+                isCancelled=self.isCancelled,
+                metadataIndex=self._metadataIndex,
+            )
+
+            for itemData in walker:
+                if self._cancelled:
+                    walker.close()
+                    break
+
+                self._queue.append(itemData)
+                self._count += 1
+
+        except Exception as error:
+            logger.exception("Cannot sync the library")
+            self._error = error
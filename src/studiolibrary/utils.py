@@ -22,6 +22,7 @@ import locale
 import logging
 import getpass
 import random
+import string
 import tempfile
 import platform
 import threading
@@ -44,6 +45,7 @@ except ImportError:
     from os import walk
 
 import studiolibrary
+import studiolibrary.statcache
 
 from studiovendor import six
 from studiovendor.six.moves import urllib
@@ -66,6 +68,7 @@ __all__ = [
     "update",
     "saveJson",
     "readJson",
+    "silentRemove",
     "updateJson",
     "replaceJson",
     "readSettings",
@@ -87,6 +90,8 @@ __all__ = [
     "removePath",
     "renamePath",
     "formatPath",
+    "formatLabels",
+    "PathTemplate",
     "pathsFromUrls",
     "resolveModule",
     "createTempPath",
@@ -101,13 +106,23 @@ __all__ = [
     "showInFolder",
     "stringToList",
     "listToString",
+    "naturalSortKey",
     "registerItem",
     "registerItems",
     "registeredItems",
+    "itemClassIndex",
+    "itemClassFromPath",
+    "itemFromPath",
+    "ItemClassIndex",
     "runTests",
     "findItemsInFolders",
     "isVersionPath",
     "latestVersionPath",
+    "readMetadata",
+    "readMetadataRecord",
+    "createItemData",
+    "createItemDataFromArgs",
+    "isItemDataOverridden",
 ]
 
 
@@ -115,6 +130,14 @@ logger = logging.getLogger(__name__)
 
 
 _itemClasses = collections.OrderedDict()
+_itemClassIndex = None
+
+_formatLabels = None
+_formatLabelsVersion = None
+_pathTemplates = {}
+
+# Splits text into the parts with and without digits for natural sorting
+_naturalSortRegex = re.compile(r"([0-9]+)")
 
 
 class PathError(IOError):
@@ -138,6 +161,102 @@ class PathError(IOError):
         return six.text_type(self._msg)
 
 
+class ItemClassIndex(object):
+
+    def __init__(self, classes):
+        """
+        Index the given item classes by extension for matching paths.
+
+        Classes that only use EXTENSION or EXTENSIONS are found with a
+        dict lookup. Classes that override the match method are tried
+        for every path. The candidates are ordered by SYNC_ORDER.
+
+        :type classes: list[studiolibrary.LibraryItem.__class__]
+        """
+        self._classes = list(classes)
+        self._extensions = {}
+        self._fallback = []
+
+        candidates = []
+
+        for i, cls in enumerate(self._classes):
+            key = (cls.SYNC_ORDER, i)
+
+            extensions = cls.EXTENSIONS
+            if not extensions and cls.EXTENSION:
+                extensions = [cls.EXTENSION]
+
+            overridden = self.isMatchOverridden(cls)
+            indexed = extensions and not overridden and \
+                all(ext.startswith(".") for ext in extensions)
+
+            if indexed:
+                candidates.append((key, cls, extensions))
+            else:
+                self._fallback.append((key, cls, True))
+
+        self._fallback.sort(key=lambda c: c[0])
+
+        # Each extension includes the classes for any shorter extension
+        # that is also a suffix. For example ".tar.gz" includes ".gz".
+        keys = set(ext for c in candidates for ext in c[2])
+
+        for ext in keys:
+            classes = list(self._fallback)
+
+            for key, cls, extensions in candidates:
+                if any(ext.endswith(ext_) for ext_ in extensions):
+                    classes.append((key, cls, False))
+
+            classes.sort(key=lambda c: c[0])
+            self._extensions[ext] = classes
+
+    @staticmethod
+    def isMatchOverridden(cls):
+        """
+        Check if the given class overrides LibraryItem.match.
+
+        :type cls: studiolibrary.LibraryItem.__class__
+        :rtype: bool
+        """
+        func = getattr(cls.match, "__func__", cls.match)
+        default = studiolibrary.LibraryItem.match
+        return func is not getattr(default, "__func__", default)
+
+    def classes(self):
+        """
+        Get the item classes in the index.
+
+        :rtype: list[studiolibrary.LibraryItem.__class__]
+        """
+        return self._classes
+
+    def match(self, path):
+        """
+        Return the first item class that supports the given path.
+
+        :type path: str
+        :rtype: studiolibrary.LibraryItem.__class__ or None
+        """
+        name = path[path.rfind("/") + 1:]
+        classes = self._fallback
+
+        # Use the longest extension that has been registered
+        i = name.find(".")
+        while i != -1:
+            found = self._extensions.get(name[i:])
+            if found is not None:
+                classes = found
+                break
+            i = name.find(".", i + 1)
+
+        for key, cls, match in classes:
+            if not match or cls.match(path):
+                return cls
+
+        return None
+
+
 class MovePathError(PathError):
     """"""
 
@@ -315,8 +434,9 @@ def registerItem(cls):
     :type cls: studiolibrary.LibraryItem
     :rtype: None
     """
-    global _itemClasses
+    global _itemClasses, _itemClassIndex
     _itemClasses[cls.__name__] = cls
+    _itemClassIndex = None
 
 
 def registeredItems():
@@ -334,8 +454,46 @@ def clearRegisteredItems():
 
     :rtype: None
     """
-    global _itemClasses
+    global _itemClasses, _itemClassIndex
     _itemClasses = collections.OrderedDict()
+    _itemClassIndex = None
+
+
+def itemClassIndex():
+    """
+    Get the extension index for the registered item classes.
+
+    :rtype: ItemClassIndex
+    """
+    global _itemClassIndex
+
+    if _itemClassIndex is None:
+        _itemClassIndex = ItemClassIndex(registeredItems())
+
+    return _itemClassIndex
+
+
+def itemClassFromPath(path):
+    """
+    Return the registered item class that supports the given path.
+
+    :type path: str
+    :rtype: studiolibrary.LibraryItem.__class__ or None
+    """
+    return itemClassIndex().match(normPath(path))
+
+
+def itemFromPath(path, **kwargs):
+    """
+    Return a new item instance for the given path.
+
+    :type path: str
+    :rtype: studiolibrary.LibraryItem or None
+    """
+    cls = itemClassFromPath(path)
+    if cls:
+        return cls(normPath(path), **kwargs)
+    return None
 
 
 def tempPath(*args):
@@ -520,24 +678,103 @@ def localPath(*args):
     return path
 
 
-def formatPath(formatString, path="", **kwargs):
-    """
-    Resolve the given string with the given path and kwargs.
+class PathTemplate(object):
 
-    Example:
-        print formatPath("{dirname}/meta.json", path="C:/hello/world.json")
-        # "C:/hello/meta.json"
+    # The fields that are resolved for each path
+    PATH_FIELDS = ("name", "path", "root", "dirname", "extension")
 
-    :type formatString: str
-    :type path: str
-    :type kwargs: dict
-    :rtype: str
+    def __init__(self, formatString, labels):
+        """
+        A format string with all the fields resolved except the path fields.
+
+        Example:
+            template = PathTemplate("{temp}/{name}{extension}", formatLabels())
+            print(template.format("C:/hello/world.json"))
+            # "C:/Temp/world.json"
+
+        :type formatString: str
+        :type labels: dict
+        """
+        self._parts = []
+        self._fields = []
+
+        formatter = string.Formatter()
+        formatString = six.text_type(formatString)
+
+        for literal, field, spec, conversion in formatter.parse(formatString):
+            self._addLiteral(literal)
+
+            if field is None:
+                continue
+
+            if field in self.PATH_FIELDS and not spec and not conversion:
+                self._fields.append(len(self._parts))
+                self._parts.append(field)
+            else:
+                field = "{" + field
+                field += "!" + conversion if conversion else ""
+                field += ":" + spec if spec else ""
+                field += "}"
+                self._addLiteral(formatter.vformat(field, (), labels))
+
+        self._constant = None
+        if not self._fields:
+            self._constant = normPath(u"".join(self._parts))
+
+    def _addLiteral(self, text):
+        """
+        Add the given text and join it with the previous text.
+
+        :type text: str
+        :rtype: None
+        """
+        if not text:
+            return
+
+        if self._parts and len(self._parts) - 1 not in self._fields:
+            self._parts[-1] += text
+        else:
+            self._parts.append(text)
+
+    def format(self, path=""):
+        """
+        Resolve the template for the given path.
+
+        :type path: str
+        :rtype: str
+        """
+        if self._constant is not None:
+            return self._constant
+
+        dirname, name, extension = splitPath(path)
+
+        labels = {
+            "name": name,
+            "path": path,
+            "root": path,  # legacy
+            "dirname": dirname,
+            "extension": extension,
+        }
+
+        parts = list(self._parts)
+        for i in self._fields:
+            parts[i] = labels[parts[i]]
+
+        return normPath(u"".join(parts))
+
+
+def formatLabels():
     """
-    logger.debug("Format String: %s", formatString)
+    Get the labels that don't depend on the path for formatting paths.
 
-    dirname, name, extension = splitPath(path)
+    The labels are created once and created again when the config changes.
+
+    :rtype: dict
+    """
+    global _formatLabels, _formatLabelsVersion, _pathTemplates
 
-    encoding = locale.getpreferredencoding()
+    if _formatLabelsVersion == studiolibrary.config.version():
+        return _formatLabels
 
     # Environment variables return raw strings so we need to convert them to
     # unicode using the preferred system encoding
@@ -555,27 +792,51 @@ def formatPath(formatString, path="", **kwargs):
     if local:
         local = six.text_type(local)
 
-    kwargs.update(os.environ)
+    labels = dict(os.environ)
 
-    labels = {
-        "name": name,
-        "path": path,
-        "root": path,  # legacy
+    labels.update({
         "user": username,
         "temp": temp,
         "home": local,  # legacy
         "local": local,
-        "dirname": dirname,
-        "extension": extension,
-    }
+    })
 
-    kwargs.update(labels)
+    _formatLabels = labels
+    _formatLabelsVersion = studiolibrary.config.version()
+    _pathTemplates = {}
 
-    resolvedString = six.text_type(formatString).format(**kwargs)
+    return _formatLabels
+
+
+def formatPath(formatString, path="", **kwargs):
+    """
+    Resolve the given string with the given path and kwargs.
+
+    The templates are compiled once for each format string so that only
+    the path fields are resolved for each call.
+
+    Example:
+        print formatPath("{dirname}/meta.json", path="C:/hello/world.json")
+        # "C:/hello/meta.json"
+
+    :type formatString: str
+    :type path: str
+    :type kwargs: dict
+    :rtype: str
+    """
+    labels = formatLabels()
 
-    logger.debug("Resolved String: %s", resolvedString)
+    if kwargs:
+        kwargs.update(labels)
+        return PathTemplate(formatString, kwargs).format(path)
 
-    return normPath(resolvedString)
+    template = _pathTemplates.get(formatString)
+
+    if template is None:
+        template = PathTemplate(formatString, labels)
+        _pathTemplates[formatString] = template
+
+    return template.format(path)
 
 
 def copyPath(src, dst, force=False):
@@ -753,11 +1014,15 @@ def renamePath(src, dst, extension=None, force=False):
     return dst
 
 
-def read(path):
+def read(path, absolute=True):
     """
     Return the contents of the given file.
-    
+
+    Set absolute to False to skip replacing the relative paths in the
+    contents with absolute paths.
+
     :type path: str 
+    :type absolute: bool
     :rtype: str 
     """
     data = ""
@@ -767,28 +1032,35 @@ def read(path):
         with open(path) as f:
             data = f.read() or data
 
-    data = absPath(data, path)
+    if absolute:
+        data = absPath(data, path)
 
     return data
 
 
-def write(path, data):
+def write(path, data, relative=True):
     if six.PY2:
-        write2(path, data)
+        write2(path, data, relative=relative)
     else:
-        write3(path, data)
+        write3(path, data, relative=relative)
 
 
-def write2(path, data):
+def write2(path, data, relative=True):
     """
     Write the given data to the given file on disc.
 
+    Set relative to False to skip replacing the absolute paths in the
+    data with relative paths.
+
     :type path: str 
     :type data: str 
+    :type relative: bool
     :rtype: None 
     """
     path = normPath(path)
-    data = relPath(data, path)
+
+    if relative:
+        data = relPath(data, path)
 
     tmp = path + ".tmp"
     bak = path + ".bak"
@@ -838,16 +1110,23 @@ def write2(path, data):
         raise
 
 
-def write3(path, data):
+def write3(path, data, relative=True):
     """
     Writes the given data to a file atomically by first writing to a
     temp file and then renaming it.
 
     This approach avoids using the tempfile module to keep permissions
     consistent with the write2 function.
+
+    :type path: str
+    :type data: str
+    :type relative: bool
+    :rtype: None
     """
     path = normPath(path)
-    data = relPath(data, path)
+
+    if relative:
+        data = relPath(data, path)
 
     dirname = os.path.dirname(path)
     if not os.path.exists(dirname):
@@ -1217,6 +1496,52 @@ def stringToList(data):
     return eval(data)
 
 
+def naturalSortKey(value):
+    """
+    Return a key for sorting values of any type in the way people expect.
+
+    Text is compared without case and the numbers in the text are
+    compared by their value, so "item2" comes before "item10". Values
+    of different types can be compared with each other. Empty values
+    come first, then numbers, then text, and then any other values by
+    their text.
+
+    The key is the order of the type and a value that can be compared
+    with the values of the same type. Text is encoded as one string so
+    that it's as fast to compare as the text itself.
+
+    Example:
+        print(sorted(["item10", "Item2", None, 3], key=naturalSortKey))
+
+        # [None, 3, 'Item2', 'item10']
+
+    :type value: object
+    :rtype: (int, object)
+    """
+    if isinstance(value, six.string_types):
+        if not value:
+            return 0, 0
+
+        parts = _naturalSortRegex.split(value.lower())
+
+        # The numbers are at the odd indexes after splitting. Each one
+        # starts with a character lower than any text and the number of
+        # digits, so that longer numbers come after shorter ones.
+        for i in range(1, len(parts), 2):
+            digits = parts[i].lstrip("0") or "0"
+            parts[i] = "\x01" + six.unichr(48 + len(digits)) + digits
+
+        return 2, "".join(parts)
+
+    elif isinstance(value, (float,) + six.integer_types):
+        return 1, value
+
+    elif not value:
+        return 0, 0
+
+    return 3, six.text_type(value).lower()
+
+
 def isVersionPath(path):
     basename = path.rstrip('/').split('/')[-1]
     if re.match(r'^v\d+$', basename):
@@ -1227,7 +1552,7 @@ def isVersionPath(path):
 def latestVersionPath(path):
     version = ""
 
-    for name in sorted(os.listdir(path), reverse=True):
+    for name in sorted(studiolibrary.statcache.listdir(path), reverse=True):
         if name.startswith("v"):
             version = name
             break
@@ -1236,6 +1561,148 @@ def latestVersionPath(path):
         return "{}/{}".format(path, version)
 
 
+def readMetadata(path, formatString=None):
+    """
+    Read the metadata for the given item path from disc.
+
+    :type path: str
+    :type formatString: str or None
+    :rtype: dict
+    """
+    return readMetadataRecord(path, formatString=formatString)["data"]
+
+
+def readMetadataRecord(path, record=None, formatString=None):
+    """
+    Read the metadata and its mtime for the given item path from disc.
+
+    The metadata file is only read if its mtime is different from the
+    given record. The records are kept between syncs in the metadata
+    index of the library, see studiolibrary.metadataindex.
+
+    Example:
+        print(readMetadataRecord("P:/Library/hello.anim"))
+        # {"mtime": 1600000000.0, "data": {"description": "Hello"}}
+
+    :type path: str
+    :type record: dict or None
+    :type formatString: str or None
+    :rtype: dict
+    """
+    formatString = formatString or studiolibrary.config.get('metadataPath')
+    path = formatPath(formatString, path)
+
+    stat = studiolibrary.statcache.stat(path)
+
+    if stat is None:
+        return {"mtime": None, "data": {}}
+
+    if record and record.get("mtime") == stat.st_mtime:
+        return {"mtime": stat.st_mtime, "data": dict(record.get("data", {}))}
+
+    return {"mtime": stat.st_mtime, "data": readJson(path)}
+
+
+def createItemData(path, className, itemType=None, metadata=None, metadataPath=None):
+    """
+    Create the item data for the given item path without creating the item.
+
+    This only uses the path and the metadata on disc, so it can be called
+    from a worker process. See LibraryItem.createItemData.
+
+    :type path: str
+    :type className: str
+    :type itemType: str or None
+    :type metadata: dict or func or None
+    :type metadataPath: str or None
+    :rtype: dict
+    """
+    itemPath = path
+    path = latestVersionPath(path) or path
+
+    # Read the metadata after listing the item so that a stat cache
+    # can tell if the metadata exists without asking the file system
+    if metadata is None:
+        metadata = readMetadata(itemPath, formatString=metadataPath)
+    elif callable(metadata):
+        metadata = metadata()
+
+    if isVersionPath(path):
+        dirname = os.path.dirname(path)
+        name = os.path.basename(dirname)
+        dirname, basename, extension = splitPath(dirname)
+    else:
+        dirname, basename, extension = splitPath(path)
+        name = os.path.basename(path)
+
+    category = os.path.basename(dirname) or dirname
+    modified = ""
+
+    if studiolibrary.statcache.exists(path):
+        modified = studiolibrary.statcache.getmtime(path)
+
+    itemData = dict(metadata)
+
+    itemData.update({
+        "name": name,
+        "path": path,
+        "type": itemType or extension,
+        "folder": dirname,
+        "category": category,
+        "modified": modified,
+        "__class__": className,
+    })
+
+    return itemData
+
+
+def createItemDataFromArgs(args):
+    """
+    Create the item data and the metadata record for the given arguments.
+
+    The arguments are the path, class name, item type, metadata path and
+    the metadata record from the index. This is used by the process pool
+    in Library.createItemData. It's defined here so that the workers don't
+    need the library module. The path is returned with the results as
+    they are taken from the pool in the order they finish.
+
+    :type args: tuple
+    :rtype: (str, dict, dict)
+    """
+    path, className, itemType, metadataPath, record = args
+
+    record = readMetadataRecord(path, record=record, formatString=metadataPath)
+
+    itemData = createItemData(
+        path,
+        className,
+        itemType=itemType,
+        metadata=record["data"],
+    )
+
+    return path, itemData, record
+
+
+def isItemDataOverridden(cls):
+    """
+    Check if the given class overrides how the item data is created.
+
+    The item data for classes that don't can be created with the
+    createItemData function instead of creating an item.
+
+    :type cls: studiolibrary.LibraryItem.__class__
+    :rtype: bool
+    """
+    for name in ("createItemData", "readMetadata"):
+        func = getattr(cls, name)
+        func = getattr(func, "__func__", func)
+        default = getattr(studiolibrary.LibraryItem, name)
+        if func is not getattr(default, "__func__", default):
+            return True
+
+    return False
+
+
 def listPaths(path):
     """
     Return a list of paths that are in the given directory.
@@ -1626,6 +2093,18 @@ def testFormatPath():
     msg = "Data does not match {} {}".format(expected, result)
     assert expected == result, msg
 
+    result = formatPath("{user}/{name}{{x}}", path="P:/rigs/database.json")
+    expected = user() + "/database{x}"
+
+    msg = "Data does not match {} {}".format(expected, result)
+    assert expected == result, msg
+
+    result = formatPath("{project}/{name}", path="P:/rigs/a.json", project="P:/")
+    expected = "P:/a"
+
+    msg = "Data does not match {} {}".format(expected, result)
+    assert expected == result, msg
+
 
 def testRelativePaths():
     """
@@ -1726,13 +2205,77 @@ def testRelativePaths():
     assert data_ == expected, msg
 
 
+def testItemClassIndex():
+    """
+    Test the item class index returns the same class as calling match.
+    """
+    class AnimItem(studiolibrary.LibraryItem):
+        EXTENSION = ".anim"
+
+    class ArchiveItem(studiolibrary.LibraryItem):
+        SYNC_ORDER = 5
+        EXTENSION = ".tar.gz"
+
+    class ZipItem(studiolibrary.LibraryItem):
+        EXTENSIONS = [".gz", ".zip"]
+
+    class CustomItem(studiolibrary.LibraryItem):
+        SYNC_ORDER = 100
+
+        @classmethod
+        def match(cls, path):
+            return path.endswith("_custom")
+
+    classes = [AnimItem, ArchiveItem, ZipItem, CustomItem]
+    index = ItemClassIndex(classes)
+
+    paths = [
+        "/library/a.anim",
+        "/library/a.b.anim",
+        "/library/a.tar.gz",
+        "/library/a.gz",
+        "/library/a.zip",
+        "/library/a.anim_custom",
+        "/library/a_custom",
+        "/library/a.pose",
+        "/library/folder",
+    ]
+
+    for path in paths:
+        expected = None
+        for cls in sorted(classes, key=lambda c: c.SYNC_ORDER):
+            if cls.match(path):
+                expected = cls
+                break
+
+        result = index.match(path)
+        msg = "Class does not match {} {} {}".format(path, expected, result)
+        assert result is expected, msg
+
+
+def testNaturalSortKey():
+
+    values = ["item10", "Item2", "item2b", "", None, 3, 0.5, True, ["walk"], "10", "a01"]
+    values = sorted(values, key=naturalSortKey)
+
+    assert values[:2] == ["", None]
+    assert values[2:5] == [0.5, True, 3]
+    assert values[5:10] == ["10", "a01", "Item2", "item2b", "item10"]
+    assert values[10] == ["walk"]
+
+    assert naturalSortKey("v002") == naturalSortKey("V2")
+    assert naturalSortKey("frame.1001") > naturalSortKey("frame.999")
+
+
 def runTests():
     """Run all the tests for this file."""
+    testItemClassIndex()
     testUpdate()
     testSplitPath()
     testFormatPath()
     testRelativePaths()
     testNormPath()
+    testNaturalSortKey()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import logging
+
+from studiovendor.Qt import QtCore
+
+
+__all__ = [
+    "DatabaseWatcher",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWatcher(QtCore.QObject):
+
+    # Wait for a burst of changes to finish before emitting changed
+    DELAY = 200
+
+    changed = QtCore.Signal()
+
+    def __init__(self, database, mode="auto", interval=5000, parent=None):
+        """
+        Watch the given database for changes made by other processes.
+
+        The "auto" mode uses file system notifications for changes made
+        on this machine and also checks the database mtime every interval.
+        Network shares accept the watched paths but don't send
+        notifications for changes made on other machines, so those are
+        found by polling. The "poll" mode only checks the database mtime.
+
+        :type database: studiolibrary.database.Database
+        :type mode: str
+        :type interval: int
+        :type parent: QtCore.QObject or None
+        """
+        QtCore.QObject.__init__(self, parent)
+
+        self._mode = mode
+        self._mtime = None
+        self._database = database
+        self._interval = interval
+        self._watcher = None
+
+        self._delayTimer = QtCore.QTimer(self)
+        self._delayTimer.setSingleShot(True)
+        self._delayTimer.setInterval(self.DELAY)
+        self._delayTimer.timeout.connect(self._emitChanged)
+
+        self._pollTimer = QtCore.QTimer(self)
+        self._pollTimer.timeout.connect(self._poll)
+
+    def database(self):
+        """
+        Get the database being watched.
+
+        :rtype: studiolibrary.database.Database
+        """
+        return self._database
+
+    def isPolling(self):
+        """
+        Check if the watcher is polling the database mtime.
+
+        :rtype: bool
+        """
+        return self._pollTimer.isActive()
+
+    def start(self):
+        """
+        Start watching the database.
+
+        :rtype: None
+        """
+        self._mtime = self._database.mtime()
+
+        if self._mode != "poll":
+            self._watcher = QtCore.QFileSystemWatcher(self)
+            self._watcher.fileChanged.connect(self._pathChanged)
+            self._watcher.directoryChanged.connect(self._pathChanged)
+
+            if not self._addPaths():
+                logger.debug("Cannot watch the database. Only polling for changes.")
+
+        if self._interval > 0:
+            self._pollTimer.start(self._interval)
+
+    def stop(self):
+        """
+        Stop watching the database.
+
+        :rtype: None
+        """
+        self._pollTimer.stop()
+        self._delayTimer.stop()
+
+        if self._watcher:
+            self._watcher.deleteLater()
+            self._watcher = None
+
+    def _addPaths(self):
+        """
+        Watch the database files and the directories that contain them.
+
+        Files replaced by an atomic rename are no longer watched, so this
+        is called again after each change.
+
+        :rtype: bool
+        """
+        paths = []
+
+        for path in self._database.watchPaths():
+            if os.path.exists(path):
+                paths.append(path)
+            paths.append(os.path.dirname(path))
+
+        watched = set(self._watcher.files() + self._watcher.directories())
+        paths = [p for p in set(paths) if p not in watched and os.path.exists(p)]
+
+        failed = []
+        for path in paths:
+            if not self._watcher.addPath(path):
+                failed.append(path)
+
+        return bool(watched or len(failed) < len(paths))
+
+    def _pathChanged(self, path):
+        """
+        Triggered when a watched file or directory changes.
+
+        :type path: str
+        :rtype: None
+        """
+        if self._watcher:
+            self._addPaths()
+            self._delayTimer.start()
+
+    def _poll(self):
+        """
+        Triggered by the poll timer to check the database mtime.
+
+        In the "auto" mode this also watches any paths that have been
+        created since, such as the database directory.
+
+        :rtype: None
+        """
+        if self._database.mtime() != self._mtime:
+            if not self._delayTimer.isActive():
+                self._delayTimer.start()
+
+        if self._watcher:
+            self._addPaths()
+
+    def _emitChanged(self):
+        """
+        Emit the changed signal if the database mtime has changed.
+
+        :rtype: None
+        """
+        mtime = self._database.mtime()
+
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self.changed.emit()
@@ -103,10 +103,10 @@ class SearchWidget(QtWidgets.QLineEdit):
         self.search()
 
     def search(self):
-        """Run the search query on the data set."""
+        """Run the search query on the data set in the background."""
         if self.dataset():
             self.dataset().addQuery(self.query())
-            self.dataset().search()
+            self.dataset().startSearch()
         else:
             logger.info("No dataset found the the search widget.")
 
@@ -19,6 +19,8 @@ import studiolibrary
 
 class ProgressBar(QtWidgets.QFrame):
 
+    cancelClicked = QtCore.Signal()
+
     def __init__(self, *args):
         QtWidgets.QFrame.__init__(self, *args)
 
@@ -48,8 +50,26 @@ class ProgressBar(QtWidgets.QFrame):
 
         layout.addWidget(self._progressBar)
 
+        self._cancelButton = QtWidgets.QPushButton(self)
+        self._cancelButton.setToolTip("Cancel")
+        self._cancelButton.setIcon(studiolibrary.resource.icon("cancel"))
+        self._cancelButton.setMaximumSize(QtCore.QSize(17, 17))
+        self._cancelButton.setIconSize(QtCore.QSize(12, 12))
+        self._cancelButton.clicked.connect(self.cancelClicked.emit)
+        self._cancelButton.hide()
+
+        layout.addWidget(self._cancelButton)
+
         self.setLayout(layout)
 
+    def setCancelEnabled(self, enabled):
+        """
+        Show the cancel button for the current progress.
+
+        :type enabled: bool
+        """
+        self._cancelButton.setVisible(enabled)
+
     def reset(self):
         """Reimplementing for convenience"""
         self._progressBar.reset()
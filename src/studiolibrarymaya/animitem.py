@@ -49,7 +49,7 @@ class AnimItem(baseitem.BaseItem):
 
         :rtype: str
         """
-        return self.path() + "/sequence"
+        return self.replicaPath(self.path() + "/sequence")
 
     def loadSchema(self):
         """